@@ -0,0 +1,134 @@
+"""
+webdb.dat 查询延迟基准
+
+在临时目录生成一个结构与网易云 webdb.dat 相同的合成数据库 (historyTracks / web_track / web_user_playlist)，
+对比 "每次查询新建只读连接" 与连接池、按 data_version 缓存后的延迟。
+
+用法:
+    python benchmarks/bench_db.py [--rows 5000] [--iterations 500]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_main():
+    # pymem / uiautomation 仅在 Windows 上可用；main.py 缺少它们时会自动降级
+    spec = importlib.util.spec_from_file_location("main", os.path.join(ROOT, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["main"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE historyTracks (id INTEGER PRIMARY KEY, jsonStr TEXT, playtime INTEGER)")
+    conn.execute("CREATE TABLE web_track (tid INTEGER PRIMARY KEY, track TEXT)")
+    conn.execute("CREATE TABLE web_user_playlist (pid INTEGER PRIMARY KEY, playlist TEXT)")
+    rng = random.Random(42)
+    now = int(time.time() * 1000)
+    for i in range(1, rows + 1):
+        track = {
+            "id": i,
+            "name": f"Song {i}",
+            "duration": rng.randint(120000, 360000),
+            "artists": [{"id": rng.randint(1, 500), "name": f"Artist {rng.randint(1, 500)}"}],
+            "album": {"id": i // 10, "name": f"Album {i // 10}", "picUrl": f"https://p1.music.126.net/{i}.jpg"},
+            "privilege": {"fee": 8, "payed": 0, "maxbr": 999000, "flag": 4}
+        }
+        raw = json.dumps(track, ensure_ascii=False)
+        conn.execute("INSERT INTO historyTracks VALUES (?, ?, ?)", (i, raw, now - (rows - i) * 1000))
+        conn.execute("INSERT INTO web_track VALUES (?, ?)", (i, raw))
+    for i in range(1, 51):
+        conn.execute("INSERT INTO web_user_playlist VALUES (?, ?)", (i, json.dumps({"id": i, "name": f"List {i}", "trackCount": 100})))
+    conn.commit()
+    return conn
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50": samples[len(samples) // 2],
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples)
+    }
+
+
+def per_query_connection(service, sql):
+    # 池化之前的做法：每次查询新建一条只读连接
+    conn = sqlite3.connect(f"file:{quote(service.db_path.replace(os.sep, '/'))}?mode=ro", uri=True, timeout=1)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    main_module = load_main()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "webdb.dat")
+        writer = build_db(db_path, args.rows)
+
+        service = main_module.NeteaseV3Service(
+            title_watcher=main_module.WindowTitleWatcher(main_module.FakeWindowBackend())
+        )
+        service.db_path = db_path
+
+        latest_sql = "SELECT jsonStr FROM historyTracks ORDER BY playtime DESC LIMIT 1"
+        cases = [
+            ("latest track / new connection", lambda: per_query_connection(service, latest_sql)),
+            ("latest track / pooled", lambda: service._read_db_query(latest_sql)),
+            ("history(20) / uncached", lambda: service._load_raw_data("historyTracks", 20, "playtime DESC")),
+            ("history(20) / data_version cache", lambda: service._get_all_raw_data("historyTracks", 20, "playtime DESC")),
+            ("change check / data_version", service.check_db_update),
+        ]
+
+        print(f"rows={args.rows} iterations={args.iterations}")
+        print(f"{'case':40} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+        for name, fn in cases:
+            fn()  # 预热
+            result = measure(fn, args.iterations)
+            print(f"{name:40} {result['p50']:9.3f} {result['p95']:9.3f} {result['mean']:9.3f}")
+
+        # 有新提交时的失效路径：写入一行后第一次读取
+        def write_then_read():
+            writer.execute(
+                "UPDATE historyTracks SET playtime = playtime + 1 WHERE id = ?",
+                (random.randint(1, args.rows),)
+            )
+            writer.commit()
+            service._get_all_raw_data("historyTracks", 20, "playtime DESC")
+
+        result = measure(write_then_read, max(10, args.iterations // 10))
+        print(f"{'history(20) / after commit':40} {result['p50']:9.3f} {result['p95']:9.3f} {result['mean']:9.3f}")
+        print("pool:", service.db_pool.stats())
+
+        # Windows 上删除临时目录前必须关闭所有连接
+        service.db_pool.close()
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+HTTP 服务负载基准
+
+在本机随机端口分别启动 Flask 开发服务器 (app.run 使用的 werkzeug 多线程服务器) 与 waitress (--serve 模式)，
+用多个保持 keep-alive 的客户端并发请求同一组接口，同时挂起若干空闲长连接模拟局域网内常驻的桌面 / 壁纸客户端，
+对比吞吐量与延迟分位数。不启动监控线程，接口返回的是初始状态。
+
+用法:
+    python benchmarks/bench_serve.py [--clients 32] [--idle 64] [--duration 5] [--threads 16]
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["/info", "/lyrics", "/debug/jobs"]
+
+
+def load_main():
+    # pymem / uiautomation 仅在 Windows 上可用；main.py 缺少它们时会自动降级
+    spec = importlib.util.spec_from_file_location("main", os.path.join(ROOT, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["main"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def start_werkzeug(app):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def start_waitress(app, threads, connection_limit):
+    import waitress
+    server = waitress.create_server(
+        app, host="127.0.0.1", port=0, threads=threads, connection_limit=connection_limit
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    return server.effective_port, server.close
+
+
+def open_idle_connections(port, count):
+    """建立 count 条只发一次请求、之后保持空闲的 keep-alive 连接"""
+    sockets = []
+    for _ in range(count):
+        try:
+            s = socket.create_connection(("127.0.0.1", port), timeout=2)
+            s.sendall(b"GET /info HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n")
+            s.recv(65536)
+            sockets.append(s)
+        except OSError:
+            break
+    return sockets
+
+
+def run_load(port, clients, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        session = requests.Session()
+        local = []
+        i = index
+        while time.perf_counter() < deadline:
+            url = f"http://127.0.0.1:{port}{PATHS[i % len(PATHS)]}"
+            i += 1
+            start = time.perf_counter()
+            try:
+                session.get(url, timeout=5).content
+                local.append((time.perf_counter() - start) * 1000)
+            except requests.RequestException:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    if not latencies:
+        return {"rps": 0, "p50": 0, "p95": 0, "p99": 0, "mean": 0, "errors": errors[0]}
+    return {
+        "rps": len(latencies) / duration,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "mean": statistics.fmean(latencies),
+        "errors": errors[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--idle", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--connection-limit", type=int, default=256)
+    args = parser.parse_args()
+
+    # 请求日志与 waitress 的排队告警会干扰计时输出
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+    main_module = load_main()
+    app = main_module.app
+    servers = [("flask dev (app.run)", lambda: start_werkzeug(app))]
+    if main_module.waitress is not None:
+        servers.append((
+            f"waitress threads={args.threads}",
+            lambda: start_waitress(app, args.threads, args.connection_limit)
+        ))
+    else:
+        print("未安装 waitress，只测试开发服务器")
+
+    print(f"clients={args.clients} idle={args.idle} duration={args.duration}s paths={PATHS}")
+    print(f"{'server':28} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, start in servers:
+        port, stop = start()
+        idle = open_idle_connections(port, args.idle)
+        run_load(port, min(args.clients, 4), 0.5)  # 预热
+        result = run_load(port, args.clients, args.duration)
+        print(
+            f"{name:28} {result['rps']:9.0f} {result['p50']:8.2f} {result['p95']:8.2f} "
+            f"{result['p99']:8.2f} {result['errors']:7d}"
+        )
+        for s in idle:
+            s.close()
+        stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 import os
 import json
 import sqlite3
-import pymem
-import pymem.process
 import time
 import requests
 import re
@@ -11,10 +9,73 @@ import ctypes
 import struct
 import math
 import sys
-from flask import Flask, Response, request, send_file, send_from_directory
+import hashlib
+import bisect
+import unicodedata
+import heapq
+import itertools
+import colorsys
+import io
+import gzip
+import mimetypes
+import argparse
+import signal
+from concurrent.futures import Future
+from array import array
+from collections import OrderedDict, deque
+from flask import Flask, Response, request, g
 from flask_cors import CORS
-from urllib.parse import quote
-import uiautomation as auto
+from urllib.parse import quote, urlencode, urlparse
+from contextlib import nullcontext, contextmanager
+from werkzeug.security import safe_join
+
+# Windows 平台依赖：缺失时 (如在 Linux 上调试/测试) 仍可导入本模块，
+# 对应功能通过可替换的 backend 降级
+try:
+    import pymem
+    import pymem.process
+except ImportError:
+    pymem = None
+
+try:
+    import uiautomation as auto
+except ImportError:
+    auto = None
+
+try:
+    import ijson  # 可选：流式解析 playingList，未安装时退回 json.load
+except ImportError:
+    ijson = None
+
+try:
+    from pypinyin import lazy_pinyin, Style  # 可选：本地搜索支持拼音 / 首字母
+except ImportError:
+    lazy_pinyin = None
+
+try:
+    from PIL import Image  # 可选：本地缩放封面、计算配色，未安装时缩放交给 CDN 参数
+except ImportError:
+    Image = None
+
+try:
+    import brotli  # 可选：响应缓存额外生成 br 压缩版本
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack  # 可选：/info?format=msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2  # 可选：/info?format=cbor
+except ImportError:
+    cbor2 = None
+
+try:
+    import waitress  # 可选：--serve 生产模式使用的多线程 WSGI 服务器
+except ImportError:
+    waitress = None
 
 # ===========================
 # 全局状态存储
@@ -40,6 +101,8 @@ API_STATE = {
     "lyrics": {
         "current_line": "", 
         "current_trans": "",
+        "line_index": -1,
+        "word_index": -1,
         "all_lyrics": []     
     },
     "db_info": {},
@@ -53,6 +116,32 @@ API_STATE = {
 
 state_lock = threading.Lock()
 
+# 运行时数据 (歌词 / 封面缓存、检索索引、听歌统计、事件日志) 的存放目录，不写进源码目录
+# 优先级：--data-dir > 环境变量 NETEASE_API_DATA_DIR > 用户数据目录
+def default_data_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "NeteaseLocalAPI")
+
+DATA_DIR = os.environ.get("NETEASE_API_DATA_DIR") or default_data_dir()
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
+
+# API_STATE 的版本号：内容变化时推进，/info 按 (字段投影, 编码, 版本) 复用编码结果
+state_version = 0
+
+def mark_state_changed():
+    """必须在持有 state_lock 时调用"""
+    global state_version
+    state_version += 1
+
+@contextmanager
+def state_write():
+    """写入 API_STATE：持有 state_lock，退出时推进版本号"""
+    with state_lock:
+        yield
+        mark_state_changed()
+
 # ===========================
 # 0. 辅助工具：内存读取与搜索
 # ===========================
@@ -179,6 +268,10 @@ class CloudMusicOffsetResolver:
                 "details": details
             }
 
+    def candidate_count(self):
+        """当前会依次校验的候选布局数 (当前布局 / 手工录入 / 本版本缓存 / 已知布局，去重后)"""
+        return sum(1 for _ in self._iter_candidate_layouts(self.status.get("fingerprint", "")))
+
     def get_status(self):
         with self._lock:
             result = dict(self.status)
@@ -728,53 +821,953 @@ class GuidedOffsetScanner:
         return self.locator.build_fingerprint(self.module)
 
 class WindowUtils:
+    IGNORED_TITLES = ["网易云音乐", "桌面歌词", "精简模式", "Mini模式"]
+
     @staticmethod
-    def get_netease_window_title():
-        """
-        遍历所有窗口，找到真正的网易云音乐播放标题。
-        """
+    def pick_best_title(titles):
+        """从所有 OrpheusBrowserHost 窗口标题中挑出真正的播放标题"""
+        best_title = None
+        for t in titles:
+            if not t or t in WindowUtils.IGNORED_TITLES: continue
+            if " - " in t: return t.strip()
+            best_title = t
+        return best_title
+
+class Win32WindowBackend:
+    """Win32 窗口访问 (EnumWindows / GetWindowTextW / SetWinEventHook)"""
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WINEVENT_SKIPOWNPROCESS = 0x0002
+    OBJID_WINDOW = 0
+    QS_ALLINPUT = 0x04FF
+    PM_REMOVE = 0x0001
+
+    def __init__(self):
+        self._hook = None
+        self._hook_proc = None # 必须持有回调引用，否则会被 GC
+
+    def available(self):
+        return hasattr(ctypes, "windll")
+
+    def find_windows(self, class_name):
         results = []
-        
+        if not self.available(): return results
+        user32 = ctypes.windll.user32
+
         def enum_window_callback(hwnd, _):
-            if not ctypes.windll.user32.IsWindowVisible(hwnd):
+            if not user32.IsWindowVisible(hwnd):
                 return True
             length = 256
             buff = ctypes.create_unicode_buffer(length)
-            ctypes.windll.user32.GetClassNameW(hwnd, buff, length)
-            class_name = buff.value
-            if "OrpheusBrowserHost" in class_name:
-                length = ctypes.windll.user32.GetWindowTextLengthW(hwnd)
-                if length > 0:
-                    buff = ctypes.create_unicode_buffer(length + 1)
-                    ctypes.windll.user32.GetWindowTextW(hwnd, buff, length + 1)
-                    title = buff.value
-                    if title:
-                        results.append(title)
+            user32.GetClassNameW(hwnd, buff, length)
+            if class_name in buff.value:
+                results.append(hwnd)
             return True
 
         WNDENUMPROC = ctypes.WINFUNCTYPE(ctypes.c_bool, ctypes.c_void_p, ctypes.c_void_p)
         try:
-            ctypes.windll.user32.EnumWindows(WNDENUMPROC(enum_window_callback), 0)
+            user32.EnumWindows(WNDENUMPROC(enum_window_callback), 0)
         except: pass
+        return results
 
-        best_title = None
-        for t in results:
-            if t in ["网易云音乐", "桌面歌词", "精简模式", "Mini模式"]: continue
-            if " - " in t: return t.strip()
-            best_title = t
-        return best_title
+    def is_window(self, hwnd):
+        return bool(ctypes.windll.user32.IsWindow(hwnd))
+
+    def get_window_text(self, hwnd):
+        user32 = ctypes.windll.user32
+        length = user32.GetWindowTextLengthW(hwnd)
+        if length <= 0:
+            return ""
+        buff = ctypes.create_unicode_buffer(length + 1)
+        user32.GetWindowTextW(hwnd, buff, length + 1)
+        return buff.value
+
+    def install_hook(self, callback):
+        """注册窗口标题变化事件 callback(hwnd)，需在调用 pump_events 的同一线程中安装"""
+        if not self.available(): return False
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        WinEventProc = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+        )
+
+        def handler(hook, event, hwnd, id_object, id_child, thread_id, event_time):
+            if id_object == self.OBJID_WINDOW and hwnd:
+                callback(hwnd)
+
+        self._hook_proc = WinEventProc(handler)
+        user32.SetWinEventHook.restype = wintypes.HANDLE
+        self._hook = user32.SetWinEventHook(
+            self.EVENT_OBJECT_NAMECHANGE, self.EVENT_OBJECT_NAMECHANGE,
+            0, self._hook_proc, 0, 0,
+            self.WINEVENT_OUTOFCONTEXT | self.WINEVENT_SKIPOWNPROCESS
+        )
+        return bool(self._hook)
+
+    def pump_events(self, timeout):
+        """处理本线程的消息队列 (WinEvent 回调在这里被派发)"""
+        from ctypes import wintypes
+        user32 = ctypes.windll.user32
+        msg = wintypes.MSG()
+        user32.MsgWaitForMultipleObjects(0, None, False, int(timeout * 1000), self.QS_ALLINPUT)
+        while user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, self.PM_REMOVE):
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+
+    def remove_hook(self):
+        if self._hook:
+            ctypes.windll.user32.UnhookWinEvent(self._hook)
+        self._hook = None
+        self._hook_proc = None
+
+class FakeWindowBackend:
+    """测试用窗口后端：手动增删窗口、修改标题并触发事件"""
+    def __init__(self):
+        self.windows = {}
+        self.enum_count = 0
+        self._callback = None
+        self._pump_event = threading.Event()
+
+    def available(self):
+        return True
+
+    def add_window(self, hwnd, title, class_name="OrpheusBrowserHost"):
+        self.windows[hwnd] = {"class": class_name, "title": title}
+
+    def set_title(self, hwnd, title):
+        self.windows[hwnd]["title"] = title
+        if self._callback:
+            self._callback(hwnd)
+
+    def close_window(self, hwnd):
+        self.windows.pop(hwnd, None)
+
+    def find_windows(self, class_name):
+        self.enum_count += 1
+        return [h for h, w in self.windows.items() if class_name in w["class"]]
+
+    def is_window(self, hwnd):
+        return hwnd in self.windows
+
+    def get_window_text(self, hwnd):
+        window = self.windows.get(hwnd)
+        return window["title"] if window else ""
+
+    def install_hook(self, callback):
+        self._callback = callback
+        return True
+
+    def pump_events(self, timeout):
+        self._pump_event.wait(timeout)
+
+    def remove_hook(self):
+        self._callback = None
+
+class WindowTitleWatcher:
+    """
+    网易云窗口标题监视器
+    记住 OrpheusBrowserHost 的窗口句柄，之后只对这些句柄调用 GetWindowTextW；
+    句柄失效 (或定期发现新窗口) 时才重新 EnumWindows。
+    有 WinEvent 钩子时标题变化会即时推送，否则退回低频轮询。
+    """
+    CLASS_NAME = "OrpheusBrowserHost"
+    REENUM_INTERVAL = 30.0       # 定期重新枚举，发现新打开的迷你模式/桌面歌词窗口
+    MISSING_REENUM_INTERVAL = 1.0
+    POLL_INTERVAL = 0.5
+    HOOKED_POLL_INTERVAL = 2.0   # 有事件推送时，轮询只用于检测句柄失效
+    PUMP_TIMEOUT = 0.2
+
+    def __init__(self, backend=None):
+        self.backend = backend or Win32WindowBackend()
+        self.hwnds = []
+        self.last_enum = 0.0
+        self.current_title = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_listener(self, callback):
+        """注册标题变化回调 callback(new_title, old_title)"""
+        self._listeners.append(callback)
+
+    def _handles(self):
+        now = time.time()
+        if self.hwnds:
+            stale = now - self.last_enum > self.REENUM_INTERVAL
+            dead = not all(self.backend.is_window(h) for h in self.hwnds)
+        else:
+            stale = now - self.last_enum > self.MISSING_REENUM_INTERVAL
+            dead = False
+        if stale or dead:
+            self.hwnds = self.backend.find_windows(self.CLASS_NAME)
+            self.last_enum = now
+        return self.hwnds
+
+    def read_title(self):
+        """只读取已缓存句柄的标题"""
+        with self._lock:
+            titles = [self.backend.get_window_text(h) for h in self._handles()]
+        return WindowUtils.pick_best_title(titles)
+
+    def refresh(self):
+        title = self.read_title()
+        if title != self.current_title:
+            old_title = self.current_title
+            self.current_title = title
+            for callback in list(self._listeners):
+                try: callback(title, old_title)
+                except Exception as e: print(f"[TitleWatcher] 回调异常: {e}")
+        return title
+
+    def get_title(self):
+        """watcher 运行中直接返回推送来的最新标题，否则同步读取一次"""
+        if self._thread and self._thread.is_alive():
+            return self.current_title
+        return self.refresh()
+
+    def _on_window_event(self, hwnd):
+        if hwnd in self.hwnds:
+            self.refresh()
+
+    def _watch(self):
+        hooked = False
+        try:
+            hooked = self.backend.install_hook(self._on_window_event)
+        except Exception as e:
+            print(f"[TitleWatcher] 注册 WinEvent 钩子失败，改用轮询: {e}")
+
+        interval = self.HOOKED_POLL_INTERVAL if hooked else self.POLL_INTERVAL
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"[TitleWatcher] 读取标题失败: {e}")
+
+                if not hooked:
+                    self._stop_event.wait(interval)
+                    continue
+                deadline = time.time() + interval
+                while not self._stop_event.is_set() and time.time() < deadline:
+                    self.backend.pump_events(self.PUMP_TIMEOUT)
+        finally:
+            if hooked:
+                self.backend.remove_hook()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        if not self.backend.available():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="window-title-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+# ===========================
+# 0.4 上游 HTTP 客户端与后台任务执行器
+# ===========================
+class UpstreamError(Exception):
+    pass
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开；冷却结束进入半开，只放行一个试探请求"""
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+class _InflightCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class UpstreamClient:
+    """
+    统一的上游 HTTP 客户端 (music.163.com 及封面 CDN)
+    - 共享 requests.Session，keep-alive 连接池
+    - 按端点限制并发
+    - single-flight：相同请求同时只发出一次，其余调用等待同一结果
+    - 响应缓存 (TTL) 与负缓存
+    - 按主机熔断：上游不可用时快速失败
+    """
+    BASE_URL = "http://music.163.com"
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Referer': 'http://music.163.com/'
+    }
+    ENDPOINT_LIMITS = {"search": 2, "detail": 4, "lyric": 4, "cover": 4}
+    DEFAULT_LIMIT = 4
+    POOL_SIZE = 8
+    CACHE_SIZE = 512
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, base_url=None, pool_size=None):
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.session = requests.Session()
+        self.session.headers.update(self.HEADERS)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size or self.POOL_SIZE,
+            pool_maxsize=pool_size or self.POOL_SIZE
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._cache = OrderedDict()
+        self._semaphores = {}
+        self._breakers = {}
+        self.counters = {
+            "requests": 0,
+            "cache_hits": 0,
+            "negative_hits": 0,
+            "coalesced": 0,
+            "failures": 0,
+            "short_circuited": 0
+        }
+
+    @classmethod
+    def default(cls):
+        """进程内共享的默认客户端"""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _semaphore(self, endpoint):
+        with self._lock:
+            sem = self._semaphores.get(endpoint)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.ENDPOINT_LIMITS.get(endpoint, self.DEFAULT_LIMIT))
+                self._semaphores[endpoint] = sem
+            return sem
+
+    def _breaker(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker()
+                self._breakers[host] = breaker
+            return breaker
+
+    def _cache_get(self, key):
+        """返回 (命中, 值)；值为 None 表示负缓存"""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if time.time() >= expires_at:
+                self._cache.pop(key, None)
+                return False, None
+            self._cache.move_to_end(key)
+            return True, value
+
+    def _cache_put(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (time.time() + ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _build_url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}{path}"
+
+    def _single_flight(self, key, fn, timeout):
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            if not call.event.wait(timeout + 1):
+                raise UpstreamError("等待合并请求超时")
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e if isinstance(e, UpstreamError) else UpstreamError(str(e))
+            raise call.error
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def _send(self, endpoint, method, url, params, data, timeout, parse):
+        # 先占并发名额再问熔断器：半开状态放行的试探请求一定会真正发出，
+        # 并以 record_success / record_failure 结束，不会卡在 half_open
+        sem = self._semaphore(endpoint)
+        if not sem.acquire(timeout=timeout):
+            raise UpstreamError(f"{endpoint} 并发已满")
+        breaker = self._breaker(url)
+        if not breaker.allow():
+            sem.release()
+            self._count("short_circuited")
+            raise CircuitOpenError(f"上游 {urlparse(url).netloc} 熔断中")
+        try:
+            self._count("requests")
+            resp = self.session.request(method, url, params=params, data=data, timeout=timeout)
+            if resp.status_code >= 500:
+                raise UpstreamError(f"HTTP {resp.status_code}")
+            result = parse(resp)
+        except Exception as e:
+            self._count("failures")
+            breaker.record_failure()
+            if isinstance(e, UpstreamError):
+                raise
+            raise UpstreamError(str(e)) from e
+        finally:
+            sem.release()
+        breaker.record_success()
+        return result
+
+    def request_json(self, endpoint, path, method="GET", params=None, data=None, timeout=5,
+                     cache_ttl=0, negative_ttl=0, validate=None):
+        """
+        请求 JSON 接口
+        validate(data) 为假时视为“上游明确没有结果”，按 negative_ttl 负缓存并返回 None；
+        网络错误/熔断抛出 UpstreamError
+        """
+        url = self._build_url(path)
+        key = (method, url, urlencode(sorted((params or {}).items())), urlencode(sorted((data or {}).items())))
+        hit, value = self._cache_get(key)
+        if hit:
+            self._count("cache_hits" if value is not None else "negative_hits")
+            return value
+
+        def parse(resp):
+            if resp.status_code != 200:
+                return None
+            try:
+                return resp.json()
+            except ValueError:
+                return None
+
+        def fetch():
+            result = self._send(endpoint, method, url, params, data, timeout, parse)
+            if result is not None and (validate is None or validate(result)):
+                self._cache_put(key, result, cache_ttl)
+                return result
+            self._cache_put(key, None, negative_ttl)
+            return None
+
+        return self._single_flight(key, fetch, timeout)
+
+    def request_bytes(self, endpoint, url, timeout=5):
+        """下载二进制内容 (封面等)，非 200 返回 None"""
+        url = self._build_url(url)
+
+        def parse(resp):
+            if resp.status_code != 200 or not resp.content:
+                return None
+            return resp.content
+
+        return self._single_flight(("GET", url), lambda: self._send(endpoint, "GET", url, None, None, timeout, parse), timeout)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self.counters)
+            result["cache_entries"] = len(self._cache)
+            result["inflight"] = len(self._inflight)
+            breakers = dict(self._breakers)
+        result["breakers"] = {host: b.snapshot() for host, b in breakers.items()}
+        return result
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """执行器中的一个任务；future 可用于等待结果"""
+    def __init__(self, executor, fn, args, kwargs, key, group, generation, priority):
+        self.executor = executor
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.group = group
+        self.generation = generation
+        self.priority = priority
+        self.submitted_at = time.time()
+        self.future = Future()
+
+    def cancelled(self):
+        """所属分组已进入新的代数 (例如已经切歌)，任务应尽早放弃"""
+        return self.group is not None and self.executor.generation(self.group) != self.generation
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+class JobExecutor:
+    """
+    有界的优先级后台任务执行器 (歌词 / 详情 / 搜索 / 预取)
+    - 固定数量的工作线程，priority 数值越小越先执行
+    - key 去重：同一 key 已在排队或执行中时，直接返回已有任务
+    - 分组代数：bump(group) 后，该组排队中的旧任务出队即丢弃
+    """
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 5
+    PRIORITY_LOW = 10
+    WORKERS = 4
+    LATENCY_SAMPLES = 200
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, workers=None, name="jobs"):
+        self.workers = workers or self.WORKERS
+        self.name = name
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = {}        # key -> Job (排队或执行中)
+        self._generations = {}
+        self._threads = []
+        self._running = 0
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "deduped": 0}
+        self._latency = {}       # group -> deque[(排队耗时, 执行耗时)]
+
+    @classmethod
+    def default(cls):
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def generation(self, group):
+        return self._generations.get(group, 0)
+
+    def bump(self, group):
+        """进入新的代数，使该组所有旧任务失效，返回新代数"""
+        with self._cond:
+            self._generations[group] = self._generations.get(group, 0) + 1
+            return self._generations[group]
+
+    def is_pending(self, key):
+        with self._cond:
+            return key in self._active
+
+    def submit(self, fn, *args, key=None, group=None, priority=PRIORITY_NORMAL, **kwargs):
+        with self._cond:
+            if key is not None:
+                existing = self._active.get(key)
+                if existing is not None and not existing.cancelled():
+                    self.counters["deduped"] += 1
+                    return existing
+            job = Job(self, fn, args, kwargs, key, group, self.generation(group), priority)
+            if key is not None:
+                self._active[key] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job))
+            self.counters["submitted"] += 1
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def run(self, fn, *args, key=None, group=None, priority=PRIORITY_HIGH, timeout=None, **kwargs):
+        """提交并等待结果；超时或被取消时返回 None"""
+        job = self.submit(fn, *args, key=key, group=group, priority=priority, **kwargs)
+        try:
+            return job.result(timeout)
+        except Exception:
+            return None
+
+    def _ensure_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _finish(self, job):
+        with self._cond:
+            if job.key is not None and self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                if job.cancelled():
+                    self.counters["cancelled"] += 1
+                    if job.key is not None and self._active.get(job.key) is job:
+                        del self._active[job.key]
+                    job.future.set_exception(JobCancelled())
+                    continue
+                self._running += 1
+
+            started = time.time()
+            try:
+                job.future.set_result(job.fn(*job.args, **job.kwargs))
+                outcome = "completed"
+            except Exception as e:
+                job.future.set_exception(e)
+                outcome = "failed"
+                print(f"[Jobs] 任务异常 ({job.group or job.key}): {e}")
+            finished = time.time()
+
+            self._finish(job)
+            with self._cond:
+                self._running -= 1
+                self.counters[outcome] += 1
+                samples = self._latency.setdefault(job.group or "default", deque(maxlen=self.LATENCY_SAMPLES))
+                samples.append((started - job.submitted_at, finished - started))
+
+    @staticmethod
+    def _percentile(values, pct):
+        if not values: return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def stats(self):
+        with self._cond:
+            result = dict(self.counters)
+            result["queue_depth"] = len(self._heap)
+            result["running"] = self._running
+            result["workers"] = self.workers
+            latency = {group: list(samples) for group, samples in self._latency.items()}
+        result["latency_ms"] = {
+            group: {
+                "samples": len(samples),
+                "wait_p50": round(self._percentile([w for w, _ in samples], 0.5) * 1000, 2),
+                "wait_p95": round(self._percentile([w for w, _ in samples], 0.95) * 1000, 2),
+                "run_p50": round(self._percentile([r for _, r in samples], 0.5) * 1000, 2),
+                "run_p95": round(self._percentile([r for _, r in samples], 0.95) * 1000, 2)
+            }
+            for group, samples in latency.items()
+        }
+        return result
+
+class Metrics:
+    """
+    进程内指标：计数器、仪表与固定桶直方图 (单位：秒)，导出为 JSON 与 Prometheus 文本格式
+    记录一次直方图只是一次 bisect 加几次整数运算；已有的 stats() 通过采集函数在导出时读取。
+    """
+    BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    PREFIX = "netease_"
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}     # (name, labels) -> 值
+        self._gauges = {}
+        self._histograms = {}   # (name, labels) -> [各桶计数..., +Inf 桶, 总和, 次数]
+        self._collectors = []
+
+    @classmethod
+    def default(cls):
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.BUCKETS) + 1) + [0.0, 0]
+            hist[index] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def lap(self, name, started, **labels):
+        """记录从 started 到现在的耗时，返回现在的时间 (用于串联多个阶段)"""
+        now = time.perf_counter()
+        self.observe(name, now - started, **labels)
+        return now
+
+    def register_collector(self, fn):
+        """fn() 返回 [(名称, "counter"|"gauge", 标签 dict, 值)]，导出时调用"""
+        self._collectors.append(fn)
+
+    def _collect(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        for fn in self._collectors:
+            try:
+                for name, kind, labels, value in fn():
+                    target = counters if kind == "counter" else gauges
+                    target[self._key(name, labels)] = value
+            except Exception as e:
+                print(f"[Metrics] 采集失败: {e}")
+        return counters, gauges, histograms
+
+    def _quantile(self, hist, q):
+        """按桶估算分位数 (取所在桶的上界)"""
+        total = hist[-1]
+        if not total: return 0.0
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(hist[:-2]):
+            cumulative += count
+            if cumulative >= rank:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else self.BUCKETS[-1]
+        return self.BUCKETS[-1]
+
+    def snapshot(self):
+        counters, gauges, histograms = self._collect()
+
+        def group(items, render):
+            result = {}
+            for (name, labels), value in sorted(items.items(), key=lambda kv: (kv[0][0], kv[0][1])):
+                result.setdefault(name, []).append({"labels": dict(labels), **render(value)})
+            return result
+
+        return {
+            "counters": group(counters, lambda v: {"value": v}),
+            "gauges": group(gauges, lambda v: {"value": v}),
+            "histograms": group(histograms, lambda h: {
+                "count": h[-1],
+                "sum_ms": round(h[-2] * 1000, 3),
+                "mean_ms": round(h[-2] / h[-1] * 1000, 3) if h[-1] else 0.0,
+                "p50_ms": round(self._quantile(h, 0.5) * 1000, 3),
+                "p95_ms": round(self._quantile(h, 0.95) * 1000, 3),
+                "p99_ms": round(self._quantile(h, 0.99) * 1000, 3)
+            })
+        }
+
+    @staticmethod
+    def _labels_text(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs: return ""
+        escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+    def prometheus(self):
+        """Prometheus 文本格式 (0.0.4)"""
+        counters, gauges, histograms = self._collect()
+        lines = []
+        for kind, items in (("counter", counters), ("gauge", gauges)):
+            declared = set()
+            for (name, labels), value in sorted(items.items(), key=lambda kv: (kv[0][0], kv[0][1])):
+                full = self.PREFIX + name
+                if full not in declared:
+                    lines.append(f"# TYPE {full} {kind}")
+                    declared.add(full)
+                lines.append(f"{full}{self._labels_text(labels)} {value}")
+        declared = set()
+        for (name, labels), hist in sorted(histograms.items(), key=lambda kv: (kv[0][0], kv[0][1])):
+            full = self.PREFIX + name
+            if full not in declared:
+                lines.append(f"# TYPE {full} histogram")
+                declared.add(full)
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS + (float('inf'),), hist[:-2]):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{full}_bucket{self._labels_text(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{full}_sum{self._labels_text(labels)} {hist[-2]}")
+            lines.append(f"{full}_count{self._labels_text(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+class SongChangeTracer:
+    """
+    切歌链路的分段追踪：内存检测到新 ID -> 元数据解析 / 发布 -> 歌词获取 / 解析 / 发布 -> 监控循环写入 /info
+    每次切歌是一条 trace (以 song_id 区分)，各阶段记为 span 存入有界环形缓冲；
+    元数据与歌词都已发布、且监控循环完成一次写入后，记录端到端的 song_change 并结束 trace。
+    未在追踪中的歌曲 (例如预取) 调用 span / mark 时直接跳过。
+    """
+    SPAN_LIMIT = 4096
+    TRACE_LIMIT = 32        # 同时进行中的 trace 上限
+    TIMEOUT = 30.0          # 超时未完成 (如歌词获取失败) 的 trace 记为 abandoned
+    MILESTONES = ("metadata", "lyrics")
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, span_limit=None):
+        self._spans = deque(maxlen=span_limit or self.SPAN_LIMIT)
+        self._active = OrderedDict()    # song_id -> {"id", "start", "done"}
+        self._threads = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.metrics = {"started": 0, "completed": 0, "abandoned": 0}
+
+    @classmethod
+    def default(cls):
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def begin(self, song_id, started=None, **args):
+        """开始一条 trace；started 为检测到新 ID 的那个 tick 的起点 (perf_counter)"""
+        if not song_id: return
+        now = time.perf_counter()
+        started = started or now
+        with self._lock:
+            self._expire(now)
+            self._active.pop(song_id, None)
+            self._active[song_id] = {"id": next(self._ids), "start": started, "done": set()}
+            while len(self._active) > self.TRACE_LIMIT:
+                self._active.popitem(last=False)
+                self.metrics["abandoned"] += 1
+            self.metrics["started"] += 1
+        self.record(song_id, "id_detected", started, now, **args)
+
+    def _expire(self, now):
+        for song_id, trace in list(self._active.items()):
+            if now - trace["start"] > self.TIMEOUT:
+                del self._active[song_id]
+                self.metrics["abandoned"] += 1
+
+    def record(self, song_id, name, start, end=None, **args):
+        trace = self._active.get(song_id)
+        if trace is None: return
+        end = end or time.perf_counter()
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+            self._spans.append((name, trace["id"], song_id, start, end - start, thread.ident, args))
+
+    @contextmanager
+    def span(self, song_id, name, **args):
+        if song_id not in self._active:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(song_id, name, start, **args)
+
+    def mark(self, song_id, milestone):
+        trace = self._active.get(song_id)
+        if trace is not None: trace["done"].add(milestone)
+
+    def published(self, song_id, started):
+        """监控循环每个 tick 写入状态后调用；元数据与歌词都已发布时结束 trace"""
+        trace = self._active.get(song_id)
+        if trace is None or not trace["done"].issuperset(self.MILESTONES): return
+        now = time.perf_counter()
+        self.record(song_id, "state_published", started, now)
+        self.record(song_id, "song_change", trace["start"], now)
+        with self._lock:
+            if self._active.get(song_id) is trace:
+                del self._active[song_id]
+                self.metrics["completed"] += 1
+
+    def chrome_trace(self):
+        """Chrome trace-event JSON (chrome://tracing / Perfetto 可直接打开)"""
+        with self._lock:
+            spans = list(self._spans)
+            threads = dict(self._threads)
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        for name, trace_id, song_id, start, duration, tid, args in spans:
+            events.append({
+                "name": name, "cat": "song_change", "ph": "X", "pid": 1, "tid": tid,
+                "ts": round(start * 1e6, 1), "dur": round(duration * 1e6, 1),
+                "args": {"trace": trace_id, "song_id": song_id, **args}
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self):
+        """各阶段耗时 p50 / p95 (毫秒)，song_change 为端到端耗时"""
+        with self._lock:
+            spans = list(self._spans)
+        durations = {}
+        for name, _, _, _, duration, _, _ in spans:
+            durations.setdefault(name, []).append(duration * 1000)
+        result = {}
+        for name, values in durations.items():
+            values.sort()
+            result[name] = {
+                "count": len(values),
+                "p50": round(values[len(values) // 2], 3),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                "max": round(values[-1], 3)
+            }
+        return result
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.perf_counter())
+            result = dict(self.metrics)
+            result.update({"active": len(self._active), "spans": len(self._spans)})
+        return result
 
 class SearchService:
     @staticmethod
-    def search_song_by_title(title_str, duration_sec):
-        if not title_str: return None
-        
-        target_song_name = ""
-        target_artists = []
-        
+    def parse_title(title_str):
+        """窗口标题 -> (歌名, 歌手列表(小写), 搜索关键词)"""
         clean_title_str = title_str.replace(" - 网易云音乐", "").strip()
-        search_keyword = ""
-        
+
         if " - " in clean_title_str:
             parts = clean_title_str.rsplit(" - ", 1)
             target_song_name = parts[0].strip()
@@ -787,64 +1780,75 @@ class SearchService:
             target_song_name = clean_title_str
             target_artists = []
             search_keyword = clean_title_str
+        return target_song_name, target_artists, search_keyword
+
+    @staticmethod
+    def pick_best_match(songs, target_song_name, target_artists, target_ms):
+        """歌名互相包含、歌手有交集、时长差 < 3 秒的候选中，取时长最接近的一首"""
+        best_match = None
+        min_duration_diff = 99999999
+
+        for song in songs:
+            s_name = song.get('name') or ''
+            s_dt = song.get('dt') or song.get('duration') or 0
+            s_artists_list = song.get('ar') or song.get('artists') or []
+            s_artist_names = [(a.get('name') or '').lower() for a in s_artists_list]
 
+            diff = abs(s_dt - target_ms)
+
+            is_artist_match = False
+            if not target_artists:
+                is_artist_match = True
+            else:
+                for ta in target_artists:
+                    for sa in s_artist_names:
+                        if ta in sa or sa in ta:
+                            is_artist_match = True
+                            break
+                    if is_artist_match: break
+
+            is_name_match = (target_song_name.lower() in s_name.lower()) or (s_name.lower() in target_song_name.lower())
+
+            if is_artist_match and is_name_match and diff < 3000:
+                if diff < min_duration_diff:
+                    min_duration_diff = diff
+                    best_match = song
+        return best_match
+
+    @staticmethod
+    def search_song_by_title(title_str, duration_sec, client=None):
+        """搜索并挑选最佳匹配；确实没有结果时返回 None，网络错误/熔断抛出 UpstreamError"""
+        if not title_str: return None
+
+        target_song_name, target_artists, search_keyword = SearchService.parse_title(title_str)
         target_ms = duration_sec * 1000
         
         print(f"\n[DEBUG] 🔎 搜索: [{search_keyword}]") 
         
         try:
-            url = "http://music.163.com/api/cloudsearch/pc"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'http://music.163.com/',
-                'Content-Type': 'application/x-www-form-urlencoded'
-            }
+            client = client or UpstreamClient.default()
             data = {'s': search_keyword, 'type': 1, 'offset': 0, 'limit': 10, 'total': 'true'}
             
-            resp = requests.post(url, data=data, headers=headers, timeout=5)
-            if resp.status_code != 200: return None
-            
-            try: resp_json = resp.json()
-            except: return None
+            resp_json = client.request_json(
+                "search", "/api/cloudsearch/pc", method="POST", data=data, timeout=5,
+                cache_ttl=600, negative_ttl=120,
+                validate=lambda r: bool(r.get('result', {}).get('songs'))
+            )
+            if not resp_json: return None
             
             songs = resp_json.get('result', {}).get('songs', [])
             if not songs: return None
             
-            best_match = None
-            min_duration_diff = 99999999 
-            
-            for i, song in enumerate(songs):
-                s_name = song.get('name', '')
-                s_dt = song.get('dt') or song.get('duration', 0)
-                s_artists_list = song.get('ar') or song.get('artists', [])
-                s_artist_names = [a.get('name', '').lower() for a in s_artists_list]
-                
-                diff = abs(s_dt - target_ms)
-                
-                is_artist_match = False
-                if not target_artists:
-                    is_artist_match = True 
-                else:
-                    for ta in target_artists:
-                        for sa in s_artist_names:
-                            if ta in sa or sa in ta: 
-                                is_artist_match = True
-                                break
-                        if is_artist_match: break
-                
-                is_name_match = (target_song_name.lower() in s_name.lower()) or (s_name.lower() in target_song_name.lower())
-
-                if is_artist_match and is_name_match and diff < 3000:
-                    if diff < min_duration_diff:
-                        min_duration_diff = diff
-                        best_match = song
-            
+            best_match = SearchService.pick_best_match(songs, target_song_name, target_artists, target_ms)
             if best_match:
                 print(f"[DEBUG] ✅ 搜索匹配成功: {best_match['name']}")
                 return SearchService._format_song(best_match)
             else:
                 return None
 
+        except UpstreamError as e:
+            print(f"[DEBUG] Search Error: {e}")
+            raise
         except Exception as e:
             print(f"[DEBUG] Search Error: {e}")
             return None
@@ -859,24 +1863,27 @@ class SearchService:
             "album": song_data.get('al') or song_data.get('album', {})
         }
     
-class PlayModeService:
-    def __init__(self):
+class UIAPlayModeBackend:
+    """基于 UI Automation 的播放模式读取 (只能在已初始化 UIA 的线程中调用)"""
+    def __init__(self, mode_keys):
+        self.mode_keys = list(mode_keys)
         self.window = None
         self.control_bar = None
-        self.mode_map = {
-            "loop": "list",
-            "singleloop": "single",
-            "shuffle": "random",
-            "order": "order"
-        }
-        self.current_mode = "list"
+
+    def thread_context(self):
+        if auto is None:
+            return nullcontext()
+        return auto.UIAutomationInitializerInThread()
+
+    def available(self):
+        return auto is not None
 
     def _get_handles(self):
-        """重新连接网易云窗口并定位控制栏锚点"""
+        """重新连接网易云窗口并定位控制栏锚点 (昂贵：深度搜索)"""
         try:
             self.window = auto.WindowControl(searchDepth=1, ClassName="OrpheusBrowserHost")
             if not self.window.Exists(0): return False
-            for ui_name in self.mode_map.keys():
+            for ui_name in self.mode_keys:
                 target_btn = self.window.ButtonControl(searchDepth=15, Name=ui_name)
                 if target_btn.Exists(0.1):
                     self.control_bar = target_btn.GetParentControl()
@@ -884,28 +1891,119 @@ class PlayModeService:
         except: pass
         return False
 
-    def get_mode(self):
-        """获取当前模式，包含自动重连逻辑"""
+    def read_mode_key(self):
+        """
+        返回控制栏上模式按钮的名称；窗口不存在时返回 None
+        缓存的控制栏失效时才会触发一次深度搜索
+        """
         try:
             if not self.window or not self.window.Exists(0):
-                self._get_handles()
-                return self.current_mode
-
-            found_key = None
-            if self.control_bar and self.control_bar.Exists(0):
-                for child in self.control_bar.GetChildren():
-                    if child.Name in self.mode_map:
-                        found_key = child.Name
-                        break
-            
-            if not found_key: # 缓存失效重试
-                if self._get_handles(): return self.get_mode()
-            
-            if found_key: self.current_mode = self.mode_map[found_key]
+                if not self._get_handles():
+                    return None
+
+            for attempt in range(2):
+                if self.control_bar and self.control_bar.Exists(0):
+                    for child in self.control_bar.GetChildren():
+                        if child.Name in self.mode_keys:
+                            return child.Name
+                if attempt == 0 and not self._get_handles(): # 缓存失效重试
+                    break
         except Exception: # 捕获 UI 重绘导致的句柄失效
             self.window = None
             self.control_bar = None
+        return None
+
+class FakePlayModeBackend:
+    """测试用：直接设置按钮名称，模拟窗口存在与否"""
+    def __init__(self, mode_key=None):
+        self.mode_key = mode_key
+        self.read_count = 0
+
+    def thread_context(self):
+        return nullcontext()
+
+    def available(self):
+        return True
+
+    def set_mode_key(self, mode_key):
+        self.mode_key = mode_key
+
+    def read_mode_key(self):
+        self.read_count += 1
+        return self.mode_key
+
+class PlayModeService:
+    """
+    播放模式检测
+    UI Automation 搜索可能耗时数百毫秒，因此放到独立的低频 watcher 线程中执行，
+    监控主循环只读取已发布的 current_mode，不会被 UIA 阻塞。
+    """
+    POLL_INTERVAL = 0.5       # 控制栏缓存有效时的轮询间隔
+    MISSING_INTERVAL = 3.0    # 找不到窗口/控制栏时的退避间隔
+
+    def __init__(self, backend=None):
+        self.mode_map = {
+            "loop": "list",
+            "singleloop": "single",
+            "shuffle": "random",
+            "order": "order"
+        }
+        self.backend = backend or UIAPlayModeBackend(self.mode_map.keys())
+        self.current_mode = "list"
+        self.last_update = 0.0
+        self._listeners = []
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_listener(self, callback):
+        """注册模式变化回调 callback(new_mode, old_mode)，在 watcher 线程中调用"""
+        self._listeners.append(callback)
+
+    def poll(self):
+        """执行一次检测并发布结果，返回是否读到了模式按钮"""
+        found_key = self.backend.read_mode_key()
+        if not found_key or found_key not in self.mode_map:
+            return False
+
+        new_mode = self.mode_map[found_key]
+        old_mode = self.current_mode
+        self.current_mode = new_mode
+        self.last_update = time.time()
+        if new_mode != old_mode:
+            for callback in list(self._listeners):
+                try: callback(new_mode, old_mode)
+                except Exception as e: print(f"[PlayMode] 回调异常: {e}")
+        return True
+
+    def get_mode(self):
+        """获取当前模式 (非阻塞，返回 watcher 最近一次发布的结果)"""
         return self.current_mode
+
+    def _watch(self):
+        with self.backend.thread_context():
+            while not self._stop_event.is_set():
+                try:
+                    found = self.poll()
+                except Exception as e:
+                    print(f"[PlayMode] 检测失败: {e}")
+                    found = False
+                self._wake_event.wait(self.POLL_INTERVAL if found else self.MISSING_INTERVAL)
+                self._wake_event.clear()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        if not self.backend.available():
+            print("[PlayMode] 未安装 uiautomation，播放模式检测已禁用")
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="play-mode-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
     
 # ===========================
 # 0.5 按键模拟工具 (触发全局快捷键)
@@ -931,58 +2029,936 @@ class KeyboardHelper:
 # ===========================
 # 1. 数据库服务
 # ===========================
-class NeteaseV3Service:
-    def __init__(self):
-        self.user_home = os.path.expanduser("~")
-        self.db_path = os.path.join(
-            self.user_home,
-            r"AppData\Local\NetEase\CloudMusic\Library\webdb.dat"
-        )
-
-        self.last_db_playtime = 0
-        self.last_file_mtime = 0
-        self.current_full_data = None
+class PlayingListParser:
+    """
+    playingList 流式解析器
+    只抽取用到的字段 (id / track 名称、时长、歌手、专辑、封面 / displayOrder / randomOrder)，
+    privilege、referInfo 等大字段在解析阶段直接丢弃，不会整体驻留内存。
+    """
+    # 列表项内的路径 -> 精简记录中的位置
+    ITEM_FIELDS = {
+        "id": ("id",),
+        "displayOrder": ("displayOrder",),
+        "randomOrder": ("randomOrder",),
+        "track.id": ("track", "id"),
+        "track.name": ("track", "name"),
+        "track.duration": ("track", "duration"),
+        "track.dt": ("track", "duration"),
+        "track.album.id": ("track", "album", "id"),
+        "track.album.name": ("track", "album", "name"),
+        "track.album.picUrl": ("track", "album", "picUrl"),
+        "track.al.id": ("track", "album", "id"),
+        "track.al.name": ("track", "album", "name"),
+        "track.al.picUrl": ("track", "album", "picUrl"),
+    }
+    # 歌手数组的元素路径 -> 临时存放的键 (artists 优先于 ar)
+    ARTIST_ITEMS = {
+        "track.artists.item": "artists",
+        "track.ar.item": "ar",
+    }
+    ARTIST_FIELDS = ("id", "name")
+    SCALAR_EVENTS = ("string", "number", "boolean", "null")
 
-        # 播放列表缓存
-        self.playing_list_cache = []
-        self.playing_list_mtime = 0
+    @staticmethod
+    def _new_record():
+        return {
+            "id": None,
+            "displayOrder": 0,
+            "randomOrder": 0,
+            "track": {"id": None, "name": None, "duration": 0, "artists": [], "ar": [], "album": {}}
+        }
 
-    def check_db_update(self):
-        """检查数据库文件是否有更新 (同时检查 .dat 和 .dat-wal)"""
+    @staticmethod
+    def _finish_record(record):
+        track = record["track"]
+        ar = track.pop("ar")
+        if not track["artists"]:
+            track["artists"] = ar
+        return record
+
+    @classmethod
+    def compact_item(cls, item):
+        """将一条完整的列表项裁剪为精简记录 (非流式路径使用)"""
+        t = item.get('track') or {}
+        ar = t.get('artists') or t.get('ar') or []
+        al = t.get('album') or t.get('al') or {}
+        return {
+            "id": item.get('id'),
+            "displayOrder": item.get('displayOrder', 0),
+            "randomOrder": item.get('randomOrder', 0),
+            "track": {
+                "id": t.get('id'),
+                "name": t.get('name'),
+                "duration": t.get('duration') or t.get('dt') or 0,
+                "artists": [{k: a.get(k) for k in cls.ARTIST_FIELDS} for a in ar if isinstance(a, dict)],
+                "album": {k: al[k] for k in ("id", "name", "picUrl") if k in al}
+            }
+        }
+
+    @classmethod
+    def iter_records(cls, events):
+        """
+        消费 ijson 风格的 (prefix, event, value) 事件流，逐条产出精简记录
+        兼容两种根结构: {"list": [...]} 与 [...]
+        """
+        root = None
+        record = None
+        for prefix, event, value in events:
+            if root is None:
+                if prefix == '' and event == 'start_array':
+                    root = 'item'
+                elif prefix == '' and event == 'start_map':
+                    root = 'list.item'
+                continue
+
+            if prefix == root:
+                if event == 'start_map':
+                    record = cls._new_record()
+                elif event == 'end_map' and record is not None:
+                    yield cls._finish_record(record)
+                    record = None
+                continue
+
+            if record is None or not prefix.startswith(root + '.'):
+                continue
+
+            path = prefix[len(root) + 1:]
+            if event == 'start_map':
+                artist_key = cls.ARTIST_ITEMS.get(path)
+                if artist_key:
+                    record["track"][artist_key].append({})
+                continue
+            if event not in cls.SCALAR_EVENTS:
+                continue
+
+            target = cls.ITEM_FIELDS.get(path)
+            if target:
+                node = record
+                for key in target[:-1]:
+                    node = node[key]
+                node[target[-1]] = value
+                continue
+
+            parent, _, key = path.rpartition('.')
+            artist_key = cls.ARTIST_ITEMS.get(parent)
+            if artist_key and key in cls.ARTIST_FIELDS and record["track"][artist_key]:
+                record["track"][artist_key][-1][key] = value
+
+    @classmethod
+    def parse_file(cls, file_path):
+        if os.path.getsize(file_path) == 0:
+            return []
+        with open(file_path, 'rb') as f:
+            if ijson is not None:
+                return list(cls.iter_records(ijson.parse(f, use_float=True)))
+
+            # 未安装 ijson：整体解码后立即裁剪，原始对象随即释放
+            root_data = json.load(f)
+        if isinstance(root_data, dict) and 'list' in root_data:
+            root_data = root_data['list']
+        if not isinstance(root_data, list):
+            return []
+        return [cls.compact_item(item) for item in root_data if isinstance(item, dict)]
+
+class ReadOnlyDbPool:
+    """
+    webdb.dat 只读连接池
+    连接长期复用 (sqlite3 自带语句缓存，相同 SQL 不再重复编译)；
+    专用的探测连接读取 PRAGMA data_version，网易云进程每次提交后该值都会变化，用于驱动各级缓存失效。
+    数据库路径变化或文件被替换时整体重建连接：池的代数加一，借出中的旧连接归还时直接关闭。
+    """
+    SIZE = 3
+    STATEMENT_CACHE = 64
+
+    def __init__(self, path_getter, size=None):
+        self.path_getter = path_getter
+        self.size = size or self.SIZE
+        self._cond = threading.Condition()
+        self._idle = []
+        self._open = 0              # 当前代数下打开的连接数
+        self._generation = 0
+        self._owners = {}           # 连接 -> 打开时的代数
+        self._path = None
+        self._identity = None
+        self._probe = None
+        self._probe_lock = threading.Lock()
+        self.metrics = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _connect(self, path):
+        if not os.path.exists(path): return None
+        # 构造只读 URI
+        safe_path = quote(path.replace('\\', '/'))
+        conn = sqlite3.connect(
+            f"file:{safe_path}?mode=ro", uri=True, timeout=1,
+            check_same_thread=False, cached_statements=self.STATEMENT_CACHE
+        )
+        self.metrics["opened"] += 1
+        return conn
+
+    @staticmethod
+    def _file_identity(path):
         try:
-            if not os.path.exists(self.db_path): return False
-            
-            current_mtime = os.path.getmtime(self.db_path)
-            wal_path = self.db_path + "-wal"
-            if os.path.exists(wal_path):
-                wal_mtime = os.path.getmtime(wal_path)
-                current_mtime = max(current_mtime, wal_mtime)
-
-            if current_mtime != self.last_file_mtime:
-                self.last_file_mtime = current_mtime
-                return True
-        except: pass
-        return False
+            stat = os.stat(path)
+            return (stat.st_ino, stat.st_dev, getattr(stat, "st_birthtime", stat.st_ctime))
+        except OSError:
+            return None
 
-    def _create_ro_connection(self):
-        """辅助方法：创建只读数据库连接"""
-        if not os.path.exists(self.db_path): return None
+    def _reset(self):
+        """关闭空闲连接并进入新一代 (调用方持有 _cond)"""
+        for conn in self._idle:
+            self._owners.pop(conn, None)
+            conn.close()
+        self._idle = []
+        self._open = 0
+        self._generation += 1
+
+    def _check_path(self):
+        """路径或文件身份变化时关闭所有旧连接"""
+        path = self.path_getter()
+        identity = self._file_identity(path)
+        if path == self._path and identity == self._identity:
+            return
+        with self._cond:
+            self._reset()
+            self._path = path
+            self._identity = identity
+            self._cond.notify_all()
+        with self._probe_lock:
+            if self._probe is not None:
+                self._probe.close()
+                self._probe = None
+
+    def acquire(self, timeout=2.0):
+        self._check_path()
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    self.metrics["reused"] += 1
+                    return self._idle.pop()
+                if self._open < self.size:
+                    self._open += 1
+                    generation, path = self._generation, self._path
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
         try:
-            # 构造只读 URI
-            safe_path = quote(self.db_path.replace('\\', '/'))
-            db_uri = f"file:{safe_path}?mode=ro"
-            return sqlite3.connect(db_uri, uri=True, timeout=1)
-        except:
+            conn = self._connect(path)
+        except sqlite3.Error:
+            conn = None
+        with self._cond:
+            if conn is None:
+                if generation == self._generation:
+                    self._open -= 1
+                self._cond.notify()
+            else:
+                self._owners[conn] = generation
+        return conn
+
+    def release(self, conn, broken=False):
+        with self._cond:
+            generation = self._owners.pop(conn, None)
+            stale = generation != self._generation
+            if broken or stale or self._path is None:
+                conn.close()
+                # 旧代的连接已不计入 _open
+                if not stale:
+                    self._open -= 1
+                self.metrics["discarded"] += 1
+            else:
+                self._owners[conn] = generation
+                conn.row_factory = None
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def data_version(self):
+        """返回 (文件身份, data_version)；数据库不可用时返回 None"""
+        self._check_path()
+        with self._probe_lock:
+            try:
+                if self._probe is None:
+                    self._probe = self._connect(self._path)
+                    if self._probe is None: return None
+                return (self._identity, self._probe.execute("PRAGMA data_version").fetchone()[0])
+            except sqlite3.Error:
+                if self._probe is not None:
+                    self._probe.close()
+                    self._probe = None
+                return None
+
+    def close(self):
+        with self._cond:
+            self._reset()
+            self._path = None
+            self._identity = None
+        with self._probe_lock:
+            if self._probe is not None:
+                self._probe.close()
+                self._probe = None
+
+    def stats(self):
+        with self._cond:
+            result = dict(self.metrics)
+            result["open"] = self._open
+            result["idle"] = len(self._idle)
+        return result
+
+class LocalTrackIndex:
+    """
+    本地歌曲索引 (song_id -> 曲目数据)
+    首次从 historyTracks 等本地曲目表全量构建，之后数据库变化时只按水位线
+    (historyTracks 用 playtime，其它表用 rowid) 增量拉取新行；查询 O(1)，切歌时无需再解析 JSON。
+    """
+    # 先处理的来源优先级低 (后写入的覆盖先写入的)
+    SOURCES = [
+        {"table": "web_track", "json_col": "track", "watermark": "rowid"},
+        {"table": "historyTracks", "json_col": "jsonStr", "watermark": "playtime"},
+    ]
+    CHANGE_LOG_MAX = 50000
+
+    def __init__(self, service):
+        self.service = service
+        self.tracks = {}
+        self.watermarks = {}
+        # 新增 / 更新过的 song_id 按顺序追加，供下游 (本地检索索引) 增量消费；过长时截掉前半段
+        self.change_log = []
+        self.log_base = 0
+        self.sources = None
+        self.last_signature = None
+        self.last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def _detect_sources(self):
+        """检查哪些来源表存在且包含所需列"""
+        result = []
+        for src in self.SOURCES:
+            columns = {row[1] for row in self.service._read_db_query(f"PRAGMA table_info({src['table']})")}
+            if src["json_col"] in columns and (src["watermark"] == "rowid" or src["watermark"] in columns):
+                result.append(src)
+        return result
+
+    def refresh(self, force=False):
+        """数据库有变化时增量更新，返回本次新增/更新的条目数"""
+        signature = self.service._db_signature()
+        if signature is None:
+            return 0
+        if not force and signature == self.last_signature:
+            return 0
+
+        with self._lock:
+            if not self.sources:
+                self.sources = self._detect_sources()
+
+            updated = 0
+            for src in self.sources:
+                table, json_col, mark_col = src["table"], src["json_col"], src["watermark"]
+                watermark = self.watermarks.get(table)
+                sql = f"SELECT {json_col}, {mark_col} FROM {table}"
+                params = ()
+                if watermark is not None:
+                    sql += f" WHERE {mark_col} > ?"
+                    params = (watermark,)
+                sql += f" ORDER BY {mark_col} ASC"
+
+                rows = self.service._read_db_query(sql, params)
+                for raw, _ in rows:
+                    try:
+                        data = json.loads(raw)
+                        song_id = int(data.get('id', 0))
+                    except Exception:
+                        continue
+                    if song_id:
+                        self.tracks[song_id] = data
+                        self.change_log.append(song_id)
+                        updated += 1
+                if rows and rows[-1][1] is not None:
+                    self.watermarks[table] = rows[-1][1]
+
+            if len(self.change_log) > self.CHANGE_LOG_MAX:
+                drop = len(self.change_log) // 2
+                del self.change_log[:drop]
+                self.log_base += drop
+            self.last_signature = signature
+            self.last_refresh = time.time()
+        return updated
+
+    def changes_since(self, position):
+        """返回 (position 之后变化的 song_id 列表, 新位置)；日志已被截断时列表为 None，调用方需全量处理"""
+        with self._lock:
+            end = self.log_base + len(self.change_log)
+            if position < self.log_base:
+                return None, end
+            return self.change_log[position - self.log_base:], end
+
+    def get(self, song_id):
+        try:
+            return self.tracks.get(int(song_id))
+        except (TypeError, ValueError):
+            return None
+
+    def stats(self):
+        return {
+            "tracks": len(self.tracks),
+            "sources": [src["table"] for src in (self.sources or [])],
+            "watermarks": dict(self.watermarks),
+            "last_refresh": self.last_refresh
+        }
+
+class LocalTitleResolver:
+    """
+    本地优先的标题解析 (降级模式下窗口标题 -> 歌曲)
+    在本地曲目索引 (历史 / 歌单曲目) 与 playingList 上建立 "规范化歌名 + 二元组" 倒排索引，
+    按 SearchService.pick_best_match 的同一套规则 (歌名 / 歌手 / 时长) 打分；
+    结果 (包括确实没有匹配的未命中) 带 TTL 记忆，只有本地真正找不到时才走网络搜索；
+    网络搜索失败 (抛出异常) 时不记忆，下次继续尝试。
+    """
+    TTL = 600
+    NEGATIVE_TTL = 120
+    MEMO_SIZE = 256
+    MIN_OVERLAP = 0.6    # 候选与标题共享的二元组比例下限
+    MAX_CANDIDATES = 50
+    STRIP_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+    def __init__(self, service):
+        self.service = service
+        self.entries = []       # [(歌名规范化, 曲目数据)]
+        self.by_name = {}       # 规范化歌名 -> [entry 下标]
+        self.grams = {}         # 二元组 -> set(entry 下标)
+        self.signature = None
+        self.memo = OrderedDict()   # (标题, 时长) -> (过期时间, 结果)
+        self._lock = threading.Lock()
+        self.metrics = {"memo_hits": 0, "local_hits": 0, "network": 0, "network_errors": 0, "misses": 0, "rebuilds": 0}
+
+    @classmethod
+    def normalize(cls, text):
+        text = unicodedata.normalize("NFKC", text or "").lower()
+        return cls.STRIP_PATTERN.sub("", text)
+
+    @staticmethod
+    def ngrams(text):
+        if len(text) < 2:
+            return {text} if text else set()
+        return {text[i:i + 2] for i in range(len(text) - 1)}
+
+    def _current_signature(self):
+        index = self.service.track_index
+        return (len(index.tracks), index.last_refresh, self.service.playing_list_mtime)
+
+    def _rebuild(self):
+        """来源有变化时重建索引 (playingList 覆盖同 id 的本地记录，因为它带封面)"""
+        tracks = dict(self.service.track_index.tracks)
+        for item in self.service.get_raw_playing_list():
+            track = item.get("track") or {}
+            if track.get("id") and track.get("name"):
+                tracks[int(track["id"])] = track
+        entries, by_name, grams = [], {}, {}
+        for track in tracks.values():
+            name = self.normalize(track.get("name"))
+            if not name: continue
+            idx = len(entries)
+            entries.append((name, track))
+            by_name.setdefault(name, []).append(idx)
+            for gram in self.ngrams(name):
+                grams.setdefault(gram, set()).add(idx)
+        self.entries, self.by_name, self.grams = entries, by_name, grams
+        self.metrics["rebuilds"] += 1
+
+    def _refresh(self):
+        self.service.track_index.refresh()
+        self.service.get_raw_playing_list()
+        signature = self._current_signature()
+        if signature != self.signature:
+            self._rebuild()
+            self.signature = signature
+
+    def _candidates(self, name):
+        exact = self.by_name.get(name)
+        if exact:
+            return [self.entries[i][1] for i in exact]
+        query = self.ngrams(name)
+        if not query: return []
+        counts = {}
+        for gram in query:
+            for idx in self.grams.get(gram, ()):
+                counts[idx] = counts.get(idx, 0) + 1
+        need = max(1, int(len(query) * self.MIN_OVERLAP))
+        ranked = sorted((c, idx) for idx, c in counts.items() if c >= need)
+        return [self.entries[idx][1] for _, idx in ranked[-self.MAX_CANDIDATES:]]
+
+    def find_local(self, title, duration_sec):
+        name, artists, _ = SearchService.parse_title(title)
+        with self._lock:
+            self._refresh()
+            candidates = self._candidates(self.normalize(name))
+        best = SearchService.pick_best_match(candidates, name, artists, duration_sec * 1000)
+        return SearchService._format_song(best) if best else None
+
+    def _remember(self, key, result):
+        ttl = self.TTL if result else self.NEGATIVE_TTL
+        with self._lock:
+            self.memo[key] = (time.time() + ttl, result)
+            self.memo.move_to_end(key)
+            while len(self.memo) > self.MEMO_SIZE:
+                self.memo.popitem(last=False)
+
+    def resolve(self, title, duration_sec, fallback=None):
+        """记忆 -> 本地索引 -> fallback() (网络搜索)；结果按 TTL 记忆，fallback 抛出异常时不记忆"""
+        if not title: return None
+        key = (title, int(round(duration_sec)))
+        with self._lock:
+            cached = self.memo.get(key)
+        if cached and cached[0] > time.time():
+            self.metrics["memo_hits"] += 1
+            return cached[1]
+
+        result = None
+        try:
+            result = self.find_local(title, duration_sec)
+        except Exception as e:
+            print(f"[Resolver] 本地解析失败: {e}")
+        if result:
+            self.metrics["local_hits"] += 1
+            print(f" -> [降级] 本地索引命中: {result['name']}")
+        elif fallback is not None:
+            self.metrics["network"] += 1
+            try:
+                result = fallback()
+            except Exception as e:
+                self.metrics["network_errors"] += 1
+                print(f"[Resolver] 网络搜索失败，不记忆: {e}")
+                return None
+        if not result:
+            self.metrics["misses"] += 1
+        self._remember(key, result)
+        return result
+
+    def stats(self):
+        result = dict(self.metrics)
+        result["entries"] = len(self.entries)
+        result["memo"] = len(self.memo)
+        return result
+
+class LibrarySearchIndex:
+    """
+    本地曲库全文检索 (数据目录下的 SQLite FTS5 旁路文件，open() 之前不可用)
+    文档来源：本地曲目索引 (historyTracks / 歌单内曲目)、playingList、web_user_playlist 歌单。
+    中文按单字切分后以短语匹配 (支持任意子串)，其余词按前缀匹配；安装 pypinyin 时额外索引全拼与首字母。
+    来源变化时在后台任务中增量更新：曲目按 LocalTrackIndex 的变更日志只处理新增 / 更新的条目，
+    playingList 与歌单只在各自变化时重新汇总；按内容摘要跳过未变的文档。
+    查询走独立的只读连接，更新期间不阻塞检索。
+    """
+    CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]')
+    TERM_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+|[^\W_]+', re.UNICODE)
+    # bm25 列权重，顺序与建表列一致 (kind, ref_id, name, artists, album, chars, pinyin, cover)
+    RANK_WEIGHTS = (0, 0, 10.0, 5.0, 2.0, 6.0, 3.0, 0)
+    LIMIT_MAX = 100
+
+    def __init__(self, service, db_path=None, executor=None):
+        self.service = service
+        self.executor = executor or JobExecutor.default()
+        self.db_path = db_path
+        self.available = False
+        self.digests = {}       # 文档 rowid -> 内容摘要
+        self.signature = None
+        self.last_refresh = 0.0
+        # 各来源的增量状态
+        self.track_position = -1        # LocalTrackIndex 变更日志位置 (-1 表示尚未全量处理)
+        self.queue_signature = None
+        self.queue_rowids = set()
+        self.playlist_version = None
+        self.playlist_rowids = set()
+        self._lock = threading.Lock()       # 写入 (只在后台任务中)
+        self._read_lock = threading.Lock()  # 查询
+        self._conn = None
+        self._read_conn = None
+
+    def open(self):
+        """打开索引库 (未指定路径时放在数据目录下)"""
+        if self.available: return
+        self.db_path = self.db_path or data_path("search_index.db")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=1, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS library USING fts5("
+                "kind UNINDEXED, ref_id UNINDEXED, name, artists, album, chars, pinyin, cover UNINDEXED, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS docs (rowid INTEGER PRIMARY KEY, digest TEXT)")
+            self._conn.commit()
+            self.digests = dict(self._conn.execute("SELECT rowid, digest FROM docs"))
+            self._read_conn = sqlite3.connect(self.db_path, timeout=1, check_same_thread=False)
+            self.available = True
+        except (sqlite3.Error, OSError) as e:
+            print(f"[Search] 全文索引不可用 (需要 SQLite FTS5): {e}")
+
+    @classmethod
+    def _cjk_chars(cls, *texts):
+        return " ".join(ch for text in texts for ch in (text or "") if cls.CJK_PATTERN.match(ch))
+
+    @staticmethod
+    def _pinyin(*texts):
+        if lazy_pinyin is None: return ""
+        parts = []
+        for text in texts:
+            if not text: continue
+            syllables = [p.strip().lower() for p in lazy_pinyin(text) if p.strip()]
+            initials = [p.strip().lower()[:1] for p in lazy_pinyin(text, style=Style.FIRST_LETTER) if p.strip()]
+            # 单个音节、整段全拼、首字母都作为词，便于 "qingt" / "qt" 前缀匹配
+            parts += syllables + ["".join(syllables), "".join(initials)]
+        return " ".join(p for p in parts if p)
+
+    def _track_doc(self, track):
+        song_id = track.get("id")
+        if not song_id or not track.get("name"): return None
+        artists = " / ".join(a.get("name") or "" for a in (track.get("artists") or track.get("ar") or []))
+        album = track.get("album") or track.get("al") or {}
+        return int(song_id) * 2, ("track", int(song_id), track["name"], artists, album.get("name") or "", album.get("picUrl") or "")
+
+    def _queue_file_signature(self):
+        try:
+            stat = os.stat(self.service._playing_list_path())
+            return (stat.st_mtime, stat.st_size)
+        except OSError:
+            return None
+
+    def _source_signature(self):
+        """只做 data_version 探测与一次 stat，可以放在请求路径上"""
+        return (self.service._db_signature(), self._queue_file_signature())
+
+    def _collect_changes(self):
+        """
+        汇总自上次以来变化的来源，返回 (待写入 {rowid: doc}, 待删除 rowid 集合)
+        曲目只处理变更日志中的条目；playingList / 歌单变化时重新汇总该来源 (数据量小)
+        """
+        index = self.service.track_index
+        index.refresh()
+        upserts, removed = {}, set()
+
+        changed_ids, self.track_position = index.changes_since(self.track_position)
+        full = changed_ids is None
+        if full:
+            # 首次或日志已截断：全量处理，并一并重建其它来源以清理索引中的过期文档
+            changed_ids = list(index.tracks.keys())
+            self.queue_signature = self.playlist_version = None
+        for song_id in changed_ids:
+            doc = self._track_doc(index.tracks.get(song_id) or {})
+            if doc: upserts[doc[0]] = doc[1]
+
+        queue_signature = self._queue_file_signature()
+        if queue_signature != self.queue_signature:
+            queue_rowids = set()
+            for item in self.service.get_raw_playing_list():
+                doc = self._track_doc(item.get("track") or {})
+                if not doc: continue
+                queue_rowids.add(doc[0])
+                # 本地曲目索引里的数据更完整，优先使用
+                if doc[0] // 2 not in index.tracks: upserts.setdefault(doc[0], doc[1])
+            removed |= {r for r in self.queue_rowids - queue_rowids if r // 2 not in index.tracks}
+            self.queue_rowids = queue_rowids
+            self.queue_signature = queue_signature
+
+        version = self.service._db_signature()
+        if version is None or version != self.playlist_version:
+            playlists = self.service.query_page(
+                "web_user_playlist", fields=("id", "name", "creator.nickname", "coverImgUrl")
+            )["data"]
+            playlist_rowids = set()
+            for pl in playlists:
+                if pl.get("id") and pl.get("name"):
+                    rowid = int(pl["id"]) * 2 + 1
+                    playlist_rowids.add(rowid)
+                    upserts[rowid] = ("playlist", int(pl["id"]), pl["name"], pl.get("creator.nickname") or "", "", pl.get("coverImgUrl") or "")
+            removed |= self.playlist_rowids - playlist_rowids
+            self.playlist_rowids = playlist_rowids
+            self.playlist_version = version
+        if full:
+            removed |= self.digests.keys() - upserts.keys() - {song_id * 2 for song_id in index.tracks} - self.queue_rowids
+        return upserts, removed
+
+    def refresh(self, force=False):
+        """来源有变化时增量更新 (在后台任务中执行)，返回写入/删除的文档数"""
+        if not self.available: return 0
+        signature = self._source_signature()
+        if not force and signature == self.signature:
+            return 0
+        with self._lock:
+            if force:
+                self.track_position, self.queue_signature, self.playlist_version = -1, None, None
+            upserts, removed = self._collect_changes()
+            changed = 0
+            cur = self._conn.cursor()
+            for rowid, doc in upserts.items():
+                digest = hashlib.blake2b(json.dumps(doc, ensure_ascii=False).encode('utf-8'), digest_size=8).hexdigest()
+                if self.digests.get(rowid) == digest: continue
+                kind, ref_id, name, artists, album, cover = doc
+                cur.execute("DELETE FROM library WHERE rowid = ?", (rowid,))
+                cur.execute(
+                    "INSERT INTO library (rowid, kind, ref_id, name, artists, album, chars, pinyin, cover) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (rowid, kind, ref_id, name, artists, album, self._cjk_chars(name, artists, album), self._pinyin(name, artists), cover)
+                )
+                cur.execute("INSERT OR REPLACE INTO docs (rowid, digest) VALUES (?, ?)", (rowid, digest))
+                self.digests[rowid] = digest
+                changed += 1
+            for rowid in removed:
+                if rowid not in self.digests: continue
+                cur.execute("DELETE FROM library WHERE rowid = ?", (rowid,))
+                cur.execute("DELETE FROM docs WHERE rowid = ?", (rowid,))
+                del self.digests[rowid]
+                changed += 1
+            self._conn.commit()
+            self.signature = signature
+            self.last_refresh = time.time()
+        if changed:
+            print(f"[Search] 本地索引更新 {changed} 条，共 {len(self.digests)} 条")
+        return changed
+
+    def schedule_refresh(self):
+        """来源有变化时把更新投递到后台 (同一时间只排一个)，不等待完成"""
+        if not self.available or self._source_signature() == self.signature:
+            return None
+        return self.executor.submit(
+            self.refresh, key=("search_index", "refresh"), group="search_index", priority=JobExecutor.PRIORITY_LOW
+        )
+
+    @classmethod
+    def build_match(cls, query):
+        """用户输入 -> FTS5 MATCH 表达式；中文连续片段按单字短语，其余按前缀"""
+        terms = []
+        for term in cls.TERM_PATTERN.findall(unicodedata.normalize("NFKC", query or "").lower()):
+            if cls.CJK_PATTERN.match(term):
+                terms.append('"' + " ".join(term) + '"')
+            else:
+                terms.append('"' + term.replace('"', '') + '"*')
+        return " AND ".join(terms)
+
+    def search(self, query, limit=20, kind=None):
+        if not self.available: return None
+        match = self.build_match(query)
+        if not match: return []
+        # 查询当前索引；来源有变化时只投递后台更新，本次请求不等待
+        self.schedule_refresh()
+        limit = max(1, min(int(limit or 20), self.LIMIT_MAX))
+        sql = (
+            "SELECT kind, ref_id, name, artists, album, cover, bm25(library, " + ", ".join(str(w) for w in self.RANK_WEIGHTS) + ") AS score "
+            "FROM library WHERE library MATCH ?"
+        )
+        params = [match]
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self._read_lock:
+            try:
+                rows = self._read_conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"[Search] 查询失败: {e}")
+                return []
+        return [
+            {"type": k, "id": ref_id, "name": name, "artist": artists, "album": album, "cover": cover, "score": round(-score, 4)}
+            for k, ref_id, name, artists, album, cover, score in rows
+        ]
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "documents": len(self.digests),
+            "pinyin": lazy_pinyin is not None,
+            "last_refresh": self.last_refresh
+        }
+
+class SongDetailBatcher:
+    """
+    批量歌曲详情解析
+    在 WINDOW 秒内收集待查询的 id，按 CHUNK_SIZE 分块调用 /api/song/detail/?ids=[...]，
+    结果写入 NeteaseV3Service 的详情缓存，每个 id 返回一个 Future (查不到时结果为 None)。
+    """
+    WINDOW = 0.03
+    CHUNK_SIZE = 100
+    NEGATIVE_TTL = 60   # 上游明确没有返回的 id，在此时间内不再重复查询
+    TIMEOUT = 5
+
+    def __init__(self, service, client=None):
+        self.service = service
+        self.client = client or service.client
+        self._lock = threading.Lock()
+        self._pending = {}      # song_id -> Future
+        self._missing = {}      # song_id -> 过期时间
+        self._timer = None
+        self.metrics = {"requested": 0, "cache_hits": 0, "batches": 0, "fetched": 0, "missing": 0, "errors": 0}
+
+    @staticmethod
+    def compact(song):
+        return {
+            "id": song['id'],
+            "name": song['name'],
+            "duration": song.get('duration') or song.get('dt', 0),
+            "artists": song.get('artists') or song.get('ar', []),
+            "album": song.get('album') or song.get('al', {})
+        }
+
+    def request(self, song_id):
+        """登记一个 id，返回其 Future；已缓存或已在排队时不产生新请求"""
+        song_id = int(song_id)
+        future = Future()
+        self.metrics["requested"] += 1
+        cached = self.service.get_cached_detail(song_id)
+        if cached:
+            self.metrics["cache_hits"] += 1
+            future.set_result(cached)
+            return future
+
+        with self._lock:
+            if self._missing.get(song_id, 0) > time.time():
+                future.set_result(None)
+                return future
+            existing = self._pending.get(song_id)
+            if existing is not None:
+                return existing
+            self._pending[song_id] = future
+            if self._timer is None:
+                self._timer = threading.Timer(self.WINDOW, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return future
+
+    def resolve_many(self, song_ids, timeout=None):
+        """批量解析，返回 {song_id: 详情或 None}"""
+        futures = {int(sid): self.request(sid) for sid in song_ids if sid}
+        deadline = time.time() + (timeout or self.TIMEOUT * 2)
+        result = {}
+        for song_id, future in futures.items():
+            try:
+                result[song_id] = future.result(max(0.0, deadline - time.time()))
+            except Exception:
+                result[song_id] = None
+        return result
+
+    def _flush(self):
+        with self._lock:
+            batch = self._pending
+            self._pending = {}
+            self._timer = None
+
+        ids = list(batch)
+        for start in range(0, len(ids), self.CHUNK_SIZE):
+            chunk = ids[start:start + self.CHUNK_SIZE]
+            found = None
+            try:
+                found = self._fetch_chunk(chunk)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                print(f"[API] Batch Detail Error: {e}")
+
+            now = time.time()
+            for song_id in chunk:
+                detail = found.get(song_id) if found else None
+                if detail is None and found is not None:
+                    # 请求成功但结果里没有这个 id，说明上游确实没有这首歌
+                    with self._lock:
+                        self._missing[song_id] = now + self.NEGATIVE_TTL
+                    self.metrics["missing"] += 1
+                batch[song_id].set_result(detail)
+
+        with self._lock:
+            if len(self._missing) > 1024:
+                now = time.time()
+                self._missing = {k: v for k, v in self._missing.items() if v > now}
+
+    def _fetch_chunk(self, chunk):
+        self.metrics["batches"] += 1
+        data = self.client.request_json(
+            "detail", "/api/song/detail/", params={"ids": json.dumps(chunk, separators=(',', ':'))},
+            timeout=self.TIMEOUT, validate=lambda r: 'songs' in r
+        )
+        if not data:
             return None
+        found = {}
+        for song in data.get('songs') or []:
+            try:
+                detail = self.compact(song)
+            except (KeyError, TypeError):
+                continue
+            self.service._store_detail(detail)
+            found[int(detail["id"])] = detail
+        self.metrics["fetched"] += len(found)
+        return found
+
+    def stats(self):
+        result = dict(self.metrics)
+        with self._lock:
+            result["pending"] = len(self._pending)
+            result["negative"] = len(self._missing)
+        return result
+
+class NeteaseV3Service:
+    DETAIL_CACHE_SIZE = 512
+    # 分页接口支持的表：JSON 列与分页排序列 (None 表示按 rowid 正序)
+    TABLE_VIEWS = {
+        "historyTracks": {"json_col": "jsonStr", "order_col": "playtime"},
+        "web_user_playlist": {"json_col": "playlist", "order_col": None},
+    }
+    PAGE_LIMIT_MAX = 500
+    SCHEMA_SAMPLE_ROWS = 200   # 推断 JSON 列字段路径时采样的行数 (按 rowid 取最近写入的行)
+    QUERY_CACHE_SIZE = 256
+
+    def __init__(self, title_watcher=None, client=None):
+        self.user_home = os.path.expanduser("~")
+        self.db_path = os.path.join(
+            self.user_home,
+            r"AppData\Local\NetEase\CloudMusic\Library\webdb.dat"
+        )
+
+        self.last_db_playtime = 0
+        self.title_watcher = title_watcher or WindowTitleWatcher()
+        self.client = client or UpstreamClient.default()
+
+        # 本地曲目索引 (song_id -> 曲目数据)
+        self.track_index = LocalTrackIndex(self)
+
+        # 歌曲详情缓存 (API 结果，LRU)
+        self.detail_cache = OrderedDict()
+        self._detail_lock = threading.Lock()
+        self.detail_batcher = SongDetailBatcher(self)
+        self.title_resolver = LocalTitleResolver(self)
+        self.current_full_data = None
+
+        # 只读连接池 + 按 data_version 失效的查询结果缓存
+        self.db_pool = ReadOnlyDbPool(lambda: self.db_path)
+        self.last_db_version = None
+        self._query_cache = {}
+        self._query_cache_version = None
+        self._query_cache_lock = threading.Lock()
+
+        # 播放列表缓存 (精简记录 + 文件签名 + 内容哈希)
+        self.playing_list_cache = []
+        self.playing_list_mtime = None
+        self.playing_list_digest = None
+
+    def _db_signature(self):
+        """数据库版本签名 (文件身份 + PRAGMA data_version)，数据库不可用时返回 None"""
+        return self.db_pool.data_version()
+
+    def check_db_update(self):
+        """自上次调用以来数据库是否有新的提交"""
+        version = self._db_signature()
+        if version is not None and version != self.last_db_version:
+            self.last_db_version = version
+            return True
+        return False
 
     def _read_db_query(self, sql, params=()):
         """内部通用查询方法 (基础版，不带JSON解析)"""
         result = []
-        conn = None
+        conn = self.db_pool.acquire()
+        if not conn: return []
+        broken = False
         try:
-            conn = self._create_ro_connection()
-            if not conn: return []
-            
             cursor = conn.cursor()
             cursor.execute(sql, params)
             result = cursor.fetchall()
@@ -990,23 +2966,47 @@ class NeteaseV3Service:
         except sqlite3.OperationalError:
             pass # 忽略锁错误
         except Exception as e:
+            broken = True
             print(f"[DB Error] {e}")
         finally:
-            if conn: conn.close()
+            self.db_pool.release(conn, broken)
+        return result
+
+    def _cached_query(self, key, loader):
+        """数据库版本不变时直接返回上次的结果，有新提交时整体失效"""
+        version = self._db_signature()
+        with self._query_cache_lock:
+            if version != self._query_cache_version:
+                self._query_cache = {}
+                self._query_cache_version = version
+            elif version is not None and key in self._query_cache:
+                return self._query_cache[key]
+        result = loader()
+        with self._query_cache_lock:
+            if version == self._query_cache_version and version is not None:
+                self._query_cache[key] = result
+                while len(self._query_cache) > self.QUERY_CACHE_SIZE:
+                    self._query_cache.pop(next(iter(self._query_cache)))
         return result
 
     def _get_all_raw_data(self, table_name, limit=None, order_by=None):
         """
         通用获取数据方法 (优化版)
-        1. 使用只读连接 (不复制文件)
+        1. 使用连接池中的只读连接 (不复制文件)
         2. 自动遍历字段，解析 JSON 字符串
+        3. 结果按数据库版本缓存
         """
+        return self._cached_query(
+            ("raw", table_name, limit, order_by),
+            lambda: self._load_raw_data(table_name, limit, order_by)
+        )
+
+    def _load_raw_data(self, table_name, limit=None, order_by=None):
         result_list = []
-        conn = None
+        conn = self.db_pool.acquire()
+        if not conn: return []
+        broken = False
         try:
-            conn = self._create_ro_connection()
-            if not conn: return []
-            
             # 设置 row_factory 以便能像字典一样访问列名
             conn.row_factory = sqlite3.Row 
             cursor = conn.cursor()
@@ -1038,10 +3038,13 @@ class NeteaseV3Service:
                 
                 result_list.append(row_dict)
                 
+        except sqlite3.OperationalError as e:
+            print(f"[DB Error {table_name}] {e}")
         except Exception as e:
+            broken = True
             print(f"[DB Error {table_name}] {e}")
         finally:
-            if conn: conn.close()
+            self.db_pool.release(conn, broken)
             
         return result_list
 
@@ -1057,15 +3060,9 @@ class NeteaseV3Service:
         return self.current_full_data
 
     def search_db_for_id(self, target_id):
-        """遍历本地数据库查找指定 ID"""
-        rows = self._read_db_query("SELECT jsonStr FROM historyTracks ORDER BY playtime DESC LIMIT 100")
-        for row in rows:
-            try:
-                data = json.loads(row[0])
-                if int(data.get('id', 0)) == int(target_id):
-                    return data
-            except: continue
-        return None
+        """在本地曲目索引中查找指定 ID (数据库有变化时先增量刷新)"""
+        self.track_index.refresh()
+        return self.track_index.get(target_id)
 
     def get_track_hybrid(self, memory_duration):
         """
@@ -1088,93 +3085,338 @@ class NeteaseV3Service:
             except: pass
 
         # 2. 数据库没命中（可能是切歌了但文件还没写），尝试搜索
-        # 需要获取窗口标题
-        title = WindowUtils.get_netease_window_title()
+        # 需要获取窗口标题 (watcher 缓存的句柄，不再整体枚举窗口)
+        title = self.title_watcher.get_title()
         if title and title != "网易云音乐":
             print(f"[降级搜索] 内存指针失效且DB未更。标题: {title}")
-            search_data = SearchService.search_song_by_title(title, memory_duration)
+            search_data = self.title_resolver.resolve(
+                title, memory_duration,
+                # 本方法已运行在执行器任务中 (MetadataStage)：直接在当前线程搜索，不再向同一个池提交并阻塞等待，
+                # 否则所有 worker 都在等搜索任务时会互相卡死。失败以 UpstreamError 抛给 resolver，不会被记忆。
+                fallback=lambda: SearchService.search_song_by_title(title, memory_duration, client=self.client)
+            )
             if search_data:
                 return search_data
 
         return None
 
+    def get_cached_detail(self, song_id):
+        with self._detail_lock:
+            detail = self.detail_cache.get(int(song_id))
+            if detail is not None:
+                self.detail_cache.move_to_end(int(song_id))
+            return detail
+
+    def _store_detail(self, detail):
+        with self._detail_lock:
+            self.detail_cache[int(detail["id"])] = detail
+            self.detail_cache.move_to_end(int(detail["id"]))
+            while len(self.detail_cache) > self.DETAIL_CACHE_SIZE:
+                self.detail_cache.popitem(last=False)
+
     def get_song_detail_by_id(self, song_id):
-        """API 获取详情"""
+        """API 获取详情 (先查详情缓存；同一时间窗内的并发查询会合并为一次批量请求)"""
+        cached = self.get_cached_detail(song_id)
+        if cached:
+            return cached
         try:
-            url = f"http://music.163.com/api/song/detail/?id={song_id}&ids=[{song_id}]"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'http://music.163.com/'
-            }
-            resp = requests.get(url, headers=headers, timeout=3)
-            data = resp.json()
-            songs = data.get('songs', [])
-            if songs:
-                song = songs[0]
-                return {
-                    "id": song['id'],
-                    "name": song['name'],
-                    "duration": song['duration'],
-                    "artists": song['artists'], 
-                    "album": song['album']     
-                }
+            return self.detail_batcher.request(song_id).result(SongDetailBatcher.TIMEOUT * 2)
         except Exception as e:
             print(f"[API] Get Detail Error: {e}")
         return None
 
-    def get_history_list(self, limit=20):
-        """获取最近播放历史 (自动解析 JSON)"""
-        return self._get_all_raw_data("historyTracks", limit=limit, order_by="playtime DESC")
+    def get_cover_url(self, song_id):
+        """歌曲 ID -> 专辑封面 URL (详情缓存 / 本地索引 / playingList，都没有时查询详情)"""
+        song_id = int(song_id)
+        track = self.get_cached_detail(song_id) or self.track_index.get(song_id)
+        if not track:
+            track = next(
+                (item.get("track") for item in self.get_raw_playing_list() if str(item.get("id")) == str(song_id)),
+                None
+            )
+        album = (track or {}).get('album') or (track or {}).get('al') or {}
+        if not album.get('picUrl'):
+            detail = self.get_song_detail_by_id(song_id)
+            album = (detail or {}).get('album') or {}
+        return album.get('picUrl') or None
+
+    def get_song_details(self, song_ids):
+        """批量获取详情，返回 {song_id: 详情或 None}"""
+        return self.detail_batcher.resolve_many(song_ids)
+
+    def enrich_tracks(self, tracks):
+        """为缺少名称 / 歌手 / 封面的 playingList 记录补全元数据 (一次批量请求)"""
+        missing = [
+            item for item in tracks
+            if item.get("id") and not (
+                item.get("track", {}).get("name")
+                and item.get("track", {}).get("artists")
+                and item.get("track", {}).get("album", {}).get("picUrl")
+            )
+        ]
+        if not missing:
+            return tracks
+        details = self.get_song_details([item["id"] for item in missing])
+        for item in missing:
+            detail = details.get(int(item["id"]))
+            if not detail: continue
+            track = item.setdefault("track", {})
+            track["id"] = track.get("id") or detail["id"]
+            track["name"] = track.get("name") or detail["name"]
+            track["artists"] = track.get("artists") or [
+                {"id": a.get("id"), "name": a.get("name")} for a in detail["artists"]
+            ]
+            album = track.setdefault("album", {})
+            for field in ("id", "name", "picUrl"):
+                if not album.get(field) and detail["album"].get(field):
+                    album[field] = detail["album"][field]
+        return tracks
+
+    def _table_columns(self, table_name):
+        return self._cached_query(
+            ("columns", table_name),
+            lambda: [row[1] for row in self._read_db_query(f"PRAGMA table_info({table_name})")]
+        )
 
-    def get_playlist_list(self):
-        """获取用户歌单列表 (自动解析 JSON)"""
-        return self._get_all_raw_data("web_user_playlist")
+    def _json_schema(self, table_name, json_col):
+        """
+        JSON 列中出现过的字段路径 (嵌套 dict，途经数组时合并各元素的键)，按最近 SCHEMA_SAMPLE_ROWS 行推断；
+        结果按数据库版本缓存。表为空时返回 None (无从判断，不做校验)
+        """
+        def merge(schema, value):
+            if isinstance(value, dict):
+                for key, child in value.items():
+                    merge(schema.setdefault(key, {}), child)
+            elif isinstance(value, list):
+                for item in value:
+                    merge(schema, item)
+
+        def load():
+            rows = self._read_db_query(
+                f'SELECT "{json_col}" FROM {table_name} ORDER BY rowid DESC LIMIT ?', (self.SCHEMA_SAMPLE_ROWS,)
+            )
+            if not rows: return None
+            schema = {}
+            for (raw,) in rows:
+                try:
+                    merge(schema, json.loads(raw) if raw else None)
+                except (TypeError, ValueError):
+                    continue
+            return schema
+        return self._cached_query(("schema", table_name, json_col), load)
 
-    def get_raw_playing_list(self):
+    @staticmethod
+    def _known_path(schema, path):
+        node = schema
+        for key in path.split('.'):
+            if key not in node: return False
+            node = node[key]
+        return True
+
+    @staticmethod
+    def _extract_path(data, path):
+        """按 a.b.c 取值，途经数组时对每个元素取值 (如 artists.name)"""
+        node = data
+        for key in path.split('.'):
+            if isinstance(node, list):
+                node = [item.get(key) if isinstance(item, dict) else None for item in node]
+            elif isinstance(node, dict):
+                node = node.get(key)
+            else:
+                return None
+        return node
+
+    @staticmethod
+    def _parse_cursor(cursor, keyed):
+        """
+        游标格式：有排序列时为 "排序值:rowid" (排序值为 NULL 时写作 "null")，否则为 "rowid"；
+        非法游标视为从头开始
+        """
+        if not cursor: return None
+        try:
+            if keyed:
+                order_value, rowid = cursor.rsplit(':', 1)
+                if order_value == "null":
+                    return (None, int(rowid))
+                return (float(order_value) if '.' in order_value else int(order_value), int(rowid))
+            return (int(cursor),)
+        except ValueError:
+            return None
+
+    def query_page(self, table_name, fields=None, limit=None, cursor=None):
         """
-        获取原始的播放列表数据 (带缓存优化)
+        分页查询 (结果按数据库版本缓存)
+        fields: 列名或 JSON 列内的字段路径，只查询用到的列、只在需要时解码 JSON；为空时保持原始行格式
+        cursor: 上一页返回的 next_cursor (按排序列 + rowid 的键集分页)
         """
-        file_path = os.path.join(
-            os.environ['LOCALAPPDATA'], 
+        if limit is not None:
+            limit = max(1, min(int(limit), self.PAGE_LIMIT_MAX))
+        fields = tuple(fields) if fields else None
+        return self._cached_query(
+            ("page", table_name, fields, limit, cursor),
+            lambda: self._load_page(table_name, fields, limit, cursor)
+        )
+
+    def _load_page(self, table_name, fields, limit, cursor):
+        view = self.TABLE_VIEWS[table_name]
+        columns = self._table_columns(table_name)
+        if not columns:
+            return {"data": [], "next_cursor": None}
+        json_col = view["json_col"] if view["json_col"] in columns else None
+        order_col = view["order_col"] if view["order_col"] in columns else None
+
+        if fields:
+            col_fields = [f for f in fields if f in columns]
+            json_fields = [f for f in fields if f not in columns]
+            unknown = json_fields
+            if json_fields and json_col:
+                # JSON 路径与列名一样校验：数据中从未出现过的路径返回 400，而不是每行都给 null
+                schema = self._json_schema(table_name, json_col)
+                unknown = [f for f in json_fields if schema is not None and not self._known_path(schema, f)]
+            if unknown:
+                raise ValueError(f"未知字段: {', '.join(unknown)}")
+            select = list(col_fields)
+            if json_fields and json_col and json_col not in select:
+                select.append(json_col)
+        else:
+            col_fields, json_fields, select = None, None, list(columns)
+
+        sql = "SELECT " + ", ".join(f'"{c}"' for c in select) + ", rowid"
+        if order_col:
+            sql += f', "{order_col}"'
+        sql += f" FROM {table_name}"
+        params = []
+        position = self._parse_cursor(cursor, bool(order_col))
+        if position and order_col and position[0] is None:
+            # 倒序时 NULL 排在最后：游标已进入 NULL 段，只按 rowid 继续
+            sql += f' WHERE "{order_col}" IS NULL AND rowid < ?'
+            params = [position[1]]
+        elif position and order_col:
+            sql += f' WHERE ("{order_col}" < ? OR ("{order_col}" = ? AND rowid < ?) OR "{order_col}" IS NULL)'
+            params = [position[0], position[0], position[1]]
+        elif position:
+            sql += " WHERE rowid > ?"
+            params = [position[0]]
+        sql += f' ORDER BY "{order_col}" DESC, rowid DESC' if order_col else " ORDER BY rowid ASC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)    # 多取一行用于判断是否还有下一页
+
+        rows = self._read_db_query(sql, tuple(params))
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit] if limit is not None else rows
+
+        data = []
+        for row in rows:
+            values = dict(zip(select, row))
+            if fields is None:
+                # 未指定字段：保持原有格式 (原始列 + JSON 列的 *_parsed)
+                for key, val in list(values.items()):
+                    if isinstance(val, str) and len(val) > 1 and (val.startswith('{') or val.startswith('[')):
+                        try:
+                            values[f"{key}_parsed"] = json.loads(val)
+                        except ValueError:
+                            pass
+                data.append(values)
+                continue
+            item = {f: values[f] for f in col_fields}
+            if json_fields:
+                try:
+                    decoded = json.loads(values[json_col]) if json_col and values.get(json_col) else {}
+                except ValueError:
+                    decoded = {}
+                for f in json_fields:
+                    item[f] = self._extract_path(decoded, f)
+            data.append(item)
+
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            rowid = last[len(select)]
+            if order_col:
+                order_value = last[len(select) + 1]
+                next_cursor = f"{'null' if order_value is None else order_value}:{rowid}"
+            else:
+                next_cursor = str(rowid)
+        return {"data": data, "next_cursor": next_cursor}
+
+    def _playing_list_path(self):
+        return os.path.join(
+            os.environ.get('LOCALAPPDATA', ''),
             r"Netease\CloudMusic\webdata\file\playingList"
         )
-        
+
+    def get_raw_playing_list(self):
+        """
+        获取播放列表的精简记录 (带缓存优化)
+        1. mtime/size 未变 -> 直接返回缓存
+        2. mtime 变了但内容哈希未变 -> 跳过重新解析
+        3. 内容变化 -> 流式解析，只保留用到的字段
+        """
+        file_path = self._playing_list_path()
+
         if not os.path.exists(file_path):
             return []
 
         try:
-            # 检查文件修改时间
-            current_mtime = os.path.getmtime(file_path)
+            stat = os.stat(file_path)
+            signature = (stat.st_mtime, stat.st_size)
             # 如果文件没变，直接返回缓存，不再读盘
-            if current_mtime == self.playing_list_mtime and self.playing_list_cache:
+            if signature == self.playing_list_mtime:
                 return self.playing_list_cache
 
-            # 文件变了，重新读取
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if not content: return []
-                
-                root_data = json.loads(content)
-                result = []
-                
-                if isinstance(root_data, dict) and 'list' in root_data:
-                    result = root_data['list']
-                elif isinstance(root_data, list):
-                    result = root_data
-                
-                # 更新缓存
-                self.playing_list_cache = result
-                self.playing_list_mtime = current_mtime
-                # print(f"[列表更新] 检测到播放列表文件变更，已刷新缓存。数量: {len(result)}")
-                return result
-                
+            # mtime 变了，先比对内容哈希 (网易云经常原样重写文件)
+            digest = self._hash_file(file_path)
+            if digest == self.playing_list_digest:
+                self.playing_list_mtime = signature
+                return self.playing_list_cache
+
+            result = PlayingListParser.parse_file(file_path)
+
+            # 更新缓存
+            self.playing_list_cache = result
+            self.playing_list_mtime = signature
+            self.playing_list_digest = digest
+            # print(f"[列表更新] 检测到播放列表文件变更，已刷新缓存。数量: {len(result)}")
+            return result
+
         except Exception as e:
             print(f"[PlayingList Error] 读取失败: {e}")
             return self.playing_list_cache # 出错时返回旧缓存
-                
+
+    def playing_list_signature(self):
+        """playingList 文件签名 (mtime_ns, size)，文件不存在时返回 None；/queue 原始数据按它缓存编码结果"""
+        try:
+            stat = os.stat(self._playing_list_path())
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get_full_playing_list(self):
+        """读取完整的原始播放列表 (每次读盘解析；/queue 默认返回，编码结果由 response_cache 按文件签名缓存)"""
+        file_path = self._playing_list_path()
+        if not os.path.exists(file_path):
+            return []
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if not content: return []
+            root_data = json.loads(content)
+            if isinstance(root_data, dict) and 'list' in root_data:
+                return root_data['list']
+            if isinstance(root_data, list):
+                return root_data
         except Exception as e:
             print(f"[PlayingList Error] 读取失败: {e}")
-            return []
+        return []
+
+    @staticmethod
+    def _hash_file(file_path, chunk_size=1 << 16):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
         
     def get_playback_neighbors(self, current_id, mode):
         """根据当前模式和 playingList 文件预测上下曲"""
@@ -1225,23 +3467,256 @@ class NeteaseV3Service:
 # ===========================
 # 2. 歌词服务
 # ===========================
+class LyricTimeline:
+    """
+    歌词时间轴
+    行起始时间存放在紧凑的 array('d') 中，定位使用 bisect；
+    正常播放时游标 O(1) 前进，只有拖动进度 (回退/跳跃) 时才重新二分。
+    行结构: {"time", "text", "trans", 可选 "duration", 可选 "words": [{"time", "duration", "text"}]}
+    """
+    def __init__(self, lines=None):
+        self.lines = list(lines or [])
+        self.starts = array('d', (float(line["time"]) for line in self.lines))
+        self.word_starts = [
+            array('d', (float(w["time"]) for w in (line.get("words") or ())))
+            for line in self.lines
+        ]
+        self.cursor = -1
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _covers(self, idx, current_time):
+        """判断 current_time 是否落在第 idx 行 (idx=-1 表示第一行之前)"""
+        starts = self.starts
+        if idx >= 0 and current_time < starts[idx]:
+            return False
+        return idx + 1 >= len(starts) or current_time < starts[idx + 1]
+
+    def locate(self, current_time):
+        """返回当前行索引，第一行之前返回 -1"""
+        if not self.starts:
+            return -1
+
+        idx = self.cursor
+        if not self._covers(idx, current_time):
+            # 顺序播放：通常只前进一行
+            if idx + 1 < len(self.starts) and self._covers(idx + 1, current_time):
+                idx += 1
+            else:
+                # 拖动进度：退回二分查找
+                idx = bisect.bisect_right(self.starts, current_time) - 1
+        self.cursor = idx
+        return idx
+
+    def next_boundary(self, idx):
+        """下一行的起始时间，没有下一行返回 None"""
+        if idx + 1 < len(self.starts):
+            return self.starts[idx + 1]
+        return None
+
+    def position(self, current_time):
+        """
+        返回当前行索引、下一个边界时间以及行内逐字进度
+        word_index / word_progress 仅在有逐字歌词时有效，否则为 -1 / 0
+        """
+        idx = self.locate(current_time)
+        result = {
+            "index": idx,
+            "next_time": self.next_boundary(idx),
+            "line_progress": 0.0,
+            "word_index": -1,
+            "word_progress": 0.0
+        }
+        if idx < 0:
+            return result
+
+        line = self.lines[idx]
+        line_start = self.starts[idx]
+        line_end = line_start + line["duration"] if line.get("duration") else result["next_time"]
+        if line_end and line_end > line_start:
+            result["line_progress"] = min(max((current_time - line_start) / (line_end - line_start), 0.0), 1.0)
+
+        word_starts = self.word_starts[idx]
+        if word_starts:
+            w_idx = bisect.bisect_right(word_starts, current_time) - 1
+            result["word_index"] = w_idx
+            if w_idx >= 0:
+                duration = line["words"][w_idx].get("duration") or 0
+                if duration > 0:
+                    result["word_progress"] = min((current_time - word_starts[w_idx]) / duration, 1.0)
+                else:
+                    result["word_progress"] = 1.0
+        return result
+
+class LyricCacheStore:
+    """
+    歌词持久化缓存 (数据目录下的 SQLite 旁路文件，open() 之前不落盘)
+    按歌曲 ID 保存原始歌词包与预解析时间轴；总大小超过上限时按最近访问时间淘汰，
+    超过 TTL 的条目仍可命中，但会由调用方在后台刷新。
+    """
+    MAX_BYTES = 64 * 1024 * 1024
+    TTL = 7 * 24 * 3600
+    EVICT_TARGET_RATIO = 0.9   # 淘汰到上限的 90%，避免每次写入都触发淘汰
+
+    def __init__(self, db_path=None, max_bytes=None, ttl=None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.ttl = ttl if ttl is not None else self.TTL
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def open(self):
+        """打开缓存库 (未指定路径时放在数据目录下)；失败时缓存保持禁用"""
+        if self._conn is not None: return
+        self.db_path = self.db_path or data_path("lyric_cache.db")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=1, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lyrics ("
+                "song_id INTEGER PRIMARY KEY, packet TEXT NOT NULL, lines TEXT NOT NULL, "
+                "size INTEGER NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lyrics_accessed ON lyrics(accessed_at)")
+            self._conn.commit()
+        except Exception as e:
+            print(f"[LyricCache] 打开缓存失败，已禁用: {e}")
+            self._conn = None
+
+    def get(self, song_id):
+        """命中返回 {"packet", "lines", "fetched_at", "stale"}，否则返回 None"""
+        if not self._conn: return None
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT packet, lines, fetched_at FROM lyrics WHERE song_id = ?", (int(song_id),)
+                ).fetchone()
+                if not row: return None
+                self._conn.execute(
+                    "UPDATE lyrics SET accessed_at = ? WHERE song_id = ?", (time.time(), int(song_id))
+                )
+                self._conn.commit()
+            return {
+                "packet": json.loads(row[0]),
+                "lines": json.loads(row[1]),
+                "fetched_at": row[2],
+                "stale": time.time() - row[2] > self.ttl
+            }
+        except Exception as e:
+            print(f"[LyricCache] 读取失败: {e}")
+            return None
+
+    def contains(self, song_id):
+        """是否有未过期的条目 (不更新访问时间，供预取/统计判断)"""
+        if not self._conn: return False
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT fetched_at FROM lyrics WHERE song_id = ?", (int(song_id),)
+                ).fetchone()
+            return bool(row) and time.time() - row[0] <= self.ttl
+        except Exception:
+            return False
+
+    def put(self, song_id, packet, lines):
+        if not self._conn: return
+        try:
+            packet_json = json.dumps(packet, ensure_ascii=False)
+            lines_json = json.dumps(lines, ensure_ascii=False)
+            size = len(packet_json.encode('utf-8')) + len(lines_json.encode('utf-8'))
+            now = time.time()
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO lyrics (song_id, packet, lines, size, fetched_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (int(song_id), packet_json, lines_json, size, now, now)
+                )
+                self._evict()
+                self._conn.commit()
+        except Exception as e:
+            print(f"[LyricCache] 写入失败: {e}")
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小回到上限以内 (调用方持锁)"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM lyrics").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * self.EVICT_TARGET_RATIO
+        victims = []
+        for song_id, size in self._conn.execute("SELECT song_id, size FROM lyrics ORDER BY accessed_at ASC"):
+            if total <= target:
+                break
+            victims.append((song_id,))
+            total -= size
+        self._conn.executemany("DELETE FROM lyrics WHERE song_id = ?", victims)
+
+    def stats(self):
+        if not self._conn: return {"enabled": False}
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lyrics").fetchone()
+        return {"enabled": True, "entries": count, "bytes": size, "max_bytes": self.max_bytes}
+
 class LyricService:
-    def __init__(self):
+    # 与前端一致的文本归一化 (去掉标点空白，只保留文字)
+    NORMALIZE_PATTERN = re.compile(r'[^\w\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]')
+    YRC_LINE_PATTERN = re.compile(r'^\[(\d+),(\d+)\](.*)')
+    YRC_WORD_PATTERN = re.compile(r'\((\d+),(\d+),(\d+)\)([^(]+)')
+    TRANS_TOLERANCE = 0.2     # 翻译/罗马音与原文的时间对齐容差 (秒)
+    YRC_TIME_TOLERANCE = 1.5  # 逐字行按文本对不上时，按时间就近对齐的容差 (秒)
+
+    def __init__(self, cache=None, client=None, executor=None):
+        self.cache = cache
+        self.client = client or UpstreamClient.default()
+        self.executor = executor or JobExecutor.default()
+        self.tracer = SongChangeTracer.default()
         self.current_id = None
-        self.is_loading = False
-        self.parsed_list = [] 
+        # 歌词包每次变化 (切歌 / 加载完成 / 清空) 都换一个新版本号，供响应缓存判断是否失效
+        self._versions = itertools.count(1)
+        self.version = next(self._versions)
+        self.timeline = LyricTimeline()
         self.lyric_packet = {
             "id": 0, "hasLyric": False, "hasTrans": False, "hasRoma": False, "hasYrc": False,
             "lrc": "", "tlyric": "", "romalrc": "", "yrc": ""
         }
+        self.timeline_packet = self._empty_timeline_packet(0)
+
+    @property
+    def is_loading(self):
+        return self.current_id is not None and self.executor.is_pending(("lyric", self.current_id))
+
+    @staticmethod
+    def _empty_timeline_packet(song_id):
+        return {
+            "id": song_id, "hasLyric": False, "hasTrans": False, "hasRoma": False, "hasYrc": False,
+            "lines": []
+        }
 
     def load_lyrics(self, song_id):
         if song_id == self.current_id: return
         self.current_id = song_id
-        self.parsed_list = []
+        self.timeline = LyricTimeline()
         self.lyric_packet = {k: (False if "has" in k else "") for k in self.lyric_packet}
         self.lyric_packet["id"] = song_id
-        threading.Thread(target=self._fetch_lyrics, args=(song_id,), daemon=True).start()
+        self.timeline_packet = self._empty_timeline_packet(song_id)
+        self.version = next(self._versions)
+        # 切歌后，排队中的旧歌词任务全部作废
+        self.executor.bump("lyric")
+
+        # 命中本地缓存时同步应用，当前 tick 内即可显示歌词
+        with self.tracer.span(song_id, "lyrics_cache"):
+            cached = self.cache.get(song_id) if self.cache else None
+        if cached:
+            self._apply_lyrics(song_id, cached["packet"], cached["lines"])
+            if not cached["stale"]: return
+            # 过期条目先照常显示，再在后台刷新
+
+        self.executor.submit(
+            self._fetch_lyrics, song_id, time.perf_counter(),
+            key=("lyric", song_id), group="lyric", priority=JobExecutor.PRIORITY_HIGH
+        )
 
     def _parse_lrc_text(self, lrc_content):
         """解析标准 LRC 用于内部计时 (兼容 [mm:ss:xx] 格式)"""
@@ -1249,8 +3724,8 @@ class LyricService:
         if not lrc_content: return res
         
         # 【关键修改】正则兼容冒号和点号作为毫秒分隔符
-        # 匹配: [00:00] 或 [00:00.00] 或 [00:00:00]
-        pattern = re.compile(r'\[(\d{2}):(\d{2})(?:[\.:](\d+))?\](.*)')
+        # 匹配: [00:00] 或 [00:00.00] 或 [00:00:00] 或 [0:00.123]
+        pattern = re.compile(r'\[(\d+):(\d{2})(?:[\.:](\d+))?\](.*)')
         
         for line in lrc_content.split('\n'):
             match = pattern.search(line)
@@ -1267,6 +3742,8 @@ class LyricService:
                     ms_val = int(ms_str) / 100.0
                 elif len(ms_str) == 3:
                     ms_val = int(ms_str) / 1000.0
+                elif len(ms_str) > 3:
+                    ms_val = int(ms_str) / (10 ** len(ms_str))
                 else:
                     ms_val = 0.0
                 
@@ -1275,63 +3752,1027 @@ class LyricService:
                 if content: res[t] = content
         return res
 
-    def _fetch_lyrics(self, target_song_id):
-        self.is_loading = True
+    def _parse_yrc_text(self, yrc_content):
+        """解析逐字歌词 [行起始,行时长](字起始,字时长,0)字 ... (时间均为绝对毫秒)"""
+        result = []
+        if not yrc_content: return result
+
+        for line in yrc_content.split('\n'):
+            match = self.YRC_LINE_PATTERN.match(line)
+            if not match: continue # 跳过 {"t":..,"c":[..]} 这类元信息行
+            words = []
+            for w in self.YRC_WORD_PATTERN.finditer(match.group(3)):
+                words.append({
+                    "time": int(w.group(1)) / 1000.0,
+                    "duration": int(w.group(2)) / 1000.0,
+                    "text": w.group(4)
+                })
+            full_text = "".join(w["text"] for w in words)
+            if full_text:
+                result.append({
+                    "time": int(match.group(1)) / 1000.0,
+                    "duration": int(match.group(2)) / 1000.0,
+                    "text": full_text,
+                    "words": words
+                })
+        return result
+
+    def _normalize_text(self, text):
+        return self.NORMALIZE_PATTERN.sub('', text or '').lower()
+
+    @staticmethod
+    def _nearest_index(times, t, tolerance):
+        """在有序时间数组中找离 t 最近且差值小于 tolerance 的下标"""
+        pos = bisect.bisect_left(times, t)
+        best = None
+        for idx in (pos - 1, pos):
+            if 0 <= idx < len(times):
+                diff = abs(times[idx] - t)
+                if diff < tolerance and (best is None or diff < abs(times[best] - t)):
+                    best = idx
+        return best
+
+    def build_timeline_lines(self, raw_lrc, raw_trans, raw_roma, raw_yrc):
+        """
+        生成预计算的歌词时间轴
+        有逐字歌词时以 YRC 行为主，按归一化文本 (其次按时间) 对齐到 LRC 行取翻译/罗马音
+        """
+        ori_dict = self._parse_lrc_text(raw_lrc)
+        aux = []
+        for raw in (raw_trans, raw_roma):
+            parsed = self._parse_lrc_text(raw)
+            times = sorted(parsed.keys())
+            aux.append((times, [parsed[t] for t in times]))
+
+        lrc_times = sorted(ori_dict.keys())
+        lrc_lines = []
+        for t in lrc_times:
+            extra = []
+            for times, texts in aux:
+                idx = self._nearest_index(times, t, self.TRANS_TOLERANCE)
+                extra.append(texts[idx] if idx is not None else "")
+            lrc_lines.append({
+                "time": t, "duration": 0, "text": ori_dict[t],
+                "trans": extra[0], "roma": extra[1], "words": [], "isYrc": False
+            })
+
+        yrc_lines = self._parse_yrc_text(raw_yrc)
+        if not yrc_lines:
+            return lrc_lines
+
+        by_text = {}
+        for idx, line in enumerate(lrc_lines):
+            key = self._normalize_text(line["text"])
+            if key:
+                by_text.setdefault(key, []).append(idx)
+
+        merged = []
+        for y_line in yrc_lines:
+            candidates = by_text.get(self._normalize_text(y_line["text"]))
+            if candidates:
+                match_idx = min(candidates, key=lambda i: abs(lrc_lines[i]["time"] - y_line["time"]))
+            else:
+                match_idx = self._nearest_index(lrc_times, y_line["time"], self.YRC_TIME_TOLERANCE)
+            match = lrc_lines[match_idx] if match_idx is not None else None
+            y_line["trans"] = match["trans"] if match else ""
+            y_line["roma"] = match["roma"] if match else ""
+            y_line["isYrc"] = True
+            merged.append(y_line)
+        return merged
+
+    def _download_lyrics(self, target_song_id):
+        """请求歌词接口并解析，返回 (packet, lines)，同时写入持久化缓存"""
+        with self.tracer.span(target_song_id, "lyrics_fetch"):
+            resp = self.client.request_json(
+                "lyric", "/api/song/lyric",
+                params={"id": target_song_id, "cp": "false", "lv": 0, "kv": 0, "tv": 0, "rv": 0, "yv": 0, "ytv": 0, "yrv": 0},
+                timeout=5,
+                # 限流 / 错误响应 (如 {"code": -460}) 不是“没有歌词”，不能写进 7 天的持久化缓存
+                validate=lambda d: d.get("code") == 200
+            )
+        if resp is None:
+            raise UpstreamError("歌词接口返回异常")
+
+        raw_lrc = resp.get('lrc', {}).get('lyric', "")
+        raw_trans = resp.get('tlyric', {}).get('lyric', "")
+        raw_roma = resp.get('romalrc', {}).get('lyric', "")
+        raw_yrc = resp.get('yrc', {}).get('lyric', "")
+        if not raw_yrc: raw_yrc = resp.get('klyric', {}).get('lyric', "")
+
+        packet = {
+            "id": target_song_id,
+            "hasLyric": bool(raw_lrc), "hasTrans": bool(raw_trans), "hasRoma": bool(raw_roma), "hasYrc": bool(raw_yrc),
+            "lrc": raw_lrc, "tlyric": raw_trans, "romalrc": raw_roma, "yrc": raw_yrc
+        }
+        with self.tracer.span(target_song_id, "lyrics_parse"):
+            lines = self.build_timeline_lines(raw_lrc, raw_trans, raw_roma, raw_yrc)
+
+        # 即使已经切歌也写入缓存，下次播放时直接命中
+        if self.cache: self.cache.put(target_song_id, packet, lines)
+        return packet, lines
+
+    def _fetch_lyrics(self, target_song_id, queued_at=None):
+        if queued_at: self.tracer.record(target_song_id, "lyrics_queued", queued_at)
+        try:
+            packet, lines = self._download_lyrics(target_song_id)
+            self._apply_lyrics(target_song_id, packet, lines)
+        except Exception as e: print(f"Lyric Error: {e}")
+
+    def is_cached(self, song_id):
+        return bool(self.cache) and self.cache.contains(song_id)
+
+    def prefetch(self, song_id):
+        """预热指定歌曲的歌词缓存 (不影响当前显示)，返回是否发起了网络请求"""
+        if not self.cache or not song_id or self.cache.contains(song_id):
+            return False
+        self._download_lyrics(song_id)
+        return True
+
+    def _apply_lyrics(self, target_song_id, packet, lines):
+        """发布歌词包与时间轴 (仅当仍是当前歌曲时)"""
+        started = time.perf_counter()
+        flags = {k: packet.get(k, False) for k in ("hasLyric", "hasTrans", "hasRoma", "hasYrc")}
+        timeline = LyricTimeline(lines)
+        with state_lock:
+            if target_song_id != self.current_id: return
+            self.lyric_packet = packet
+            self.timeline_packet = {"id": target_song_id, **flags, "lines": lines}
+            self.timeline = timeline
+            self.version = next(self._versions)
+        self.tracer.record(target_song_id, "lyrics_publish", started, lines=len(lines))
+        self.tracer.mark(target_song_id, "lyrics")
+
+    def get_current_line(self, current_time):
+        timeline = self.timeline
+        idx = timeline.locate(current_time)
+        if idx < 0: return "", ""
+        item = timeline.lines[idx]
+        return item['text'], item['trans']
+
+    def get_position(self, current_time):
+        """当前行索引、文本、下一行边界与逐字进度"""
+        timeline = self.timeline
+        result = timeline.position(current_time)
+        if result["index"] >= 0:
+            item = timeline.lines[result["index"]]
+            result["text"], result["trans"] = item["text"], item["trans"]
+        else:
+            result["text"], result["trans"] = "", ""
+        return result
+
+    def get_full_packet(self):
+        return self.lyric_packet
+
+    def get_timeline_packet(self):
+        return self.timeline_packet
+    
+    def clear(self):
+        self.executor.bump("lyric")
+        self.current_id = None
+        self.timeline = LyricTimeline()
+        self.lyric_packet = {k: (False if "has" in k else "") for k in self.lyric_packet}
+        self.timeline_packet = self._empty_timeline_packet(0)
+        self.version = next(self._versions)
+
+# ===========================
+# 2.5 封面缓存与邻居预取
+# ===========================
+class CoverCache:
+    """封面图片内存缓存 (按 URL 存原始字节，按总大小 LRU 淘汰)"""
+    MAX_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, max_bytes=None, client=None):
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.client = client or UpstreamClient.default()
+        self._items = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def contains(self, url):
+        with self._lock:
+            return url in self._items
+
+    def get(self, url):
+        with self._lock:
+            data = self._items.get(url)
+            if data is not None:
+                self._items.move_to_end(url)
+            return data
+
+    def put(self, url, data):
+        with self._lock:
+            old = self._items.pop(url, None)
+            if old is not None:
+                self._total -= len(old)
+            self._items[url] = data
+            self._total += len(data)
+            while self._total > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._total -= len(evicted)
+
+    def fetch(self, url, timeout=5):
+        """命中直接返回，否则下载并缓存；失败返回 None"""
+        if not url: return None
+        data = self.get(url)
+        if data is not None:
+            return data
+        try:
+            content = self.client.request_bytes("cover", url, timeout=timeout)
+            if content is None:
+                return None
+            self.put(url, content)
+            return content
+        except Exception as e:
+            print(f"[Cover] 下载失败: {e}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._total, "max_bytes": self.max_bytes}
+
+class CoverStore:
+    """
+    封面磁盘缓存 (数据目录下的 cover_cache/；open() 之前只用内存层)
+    原图与各尺寸缩略图各存一份，内存层复用 CoverCache (缩略图以 CDN 尺寸参数 URL 为键)；
+    有 Pillow 时本地缩放并计算配色，否则缩放交给 CDN 的 ?param=NyN 参数。
+    """
+    SIZES = (64, 128, 256, 512, 1024)
+    MAX_AGE = 365 * 24 * 3600
+    MAX_BYTES = 256 * 1024 * 1024
+    PRUNE_EVERY = 50          # 每写入 N 个文件检查一次目录总大小
+    PALETTE_COLORS = 8
+
+    def __init__(self, cover_cache, directory=None, max_bytes=None):
+        self.cover_cache = cover_cache
+        self.directory = directory
+        self.available = False
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.palettes = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "generated": 0, "palettes": 0, "errors": 0}
+
+    def open(self):
+        """创建磁盘缓存目录 (未指定时放在数据目录下)"""
+        self.directory = self.directory or data_path("cover_cache")
         try:
-            url = (
-                f"http://music.163.com/api/song/lyric?id={target_song_id}"
-                f"&cp=false&lv=0&kv=0&tv=0&rv=0&yv=0&ytv=0&yrv=0"
+            os.makedirs(self.directory, exist_ok=True)
+            self.available = True
+        except OSError as e:
+            print(f"[Cover] 磁盘缓存不可用，只使用内存缓存: {e}")
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+
+    @classmethod
+    def normalize_size(cls, size):
+        """按档位向上取整，0/None 表示原图"""
+        if not size or size <= 0:
+            return 0
+        return next((s for s in cls.SIZES if s >= size), cls.SIZES[-1])
+
+    def etag(self, url, size):
+        return f'"{self._key(url)}-{size}"'
+
+    @staticmethod
+    def _variant_url(url, size):
+        if not size: return url
+        return f"{url}{'&' if '?' in url else '?'}param={size}y{size}"
+
+    @staticmethod
+    def mimetype(data):
+        if data[:8] == b'\x89PNG\r\n\x1a\n': return 'image/png'
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP': return 'image/webp'
+        if data[:3] == b'GIF': return 'image/gif'
+        return 'image/jpeg'
+
+    def _path(self, url, suffix):
+        if not self.available: return None
+        return os.path.join(self.directory, f"{self._key(url)}_{suffix}")
+
+    def _read(self, path):
+        if path is None: return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, path, data):
+        if path is None: return
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[Cover] 写入磁盘缓存失败: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.PRUNE_EVERY == 0
+        if should_prune:
+            self._prune()
+
+    def _prune(self):
+        """目录超过上限时按写入时间删除最旧的文件"""
+        try:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file():
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes: break
+                os.remove(path)
+                total -= size
+        except OSError as e:
+            print(f"[Cover] 清理磁盘缓存失败: {e}")
+
+    def _resize(self, data, size):
+        img = Image.open(io.BytesIO(data))
+        img = img.convert('RGB')
+        img.thumbnail((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=88, optimize=True)
+        return out.getvalue()
+
+    def get_image(self, url, size=0):
+        """返回指定尺寸的封面字节 (内存 -> 磁盘 -> 生成)，失败返回 None"""
+        variant_url = self._variant_url(url, size)
+        data = self.cover_cache.get(variant_url)
+        if data is not None:
+            self.metrics["memory_hits"] += 1
+            return data
+
+        path = self._path(url, size)
+        data = self._read(path)
+        if data is not None:
+            self.metrics["disk_hits"] += 1
+            self.cover_cache.put(variant_url, data)
+            return data
+
+        try:
+            if size and Image is not None:
+                original = self.get_image(url, 0)
+                if original is None: return None
+                data = self._resize(original, size)
+                self.cover_cache.put(variant_url, data)
+            else:
+                data = self.cover_cache.fetch(variant_url)
+        except Exception as e:
+            self.metrics["errors"] += 1
+            print(f"[Cover] 生成封面失败: {e}")
+            return None
+        if data is None:
+            return None
+        self.metrics["generated"] += 1
+        self._write(path, data)
+        return data
+
+    @staticmethod
+    def _hex(rgb):
+        return "#{:02x}{:02x}{:02x}".format(*rgb)
+
+    def _compute_palette(self, data):
+        img = Image.open(io.BytesIO(data)).convert('RGB')
+        img.thumbnail((64, 64))
+        quantized = img.quantize(colors=self.PALETTE_COLORS)
+        raw = quantized.getpalette()
+        counts = sorted(quantized.getcolors(), reverse=True)
+        total = float(sum(count for count, _ in counts)) or 1.0
+        colors = [(count / total, tuple(raw[idx * 3: idx * 3 + 3])) for count, idx in counts]
+
+        dominant = colors[0][1]
+        dom_hsv = colorsys.rgb_to_hsv(*[c / 255.0 for c in dominant])
+        # 强调色：占比不可太小，偏好饱和、明亮且与主色色相拉开距离的颜色
+        accent, best = dominant, -1.0
+        for ratio, rgb in colors[1:]:
+            if ratio < 0.03: continue
+            h, sat, val = colorsys.rgb_to_hsv(*[c / 255.0 for c in rgb])
+            hue_gap = min(abs(h - dom_hsv[0]), 1 - abs(h - dom_hsv[0]))
+            score = sat * val * (0.5 + hue_gap) * (0.5 + ratio)
+            if score > best:
+                accent, best = rgb, score
+
+        return {
+            "dominant": self._hex(dominant),
+            "accent": self._hex(accent),
+            "dominant_rgb": list(dominant),
+            "accent_rgb": list(accent),
+            "colors": [{"hex": self._hex(rgb), "ratio": round(ratio, 4)} for ratio, rgb in colors]
+        }
+
+    def get_palette(self, url):
+        """主色与强调色 (每张图只计算一次，结果落盘)；未安装 Pillow 时返回 None"""
+        with self._lock:
+            cached = self.palettes.get(url)
+        if cached is not None:
+            return cached
+        path = self._path(url, "palette.json")
+        raw = self._read(path)
+        palette = None
+        if raw is not None:
+            try: palette = json.loads(raw)
+            except ValueError: palette = None
+        if palette is None:
+            if Image is None:
+                return None
+            data = self.get_image(url, 0)
+            if data is None:
+                return None
+            try:
+                palette = self._compute_palette(data)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                print(f"[Cover] 配色计算失败: {e}")
+                return None
+            self.metrics["palettes"] += 1
+            self._write(path, json.dumps(palette).encode('utf-8'))
+        with self._lock:
+            self.palettes[url] = palette
+            while len(self.palettes) > 512:
+                self.palettes.popitem(last=False)
+        return palette
+
+    def stats(self):
+        result = dict(self.metrics)
+        result["pillow"] = Image is not None
+        result["directory"] = self.directory
+        return result
+
+class PrefetchService:
+    """
+    邻居预取
+    根据 get_playback_neighbors 的预测，在后台预热下一首 (其次上一首) 的歌词、歌曲详情与封面；
+    预测变化时推进 "prefetch" 分组的代数，排队中和执行到一半的旧任务都会被放弃。
+    """
+    MAX_PENDING = 2   # 预算：同一时刻最多排队的歌曲数
+
+    def __init__(self, v3, lrc_svc, cover_cache, executor=None):
+        self.v3 = v3
+        self.lrc_svc = lrc_svc
+        self.cover_cache = cover_cache
+        self.executor = executor or JobExecutor.default()
+        self._lock = threading.Lock()
+        self._prediction = ()
+        self._pending = {}  # song_id -> Job
+        self._covers = {}   # song_id -> 封面 URL (来自 playingList 预测)
+        self.metrics = {
+            "predictions": 0,
+            "prefetched": 0,
+            "cancelled": 0,
+            "errors": 0,
+            "switches": 0,
+            "hot_switches": 0,
+            "lyrics_hot": 0,
+            "meta_hot": 0,
+            "cover_hot": 0
+        }
+
+    def update_prediction(self, prev_track, next_track):
+        """每个 tick 调用；预测未变化时只做一次元组比较"""
+        tracks = [t for t in (next_track, prev_track) if t and t.get("id")]
+        prediction = tuple(t["id"] for t in tracks)
+        if prediction == self._prediction:
+            return
+
+        with self._lock:
+            self._prediction = prediction
+            self.executor.bump("prefetch")
+            self.metrics["predictions"] += 1
+            self.metrics["cancelled"] += sum(1 for job in self._pending.values() if not job.future.done())
+            self._pending = {}
+            for track in tracks[:self.MAX_PENDING]:
+                if track["id"] in self._pending: continue # 单曲循环时上下曲相同
+                self._covers[track["id"]] = track.get("cover") or ""
+                self._pending[track["id"]] = self.executor.submit(
+                    self._warm, track,
+                    key=("prefetch", track["id"]), group="prefetch", priority=JobExecutor.PRIORITY_LOW
+                )
+            if len(self._covers) > 64:
+                self._covers = {k: v for k, v in self._covers.items() if k in self._pending}
+
+    def _warm(self, track):
+        song_id = track["id"]
+        generation = self.executor.generation("prefetch")
+        stages = (
+            lambda: self.lrc_svc.prefetch(song_id),
+            lambda: self.v3.search_db_for_id(song_id) or self.v3.get_song_detail_by_id(song_id),
+            lambda: self.cover_cache.fetch(track.get("cover"))
+        )
+        for stage in stages:
+            if self.executor.generation("prefetch") != generation:
+                return
+            try:
+                stage()
+            except Exception as e:
+                self.metrics["errors"] += 1
+                print(f"[Prefetch] 预取失败 ({song_id}): {e}")
+        self.metrics["prefetched"] += 1
+
+    def record_switch(self, song_id, meta_hot):
+        """切歌时调用 (在请求歌词/详情之前)，统计这次切歌是否全部命中已预热的缓存"""
+        if not song_id: return
+        cover_url = self._covers.get(song_id)
+        lyrics_hot = self.lrc_svc.is_cached(song_id)
+        cover_hot = bool(cover_url) and self.cover_cache.contains(cover_url)
+        self.metrics["switches"] += 1
+        self.metrics["lyrics_hot"] += int(lyrics_hot)
+        self.metrics["meta_hot"] += int(meta_hot)
+        self.metrics["cover_hot"] += int(cover_hot)
+        if lyrics_hot and meta_hot and cover_hot:
+            self.metrics["hot_switches"] += 1
+
+    def get_metrics(self):
+        result = dict(self.metrics)
+        switches = result["switches"]
+        result["hit_rate"] = round(result["hot_switches"] / switches, 4) if switches else 0.0
+        result["pending"] = sum(1 for job in list(self._pending.values()) if not job.future.done())
+        result["prediction"] = list(self._prediction)
+        result["cover_cache"] = self.cover_cache.stats()
+        return result
+
+# ===========================
+# 2.6 播放事件日志与听歌统计
+# ===========================
+class SessionJournal:
+    """
+    播放事件日志 (数据目录下的 journal/，按大小切分的 JSON Lines 段文件，只追加；open() 之前事件只留在内存缓冲)
+    监控线程只把事件放进内存环形缓冲 (O(1)，不做磁盘 IO)，由后台线程按批写入；不逐条 fsync。
+    缓冲写满 (后台线程长时间停滞) 时丢弃最旧的事件并计数。
+    """
+    RING_SIZE = 4096
+    FLUSH_INTERVAL = 2.0
+    FLUSH_BATCH = 256
+    SEGMENT_BYTES = 1024 * 1024
+    MAX_SEGMENTS = 64
+    QUERY_LIMIT_MAX = 5000
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.available = False
+        self._ring = deque(maxlen=self.RING_SIZE)
+        self._flush_lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._segment = None
+        self.metrics = {"appended": 0, "flushed": 0, "dropped": 0, "flushes": 0, "segments_rotated": 0}
+
+    def append(self, event_type, **fields):
+        if len(self._ring) == self.RING_SIZE:
+            self.metrics["dropped"] += 1
+        fields["ts"] = round(time.time(), 3)
+        fields["type"] = event_type
+        self._ring.append(fields)
+        self.metrics["appended"] += 1
+        if len(self._ring) >= self.FLUSH_BATCH:
+            self._wake_event.set()
+
+    def open(self):
+        """创建日志目录 (未指定时放在数据目录下)"""
+        self.directory = self.directory or data_path("journal")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.available = True
+        except OSError as e:
+            print(f"[Journal] 日志目录不可用，事件只保留在内存: {e}")
+
+    def _segments(self):
+        """[(起始时间, 路径)]，按时间排序"""
+        if not self.available: return []
+        result = []
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".jsonl"):
+                try:
+                    result.append((int(name[8:-6]) / 1000.0, os.path.join(self.directory, name)))
+                except ValueError:
+                    continue
+        return sorted(result)
+
+    def _current_segment(self, first_ts):
+        if self._segment and os.path.exists(self._segment) and os.path.getsize(self._segment) < self.SEGMENT_BYTES:
+            return self._segment
+        if self._segment:
+            self.metrics["segments_rotated"] += 1
+        segments = self._segments()
+        if not self._segment and segments and os.path.getsize(segments[-1][1]) < self.SEGMENT_BYTES:
+            # 重启后继续写最后一个未满的段
+            self._segment = segments[-1][1]
+            return self._segment
+        self._segment = os.path.join(self.directory, f"segment-{int(first_ts * 1000)}.jsonl")
+        for _, old in segments[:max(0, len(segments) + 1 - self.MAX_SEGMENTS)]:
+            try: os.remove(old)
+            except OSError: pass
+        return self._segment
+
+    def flush(self):
+        """把缓冲中的事件批量追加到当前段文件"""
+        if not self.available: return 0
+        with self._flush_lock:
+            batch = []
+            while self._ring:
+                try:
+                    batch.append(self._ring.popleft())
+                except IndexError:
+                    break
+            if not batch: return 0
+            try:
+                path = self._current_segment(batch[0]["ts"])
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch))
+            except OSError as e:
+                print(f"[Journal] 写入失败: {e}")
+                self._ring.extendleft(reversed(batch))
+                return 0
+            self.metrics["flushed"] += len(batch)
+            self.metrics["flushes"] += 1
+            return len(batch)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.FLUSH_INTERVAL)
+            self._wake_event.clear()
+            self.flush()
+        self.flush()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="session-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def query(self, since=None, until=None, event_type=None, song_id=None, limit=1000):
+        """按时间范围查询 (只读取与范围重叠的段文件，再加上尚未落盘的事件)"""
+        since = since if since is not None else 0.0
+        until = until if until is not None else float('inf')
+        limit = max(1, min(int(limit), self.QUERY_LIMIT_MAX))
+
+        def match(event):
+            return (since <= event.get("ts", 0) <= until
+                    and (event_type is None or event.get("type") == event_type)
+                    and (song_id is None or event.get("song_id") == song_id))
+
+        result = []
+        with self._flush_lock:
+            segments = self._segments()
+            for i, (start, path) in enumerate(segments):
+                end = segments[i + 1][0] if i + 1 < len(segments) else float('inf')
+                if end < since or start > until: continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            try: event = json.loads(line)
+                            except ValueError: continue
+                            if match(event):
+                                result.append(event)
+                                if len(result) >= limit: return result
+                except OSError:
+                    continue
+            pending = list(self._ring)
+        result += [e for e in pending if match(e)][:limit - len(result)]
+        return result
+
+    def stats(self):
+        result = dict(self.metrics)
+        result["buffered"] = len(self._ring)
+        result["segments"] = len(self._segments())
+        return result
+
+class PlaySessionTracker:
+    """
+    按 tick 跟踪当前歌曲的播放会话
+    - 累计实际收听时长 (只计进度正常前进的部分，拖动与暂停不计)
+    - 传入 journal 时记录 song_start / seek / pause / resume / song_end 事件
+    - 单曲循环时同一首歌从结尾跳回开头，按 song_end + song_start 记为新的一次播放
+    """
+    MAX_STEP = 1.5      # 单个 tick 的进度增量上限，超过视为拖动
+    BACK_STEP = -0.5    # 进度回退超过该值视为向后拖动
+    LOOP_TAIL = 3.0     # 从距结尾该秒数以内
+    LOOP_HEAD = 3.0     # 跳回开头该秒数以内，视为循环重播
+    PAUSE_TICKS = 5     # 连续 N 个 tick 进度不变才算暂停，避免读数抖动
+    MIN_SECONDS = 5     # 少于该时长的会话 (快速切歌) 不计入统计
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.song_id = None
+        self.started_at = 0.0
+        self.listened = 0.0
+        self.last_ct = None
+        self.still_ticks = 0
+        self.paused = False
+
+    def _emit(self, event_type, **fields):
+        if self.journal is not None:
+            self.journal.append(event_type, **fields)
+
+    def tick(self, song_id, ct, now=None, duration=None):
+        """每个 tick 调用；切歌时返回上一首的会话 (或 None)"""
+        now = now or time.time()
+        if song_id != self.song_id or self._looped(ct, duration):
+            finished = self.finish(now)
+            if song_id:
+                self.song_id = song_id
+                self.started_at = now
+                self.listened = 0.0
+                self.last_ct = ct
+                self.still_ticks = 0
+                self.paused = False
+                self._emit("song_start", song_id=song_id, position=round(ct, 3), duration=duration)
+            return finished
+        if self.last_ct is not None:
+            step = ct - self.last_ct
+            if 0 < step <= self.MAX_STEP:
+                self.listened += step
+            if step > self.MAX_STEP or step < self.BACK_STEP:
+                self._emit("seek", song_id=song_id, position=round(ct, 3), **{"from": round(self.last_ct, 3)})
+            if step == 0:
+                self.still_ticks += 1
+                if not self.paused and self.still_ticks >= self.PAUSE_TICKS:
+                    self.paused = True
+                    self._emit("pause", song_id=song_id, position=round(ct, 3))
+            else:
+                self.still_ticks = 0
+                if self.paused:
+                    self.paused = False
+                    self._emit("resume", song_id=song_id, position=round(ct, 3))
+        self.last_ct = ct
+        return None
+
+    def _looped(self, ct, duration):
+        """同一首歌从接近结尾回到开头 (单曲循环重播)"""
+        if self.last_ct is None or not duration:
+            return False
+        return (ct - self.last_ct < self.BACK_STEP
+                and self.last_ct >= duration - self.LOOP_TAIL and ct <= self.LOOP_HEAD)
+
+    def finish(self, now=None):
+        session = None
+        if self.song_id:
+            self._emit(
+                "song_end", song_id=self.song_id,
+                position=round(self.last_ct, 3) if self.last_ct is not None else None,
+                listened=round(self.listened, 2)
             )
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'http://music.163.com/'
+        if self.song_id and self.listened >= self.MIN_SECONDS:
+            session = {
+                "song_id": self.song_id,
+                "started_at": self.started_at,
+                "ended_at": now or time.time(),
+                "seconds": round(self.listened, 2)
             }
-            resp = requests.get(url, headers=headers, timeout=5).json()
-            if target_song_id != self.current_id: return
+        self.song_id = None
+        self.last_ct = None
+        return session
+
+class ListeningStats:
+    """
+    听歌统计 (数据目录下的 SQLite 旁路文件，open() 之前不可用)
+    historyTracks 按 (playtime, rowid) 水位线增量折叠进预聚合表 (歌曲 / 歌手 / 专辑 / 按天)，
+    监控线程观测到的实际收听时长另记为 monitored_seconds；查询只读聚合表，耗时与历史长度无关。
+    折叠按批提交、每批单独持锁，回填进行中的查询直接返回已提交的聚合结果。
+    """
+    BATCH_SIZE = 500
+    BACKFILL_BATCH_SIZE = 5000
+    AGGREGATES = ("track_totals", "artist_totals", "album_totals", "daily")
+
+    def __init__(self, service, db_path=None):
+        self.service = service
+        self.db_path = db_path
+        self.signature = None
+        self.backfill_state = {"running": False, "processed": 0, "started_at": None, "finished_at": None}
+        self._lock = threading.Lock()           # 统计库连接 (每批 / 每次查询持有)
+        self._update_lock = threading.Lock()    # 同一时间只有一个折叠过程
+        self._conn = None
+
+    def open(self):
+        """打开统计库 (未指定路径时放在数据目录下)"""
+        if self._conn is not None: return
+        self.db_path = self.db_path or data_path("listening_stats.db")
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=1, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS track_totals (
+                    song_id INTEGER PRIMARY KEY, name TEXT, artist TEXT, album TEXT,
+                    plays INTEGER NOT NULL DEFAULT 0, seconds REAL NOT NULL DEFAULT 0,
+                    monitored_seconds REAL NOT NULL DEFAULT 0, last_played REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS artist_totals (
+                    artist TEXT PRIMARY KEY, plays INTEGER NOT NULL DEFAULT 0,
+                    seconds REAL NOT NULL DEFAULT 0, monitored_seconds REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS album_totals (
+                    album TEXT PRIMARY KEY, plays INTEGER NOT NULL DEFAULT 0,
+                    seconds REAL NOT NULL DEFAULT 0, monitored_seconds REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS daily (
+                    day TEXT PRIMARY KEY, plays INTEGER NOT NULL DEFAULT 0,
+                    seconds REAL NOT NULL DEFAULT 0, monitored_seconds REAL NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_track_plays ON track_totals (plays DESC);
+                CREATE INDEX IF NOT EXISTS idx_artist_plays ON artist_totals (plays DESC);
+                CREATE INDEX IF NOT EXISTS idx_album_plays ON album_totals (plays DESC);
+                """
+            )
+            self._conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            print(f"[Stats] 统计库不可用: {e}")
+            self._conn = None
+
+    def _meta(self, key, default=0):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _add_meta(self, cur, key, delta):
+        cur.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            (key, delta)
+        )
 
-            raw_lrc = resp.get('lrc', {}).get('lyric', "")
-            raw_trans = resp.get('tlyric', {}).get('lyric', "")
-            raw_roma = resp.get('romalrc', {}).get('lyric', "")
-            raw_yrc = resp.get('yrc', {}).get('lyric', "")
-            if not raw_yrc: raw_yrc = resp.get('klyric', {}).get('lyric', "")
+    @staticmethod
+    def _day(timestamp):
+        return time.strftime('%Y-%m-%d', time.localtime(timestamp))
 
-            with state_lock:
-                self.lyric_packet = {
-                    "id": target_song_id,
-                    "hasLyric": bool(raw_lrc), "hasTrans": bool(raw_trans), "hasRoma": bool(raw_roma), "hasYrc": bool(raw_yrc),
-                    "lrc": raw_lrc, "tlyric": raw_trans, "romalrc": raw_roma, "yrc": raw_yrc
-                }
+    @staticmethod
+    def _describe(track):
+        artists = [a.get('name') for a in (track.get('artists') or track.get('ar') or []) if a.get('name')]
+        album = (track.get('album') or track.get('al') or {}).get('name') or ""
+        return track.get('name') or "", artists, album
+
+    def _upsert(self, cur, column, tracks, artists, albums, days):
+        """把一批增量写入各聚合表；column 为 seconds (来自历史) 或 monitored_seconds (来自监控)"""
+        cur.executemany(
+            "INSERT INTO track_totals (song_id, name, artist, album, plays, " + column + ", last_played) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(song_id) DO UPDATE SET plays = plays + excluded.plays, "
+            + column + " = " + column + " + excluded." + column + ", "
+            "name = COALESCE(NULLIF(excluded.name, ''), name), artist = COALESCE(NULLIF(excluded.artist, ''), artist), "
+            "album = COALESCE(NULLIF(excluded.album, ''), album), last_played = MAX(last_played, excluded.last_played)",
+            [(sid, *v) for sid, v in tracks.items()]
+        )
+        for table, key, values in (("artist_totals", "artist", artists), ("album_totals", "album", albums), ("daily", "day", days)):
+            cur.executemany(
+                f"INSERT INTO {table} ({key}, plays, {column}) VALUES (?, ?, ?) "
+                f"ON CONFLICT({key}) DO UPDATE SET plays = plays + excluded.plays, {column} = {column} + excluded.{column}",
+                [(k, v[0], v[1]) for k, v in values.items()]
+            )
 
-            ori_dict = self._parse_lrc_text(raw_lrc)
-            trans_dict = self._parse_lrc_text(raw_trans)
-            merged = []
-            for t in sorted(ori_dict.keys()):
-                merged.append({
-                    "time": t, "text": ori_dict[t], "trans": trans_dict.get(t, "")
-                })
-            self.parsed_list = merged
-                
-        except Exception as e: print(f"Lyric Error: {e}")
-        finally:
-            if target_song_id == self.current_id: self.is_loading = False
+    def _fold(self, rows):
+        """折叠一批 (jsonStr, playtime, rowid) 历史行，并把水位线推进到最后一行"""
+        tracks, artists, albums, days = {}, {}, {}, {}
+        total_seconds = 0.0
+        last_playtime = last_rowid = None
+        for raw, playtime, rowid in rows:
+            last_playtime, last_rowid = playtime, rowid
+            try:
+                track = json.loads(raw)
+                song_id = int(track.get('id', 0))
+            except Exception:
+                continue
+            if not song_id: continue
+            # playtime 为毫秒时间戳；时长取歌曲时长 (历史记录里没有实际收听时长)
+            played_at = playtime / 1000.0 if playtime and playtime > 1e11 else float(playtime or 0)
+            seconds = (track.get('duration') or track.get('dt') or 0) / 1000.0
+            name, artist_names, album = self._describe(track)
+            entry = tracks.setdefault(song_id, [name, " / ".join(artist_names), album, 0, 0.0, 0.0])
+            entry[3] += 1
+            entry[4] += seconds
+            entry[5] = max(entry[5], played_at)
+            for artist in artist_names:
+                a = artists.setdefault(artist, [0, 0.0]); a[0] += 1; a[1] += seconds
+            if album:
+                a = albums.setdefault(album, [0, 0.0]); a[0] += 1; a[1] += seconds
+            d = days.setdefault(self._day(played_at), [0, 0.0]); d[0] += 1; d[1] += seconds
+            total_seconds += seconds
+
+        cur = self._conn.cursor()
+        self._upsert(cur, "seconds", tracks, artists, albums, days)
+        self._add_meta(cur, "plays", sum(v[3] for v in tracks.values()))
+        self._add_meta(cur, "seconds", total_seconds)
+        if last_playtime is not None:
+            cur.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                [("history_watermark", last_playtime), ("history_watermark_rowid", last_rowid)]
+            )
+        self._conn.commit()
 
-    def get_current_line(self, current_time):
-        if not self.parsed_list: return "", ""
-        curr_ori, curr_trans = "", ""
-        for item in self.parsed_list:
-            if current_time >= item['time']:
-                curr_ori = item['text']
-                curr_trans = item['trans']
-            else: break
-        return curr_ori, curr_trans
+    def update(self, batch_size=None, force=False, wait=False):
+        """
+        数据库有新提交时，按 (playtime, rowid) 水位线折叠新的历史行，返回处理的行数
+        已有折叠在进行 (如启动回填) 时：wait=False 直接返回 0，调用方读取已提交的结果
+        """
+        if self._conn is None: return 0
+        signature = self.service._db_signature()
+        if signature is None or (not force and signature == self.signature):
+            return 0
+        if not self._update_lock.acquire(blocking=wait):
+            return 0
+        batch_size = batch_size or self.BATCH_SIZE
+        processed = 0
+        try:
+            while True:
+                with self._lock:
+                    watermark = self._meta("history_watermark", -1)
+                    # 旧版本只记录了 playtime：同一 playtime 的行当时已全部处理
+                    watermark_rowid = self._meta("history_watermark_rowid", 1 << 62)
+                rows = self.service._read_db_query(
+                    "SELECT jsonStr, playtime, rowid FROM historyTracks "
+                    "WHERE playtime > ? OR (playtime = ? AND rowid > ?) ORDER BY playtime ASC, rowid ASC LIMIT ?",
+                    (watermark, watermark, watermark_rowid, batch_size)
+                )
+                if not rows: break
+                with self._lock:
+                    self._fold(rows)
+                processed += len(rows)
+                if self.backfill_state["running"]:
+                    self.backfill_state["processed"] = processed
+                if len(rows) < batch_size: break
+            self.signature = signature
+        finally:
+            self._update_lock.release()
+        return processed
 
-    def get_full_packet(self):
-        return self.lyric_packet
-    
-    def clear(self):
-        self.current_id = None
-        self.parsed_list = []
-        self.lyric_packet = {k: (False if "has" in k else "") for k in self.lyric_packet}
+    def backfill(self, reset=False):
+        """一次性批量处理全部历史 (reset 时清空聚合表重新计算，监控时长一并清空)"""
+        if self._conn is None: return 0
+        self.backfill_state.update(running=True, processed=0, started_at=time.time(), finished_at=None)
+        try:
+            if reset:
+                with self._update_lock, self._lock:
+                    for table in self.AGGREGATES + ("meta",):
+                        self._conn.execute(f"DELETE FROM {table}")
+                    self._conn.commit()
+            processed = self.update(batch_size=self.BACKFILL_BATCH_SIZE, force=True, wait=True)
+            print(f"[Stats] 历史回填完成: {processed} 条")
+            return processed
+        finally:
+            self.backfill_state.update(running=False, finished_at=time.time())
+
+    def record_session(self, session):
+        """记录监控线程观测到的一次收听 (只累加 monitored_seconds，播放次数以历史记录为准)"""
+        if self._conn is None or not session: return
+        song_id = int(session["song_id"])
+        track = self.service.get_cached_detail(song_id) or self.service.track_index.get(song_id) or {}
+        name, artist_names, album = self._describe(track)
+        seconds = session["seconds"]
+        with self._lock:
+            cur = self._conn.cursor()
+            self._upsert(
+                cur, "monitored_seconds",
+                {song_id: [name, " / ".join(artist_names), album, 0, seconds, session["ended_at"]]},
+                {artist: [0, seconds] for artist in artist_names},
+                {album: [0, seconds]} if album else {},
+                {self._day(session["started_at"]): [0, seconds]}
+            )
+            self._add_meta(cur, "monitored_seconds", seconds)
+            self._add_meta(cur, "sessions", 1)
+            self._conn.commit()
+
+    def query(self, top=10, days=30):
+        if self._conn is None: return None
+        # 回填 / 其他折叠进行中时不等待，直接返回已提交的聚合
+        self.update()
+        top = max(1, min(int(top), 100))
+        since = self._day(time.time() - max(1, int(days)) * 86400)
+        with self._lock:
+            conn = self._conn
+            def rows(sql, params=()):
+                cur = conn.execute(sql, params)
+                names = [c[0] for c in cur.description]
+                return [dict(zip(names, r)) for r in cur.fetchall()]
+            return {
+                "totals": {
+                    "plays": int(self._meta("plays")),
+                    "seconds": round(self._meta("seconds"), 1),
+                    "monitored_seconds": round(self._meta("monitored_seconds"), 1),
+                    "sessions": int(self._meta("sessions")),
+                    "tracks": conn.execute("SELECT COUNT(*) FROM track_totals").fetchone()[0],
+                    "artists": conn.execute("SELECT COUNT(*) FROM artist_totals").fetchone()[0]
+                },
+                "top_tracks": rows(
+                    "SELECT song_id AS id, name, artist, album, plays, seconds, monitored_seconds FROM track_totals "
+                    "ORDER BY plays DESC, monitored_seconds DESC LIMIT ?", (top,)
+                ),
+                "top_artists": rows("SELECT artist, plays, seconds, monitored_seconds FROM artist_totals ORDER BY plays DESC, monitored_seconds DESC LIMIT ?", (top,)),
+                "top_albums": rows("SELECT album, plays, seconds, monitored_seconds FROM album_totals ORDER BY plays DESC, monitored_seconds DESC LIMIT ?", (top,)),
+                "daily": rows("SELECT day, plays, seconds, monitored_seconds FROM daily WHERE day >= ? ORDER BY day ASC", (since,)),
+                "history_watermark": self._meta("history_watermark", None),
+                "backfill": dict(self.backfill_state)
+            }
 
 # ===========================
 # 3. 后台监控线程
@@ -1761,316 +5202,787 @@ def launch_locator_gui(locator):
     schedule_preview()
     root.mainloop()
 
-def monitor_loop(v3, lrc_svc, locator):
-    with auto.UIAutomationInitializerInThread():
-        mode_svc = PlayModeService()
-        
-        pm = None
-        mod = None
-        base = None
-        layout = None
-        
-        last_ct = -1.0
-        last_tt = 0.0
-        
-        # 兼容旧逻辑变量
-        last_switch_time = 0      
-        is_waiting_stable = False 
-        current_song_title_cache = ""
-        last_title_check_time = 0
-        
-        # 内存ID记录
-        last_memory_id = None
-        invalid_progress_reads = 0
-        invalid_pointer_reads = 0
+class MetadataStage:
+    """
+    monitor_loop 的异步元数据阶段
+    切歌时立即发布只含 id / 时长的临时条目 (provisional) 并开始加载歌词，
+    数据库 / API / 标题搜索在执行器上完成后再整体替换；进度、歌词行、播放状态照常每 tick 更新。
+    """
+    RETRY_INTERVAL = 10.0   # 解析失败后，同一首歌再次尝试的间隔 (秒)
+
+    def __init__(self, v3, lrc_svc, locator, prefetch_svc=None, executor=None):
+        self.v3 = v3
+        self.lrc_svc = lrc_svc
+        self.locator = locator
+        self.prefetch_svc = prefetch_svc
+        self.executor = executor or JobExecutor.default()
+        self.tracer = SongChangeTracer.default()
+        self.title_cache = ""
+        self.failed = {}    # song_id -> 失败时间
 
-        print("启动后台监控线程...")
+    @staticmethod
+    def _to_id(song_id):
+        try:
+            return int(song_id)
+        except (TypeError, ValueError):
+            return 0
+
+    def _publish_provisional(self, song_id, duration_sec):
+        with state_write():
+            API_STATE['basic_info'] = {
+                "id": song_id,
+                "name": "",
+                "artist": "",
+                "album": "",
+                "cover_url": "",
+                "duration": int(duration_sec * 1000),
+                "provisional": True
+            }
+            API_STATE['db_info'] = None
+            API_STATE['lyrics']['all_lyrics'] = []
+            API_STATE['lyrics']['current_line'] = "Loading..."
+            API_STATE['lyrics']['line_index'] = -1
+
+    def begin(self, memory_id, duration_sec):
+        """高精度模式切歌：只做内存操作，随后投递解析任务"""
+        song_id = self._to_id(memory_id)
+        if self.prefetch_svc:
+            meta_hot = self.v3.track_index.get(song_id) is not None or self.v3.get_cached_detail(song_id) is not None
+            self.prefetch_svc.record_switch(song_id, meta_hot)
+        with self.tracer.span(song_id, "provisional_publish"):
+            self._publish_provisional(song_id, duration_sec)
+        # 歌词只依赖 ID，不必等详情
+        self.lrc_svc.clear()
+        self.lrc_svc.load_lyrics(song_id)
+        self.resolve(song_id)
+
+    def begin_degraded(self, duration_sec):
+        """降级模式切歌：ID 未知，由后台 读库 -> 搜标题 解析"""
+        self._publish_provisional(0, duration_sec)
+        generation = self.executor.bump("metadata")
+        self.executor.submit(
+            self._resolve_degraded, duration_sec, generation,
+            group="metadata", priority=JobExecutor.PRIORITY_HIGH
+        )
 
-        while True:
-            try:
-                # 1. 进程连接
-                if pm is None:
-                    try:
-                        pm = pymem.Pymem("cloudmusic.exe")
-                        mod = pymem.process.module_from_name(pm.process_handle, "cloudmusic.dll")
-                        base = mod.lpBaseOfDll
-                        layout = locator.resolve(pm, mod)
-                        invalid_progress_reads = 0
-                        invalid_pointer_reads = 0
-                        last_memory_id = None
-                        print(f"已连接到网易云音乐进程，偏移来源: {layout['source']}")
-                        with state_lock:
-                            API_STATE['process_active'] = True
-                            API_STATE['memory_locator'] = locator.get_status()
-                    except Exception as e:
-                        print(f"[Locator] 连接进程失败: {e}")
-                        with state_lock: 
-                            API_STATE['process_active'] = False
-                            API_STATE['playing'] = False
-                            API_STATE['memory_locator'] = locator.get_status()
-                        time.sleep(2)
-                        continue
+    def resolve(self, song_id):
+        generation = self.executor.bump("metadata")
+        self.failed.pop(song_id, None)
+        self.executor.submit(
+            self._resolve_id, song_id, generation, time.perf_counter(),
+            key=("metadata", song_id), group="metadata", priority=JobExecutor.PRIORITY_HIGH
+        )
+
+    def needs_retry(self, memory_id):
+        failed_at = self.failed.get(self._to_id(memory_id))
+        return failed_at is not None and time.time() - failed_at > self.RETRY_INTERVAL
+
+    def _resolve_id(self, song_id, generation, queued_at=None):
+        if queued_at: self.tracer.record(song_id, "metadata_queued", queued_at)
+        # --- 策略：内存 -> 数据库 -> API ---
+        print(f"[查询] 正在检索本地数据库 (ID={song_id})...")
+        with self.tracer.span(song_id, "metadata_db"):
+            track = self.v3.search_db_for_id(song_id)
+        if track:
+            print(f" -> [命中] 本地数据库: {track['name']}")
+        else:
+            print(f" -> [未命中] 本地无缓存，调用 API...")
+            with self.tracer.span(song_id, "metadata_api"):
+                track = self.v3.get_song_detail_by_id(song_id)
+            if track:
+                print(f" -> [成功] API 获取: {track['name']}")
+            else:
+                print(f" -> [失败] 无法获取歌曲详情")
+                self.failed[song_id] = time.time()
+                return
+        self.publish(track, generation)
+
+    def _resolve_degraded(self, duration_sec, generation):
+        track = self.v3.get_track_hybrid(duration_sec)
+        if track:
+            print(f" -> [降级成功] {track['name']}")
+            self.publish(track, generation)
+        else:
+            print(" -> [降级失败] 无法同步数据")
+
+    def publish(self, track, generation):
+        """写入静态数据；期间又切歌 (代数变化) 时丢弃"""
+        song_id = track.get("id")
+        song_name = track.get('name')
+        artists = track.get('artists') or track.get('ar', [])
+        all_artist_names = [a.get('name') for a in artists]
+        artist_display_str = " / ".join(all_artist_names) if all_artist_names else "未知歌手"
+        al_data = track.get("album") or track.get("al", {})
+
+        started = time.perf_counter()
+        with state_write():
+            if self.executor.generation("metadata") != generation:
+                return
+            API_STATE['basic_info'] = {
+                "id": song_id,
+                "name": song_name,
+                "artist": artist_display_str,
+                "album": al_data.get("name", ""),
+                "cover_url": al_data.get("picUrl", ""),
+                "duration": track.get("duration", 0)
+            }
+            API_STATE['db_info'] = track
+            API_STATE['memory_locator'] = self.locator.get_status()
+        self.tracer.record(song_id, "metadata_publish", started)
+        self.tracer.mark(song_id, "metadata")
+        self.title_cache = f"{song_name} - {'/'.join(all_artist_names)}"
+
+        # 高精度模式下歌词已在 begin 中加载，这里只补降级模式
+        if song_id and self.lrc_svc.current_id != song_id:
+            self.lrc_svc.load_lyrics(song_id)
+
+def monitor_loop(v3, lrc_svc, locator, mode_svc, prefetch_svc=None, stats=None, journal=None, stop_event=None):
+    pm = None
+    mod = None
+    base = None
+    layout = None
+    
+    last_ct = -1.0
+    last_tt = 0.0
+    
+    # 兼容旧逻辑变量
+    last_switch_time = 0      
+    is_waiting_stable = False 
+
+    # 元数据阶段 (切歌后的详情查询全部在后台执行，不阻塞本循环)
+    meta_stage = MetadataStage(v3, lrc_svc, locator, prefetch_svc)
+    session_tracker = PlaySessionTracker(journal)
+    # 置位后在当前 tick 结束时退出 (所有等待都用 stop_event.wait，关闭时不必等满 sleep)
+    stop_event = stop_event or threading.Event()
+    # 各阶段耗时记入 monitor_stage_seconds，整个 tick 超过轮询间隔记为 overrun
+    metrics = Metrics.default()
+    tracer = SongChangeTracer.default()
+    tick_interval = 0.1
+    
+    # 内存ID记录
+    last_memory_id = None
+    invalid_progress_reads = 0
+    invalid_pointer_reads = 0
+
+    print("启动后台监控线程...")
 
-                # 2. 读取基础时间
-                if layout is None:
+    while not stop_event.is_set():
+        tick_started = stage_started = time.perf_counter()
+        try:
+            # 1. 进程连接
+            if pm is None:
+                try:
+                    pm = pymem.Pymem("cloudmusic.exe")
+                    mod = pymem.process.module_from_name(pm.process_handle, "cloudmusic.dll")
+                    base = mod.lpBaseOfDll
                     layout = locator.resolve(pm, mod)
-                    with state_lock:
+                    invalid_progress_reads = 0
+                    invalid_pointer_reads = 0
+                    last_memory_id = None
+                    print(f"已连接到网易云音乐进程，偏移来源: {layout['source']}")
+                    with state_write():
+                        API_STATE['process_active'] = True
+                        API_STATE['memory_locator'] = locator.get_status()
+                except Exception as e:
+                    print(f"[Locator] 连接进程失败: {e}")
+                    with state_write(): 
+                        API_STATE['process_active'] = False
+                        API_STATE['playing'] = False
                         API_STATE['memory_locator'] = locator.get_status()
+                    stop_event.wait(2)
+                    continue
 
-                ct = MemoryUtils.read_double_safe(pm, base + layout["off_curr"])
-                tt = MemoryUtils.read_double_safe(pm, base + layout["off_total"])
-                if not locator.is_runtime_progress_valid(ct, tt):
-                    invalid_progress_reads += 1
-                    if invalid_progress_reads >= 3:
-                        print("[Locator] 进度地址疑似失效，尝试自动重定位...")
-                        layout = locator.resolve(pm, mod, force_rescan=True)
-                        invalid_progress_reads = 0
-                        with state_lock:
-                            API_STATE['memory_locator'] = locator.get_status()
-                        ct = MemoryUtils.read_double_safe(pm, base + layout["off_curr"])
-                        tt = MemoryUtils.read_double_safe(pm, base + layout["off_total"])
-
-                if not locator.is_runtime_progress_valid(ct, tt):
-                    ct = last_ct if last_ct >= 0 else 0.0
-                    tt = last_tt if last_tt > 0 else 0.0
-                else:
+            # 2. 读取基础时间
+            if layout is None:
+                layout = locator.resolve(pm, mod)
+                with state_write():
+                    API_STATE['memory_locator'] = locator.get_status()
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="attach")
+
+            ct = MemoryUtils.read_double_safe(pm, base + layout["off_curr"])
+            tt = MemoryUtils.read_double_safe(pm, base + layout["off_total"])
+            if not locator.is_runtime_progress_valid(ct, tt):
+                invalid_progress_reads += 1
+                if invalid_progress_reads >= 3:
+                    print("[Locator] 进度地址疑似失效，尝试自动重定位...")
+                    metrics.inc("monitor_relocations_total", reason="progress")
+                    layout = locator.resolve(pm, mod, force_rescan=True)
                     invalid_progress_reads = 0
+                    with state_write():
+                        API_STATE['memory_locator'] = locator.get_status()
+                    ct = MemoryUtils.read_double_safe(pm, base + layout["off_curr"])
+                    tt = MemoryUtils.read_double_safe(pm, base + layout["off_total"])
 
-                is_moving = (ct != last_ct)
-                last_ct = ct
-                if tt > 0:
-                    last_tt = tt
-
-                current_mode = mode_svc.get_mode()
-
-                # ==========================================
-                # 3. ID 检测与元数据更新 (Metadata)
-                # ==========================================
-                song_id = API_STATE['basic_info'].get('id', 0)
-                memory_id = MemoryUtils.read_pointer_chain_string(
-                    pm,
-                    base,
-                    layout["ptr_static_offset"],
-                    layout.get("ptr_offsets", locator.POINTER_OFFSETS)
-                )
-                if not memory_id:
-                    invalid_pointer_reads += 1
-                    if invalid_pointer_reads >= 5:
-                        print("[Locator] 歌曲 ID 指针疑似失效，尝试自动重定位...")
-                        layout = locator.resolve(pm, mod, force_rescan=True)
-                        invalid_pointer_reads = 0
-                        with state_lock:
-                            API_STATE['memory_locator'] = locator.get_status()
-                        memory_id = MemoryUtils.read_pointer_chain_string(
-                            pm,
-                            base,
-                            layout["ptr_static_offset"],
-                            layout.get("ptr_offsets", locator.POINTER_OFFSETS)
-                        )
-                else:
+            if not locator.is_runtime_progress_valid(ct, tt):
+                ct = last_ct if last_ct >= 0 else 0.0
+                tt = last_tt if last_tt > 0 else 0.0
+            else:
+                invalid_progress_reads = 0
+
+            is_moving = (ct != last_ct)
+            last_ct = ct
+            if tt > 0:
+                last_tt = tt
+
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="read_progress")
+
+            current_mode = mode_svc.get_mode()
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="play_mode")
+
+            # ==========================================
+            # 3. ID 检测与元数据更新 (Metadata)
+            # ==========================================
+            memory_id = MemoryUtils.read_pointer_chain_string(
+                pm,
+                base,
+                layout["ptr_static_offset"],
+                layout.get("ptr_offsets", locator.POINTER_OFFSETS)
+            )
+            if not memory_id:
+                invalid_pointer_reads += 1
+                if invalid_pointer_reads >= 5:
+                    print("[Locator] 歌曲 ID 指针疑似失效，尝试自动重定位...")
+                    metrics.inc("monitor_relocations_total", reason="pointer")
+                    layout = locator.resolve(pm, mod, force_rescan=True)
                     invalid_pointer_reads = 0
-
-                current_track_full = None 
-                
-                # === 分支 A: 内存读取成功 (高精度模式) ===
-                if memory_id:
-                    # 重置旧逻辑的状态，防止混合干扰
-                    is_waiting_stable = False
-
-                    # 只有当 ID 发生变化时，才去执行昂贵的查询操作
-                    if memory_id != last_memory_id:
-                        print(f"\n[内存] 检测到 ID 变更: {last_memory_id} -> {memory_id}")
-                        last_memory_id = memory_id
-                        
-                        # 立即清空旧歌词
-                        lrc_svc.clear()
-                        with state_lock:
-                            API_STATE['lyrics']['all_lyrics'] = []
-                            API_STATE['lyrics']['current_line'] = "Loading..."
-                        
-                        # --- 策略：内存 -> 数据库 -> API ---
-                        
-                        # 1. 先查本地数据库 (最安全，0 网络请求)
-                        print(f"[查询] 正在检索本地数据库 (ID={memory_id})...")
-                        db_track = v3.search_db_for_id(memory_id)
-                        
-                        if db_track:
-                            current_track_full = db_track
-                            print(f" -> [命中] 本地数据库: {db_track['name']}")
-                        else:
-                            # 2. 数据库没有，才调用 API (最后手段)
-                            print(f" -> [未命中] 本地无缓存，调用 API...")
-                            api_track = v3.get_song_detail_by_id(memory_id)
-                            
-                            if api_track:
-                                current_track_full = api_track
-                                print(f" -> [成功] API 获取: {api_track['name']}")
-                            else:
-                                print(f" -> [失败] 无法获取歌曲详情")
-                    
-                    # 如果 ID 没变，但全局为空 (刚启动时)，补一次查询
-                    elif API_STATE['basic_info']['id'] != memory_id:
-                        db_track = v3.search_db_for_id(memory_id)
-                        if db_track:
-                            current_track_full = db_track
-                        else:
-                            current_track_full = v3.get_song_detail_by_id(memory_id)
-
-                # === 分支 B: 内存读取失败 (降级模式) ===
-                else:
-                    # 如果 tt 无效，直接跳过
-                    if tt < 1.0:
-                        time.sleep(0.1)
-                        continue
-                    
-                    is_switching = False
-                    
-                    # Trigger 1: 时长突变
-                    if abs(tt - last_tt) > 1.0:
-                        is_switching = True
-                        print(f"[触发] 时长突变: {last_tt:.1f} -> {tt:.1f}")
-                    # Trigger 2: 进度回跳
-                    elif last_ct > 2.0 and ct < 1.0:
-                        pass 
-                    # Trigger 3: 主动标题轮询
-                    if time.time() - last_title_check_time > 0.5:
-                        last_title_check_time = time.time()
-                        win_title = WindowUtils.get_netease_window_title()
-                        if win_title:
-                            clean_win_title = win_title.replace(" - 网易云音乐", "").strip()
-                            if current_song_title_cache and clean_win_title != current_song_title_cache and not is_waiting_stable:
-                                if " - " in clean_win_title:
-                                    is_switching = True
-                                    print(f"[触发] 标题变更: '{current_song_title_cache}' -> '{clean_win_title}'")
-                    
-                    if is_switching:
-                        last_tt = tt
-                        last_switch_time = time.time()
-                        is_waiting_stable = True
-                        lrc_svc.clear() 
-                        with state_lock:
-                            API_STATE['lyrics']['all_lyrics'] = []
-                            API_STATE['lyrics']['current_line'] = "Loading..."
-
-                    if is_waiting_stable:
-                        time_diff = time.time() - last_switch_time
-                        if time_diff > 1.2:
-                            print(f"[防抖] 状态已稳定，同步新歌数据...")
-                            is_waiting_stable = False 
-                            
-                            # 降级模式：尝试获取数据
-                            # 1. 尝试读最新的库
-                            # 2. 尝试搜标题
-                            track = v3.get_track_hybrid(tt)
-                            if track:
-                                current_track_full = track
-                                print(f" -> [降级成功] {track['name']}")
-                            else:
-                                print(" -> [降级失败] 无法同步数据")
-
-                # ==========================================
-                # 4. 写入静态数据 (仅在切歌时执行)
-                # ==========================================
-                if current_track_full:
-                    song_id = current_track_full.get("id") or song_id
-
-                    song_name = current_track_full.get('name')
-                    artists = current_track_full.get('artists') or current_track_full.get('ar', [])
-                    all_artist_names = [a.get('name') for a in artists]
-                    artist_display_str = " / ".join(all_artist_names) if all_artist_names else "未知歌手"
-                    current_song_title_cache = f"{song_name} - {'/'.join(all_artist_names)}"
-                    
-                    # 加载歌词
-                    lrc_svc.load_lyrics(song_id)
-                    
-                    al_data = current_track_full.get("album") or current_track_full.get("al", {})
-                    cover_url = al_data.get("picUrl", "")
-
-                    with state_lock:
-                        API_STATE['basic_info'] = {
-                            "id": song_id,
-                            "name": song_name,
-                            "artist": artist_display_str,
-                            "album": al_data.get("name", ""),
-                            "cover_url": cover_url,
-                            "duration": current_track_full.get("duration", 0)
-                        }
-                        API_STATE['db_info'] = current_track_full
+                    with state_write():
                         API_STATE['memory_locator'] = locator.get_status()
-                elif memory_id:
-                    song_id = memory_id
-
-                # 只要 current_mode 变了，next_song 就会立刻变
-                prev_track, next_track = {}, {}
+                    memory_id = MemoryUtils.read_pointer_chain_string(
+                        pm,
+                        base,
+                        layout["ptr_static_offset"],
+                        layout.get("ptr_offsets", locator.POINTER_OFFSETS)
+                    )
+            else:
+                invalid_pointer_reads = 0
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="read_id")
+
+            # === 分支 A: 内存读取成功 (高精度模式) ===
+            if memory_id:
+                # 重置旧逻辑的状态，防止混合干扰
+                is_waiting_stable = False
+
+                # ID 变化时只发布临时条目并投递解析任务，本 tick 不等待任何查询
+                if memory_id != last_memory_id:
+                    print(f"\n[内存] 检测到 ID 变更: {last_memory_id} -> {memory_id}")
+                    last_memory_id = memory_id
+                    metrics.inc("monitor_song_changes_total", mode="memory")
+                    tracer.begin(MetadataStage._to_id(memory_id), started=tick_started)
+                    meta_stage.begin(memory_id, tt)
+
+                # 如果 ID 没变，但上次解析失败 (例如刚启动时网络不可用)，定期补一次查询
+                elif meta_stage.needs_retry(memory_id):
+                    meta_stage.resolve(memory_id)
+
+            # === 分支 B: 内存读取失败 (降级模式) ===
+            else:
+                # 如果 tt 无效，直接跳过
+                if tt < 1.0:
+                    stop_event.wait(0.1)
+                    continue
                 
-                if song_id:
-                    # 使用最新的 ID 和 最新的 Mode 计算
-                    prev_track, next_track = v3.get_playback_neighbors(song_id, current_mode)
-
-                # ==========================================
-                # 5. 写入动态数据 (进度/歌词/模式/邻居)
-                # ==========================================
-                cur_txt, cur_trans = lrc_svc.get_current_line(ct)
+                is_switching = False
                 
+                # Trigger 1: 时长突变
+                if abs(tt - last_tt) > 1.0:
+                    is_switching = True
+                    print(f"[触发] 时长突变: {last_tt:.1f} -> {tt:.1f}")
+                # Trigger 2: 进度回跳
+                elif last_ct > 2.0 and ct < 1.0:
+                    pass 
+                # Trigger 3: 标题变更 (由 WindowTitleWatcher 推送，这里只读缓存值)
+                win_title = v3.title_watcher.get_title()
+                if win_title:
+                    clean_win_title = win_title.replace(" - 网易云音乐", "").strip()
+                    if meta_stage.title_cache and clean_win_title != meta_stage.title_cache and not is_waiting_stable:
+                        if " - " in clean_win_title:
+                            is_switching = True
+                            print(f"[触发] 标题变更: '{meta_stage.title_cache}' -> '{clean_win_title}'")
+                
+                if is_switching:
+                    metrics.inc("monitor_song_changes_total", mode="degraded")
+                    last_tt = tt
+                    last_switch_time = time.time()
+                    is_waiting_stable = True
+                    lrc_svc.clear() 
+                    with state_write():
+                        API_STATE['lyrics']['all_lyrics'] = []
+                        API_STATE['lyrics']['current_line'] = "Loading..."
+                        API_STATE['lyrics']['line_index'] = -1
+
+                if is_waiting_stable:
+                    time_diff = time.time() - last_switch_time
+                    if time_diff > 1.2:
+                        print(f"[防抖] 状态已稳定，同步新歌数据...")
+                        is_waiting_stable = False 
+                        
+                        # 降级模式：在后台尝试 读最新的库 -> 搜标题
+                        meta_stage.begin_degraded(tt)
+
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="metadata")
+
+            if memory_id:
+                song_id = memory_id
+            else:
                 with state_lock:
-                    API_STATE['playing'] = is_moving
-                    API_STATE['playback'] = {
-                        "current_sec": ct,
-                        "total_sec": tt,
-                        "percentage": (ct / tt * 100) if tt > 0 else 0,
-                        "formatted_current": format_t(ct),
-                        "formatted_total": format_t(tt),
-                        "play_mode": current_mode,
-                        "prev_song": prev_track,
-                        "next_song": next_track
-                    }
-                    API_STATE['lyrics']['current_line'] = cur_txt
-                    API_STATE['lyrics']['current_trans'] = cur_trans
+                    song_id = API_STATE['basic_info'].get('id', 0)
 
-                time.sleep(0.1)
+            # 收听会话：切歌 (或单曲循环重播) 时把上一次的实际收听时长交给统计 (写库在后台执行)
+            finished_session = session_tracker.tick(MetadataStage._to_id(song_id), ct, duration=tt)
+            if finished_session and stats:
+                meta_stage.executor.submit(stats.record_session, finished_session, group="stats", priority=JobExecutor.PRIORITY_LOW)
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="session")
 
-            except Exception as e:
-                print(f"Monitor Loop Error: {e}")
-                pm = None
-                mod = None
-                base = None
-                layout = None
-                time.sleep(1)
+            # 只要 current_mode 变了，next_song 就会立刻变
+            prev_track, next_track = {}, {}
+            
+            if song_id:
+                # 使用最新的 ID 和 最新的 Mode 计算
+                prev_track, next_track = v3.get_playback_neighbors(song_id, current_mode)
+                if prefetch_svc: prefetch_svc.update_prediction(prev_track, next_track)
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="neighbors")
+
+            # ==========================================
+            # 5. 写入动态数据 (进度/歌词/模式/邻居)
+            # ==========================================
+            lyric_pos = lrc_svc.get_position(ct)
+            stage_started = metrics.lap("monitor_stage_seconds", stage_started, stage="lyric_position")
+            playback = {
+                "current_sec": ct,
+                "total_sec": tt,
+                "percentage": (ct / tt * 100) if tt > 0 else 0,
+                "formatted_current": format_t(ct),
+                "formatted_total": format_t(tt),
+                "play_mode": current_mode,
+                "prev_song": prev_track,
+                "next_song": next_track
+            }
+            lyric_fields = {
+                "current_line": lyric_pos["text"],
+                "current_trans": lyric_pos["trans"],
+                "line_index": lyric_pos["index"],
+                "word_index": lyric_pos["word_index"]
+            }
+            
+            publish_started = stage_started
+            lock_started = time.perf_counter()
+            with state_lock:
+                metrics.lap("state_lock_wait_seconds", lock_started, holder="monitor")
+                lyrics = API_STATE['lyrics']
+                # 暂停时内容不变，不推进版本号，/info 继续复用上次的编码结果
+                if (API_STATE['playing'] != is_moving or API_STATE['playback'] != playback
+                        or any(lyrics.get(k) != v for k, v in lyric_fields.items())):
+                    API_STATE['playing'] = is_moving
+                    API_STATE['playback'] = playback
+                    lyrics.update(lyric_fields)
+                    mark_state_changed()
+            metrics.lap("monitor_stage_seconds", publish_started, stage="publish")
+            tracer.published(MetadataStage._to_id(song_id), publish_started)
+
+            tick_seconds = metrics.lap("monitor_tick_seconds", tick_started) - tick_started
+            metrics.inc("monitor_ticks_total")
+            if tick_seconds > tick_interval:
+                metrics.inc("monitor_overruns_total")
+            stop_event.wait(tick_interval)
+
+        except Exception as e:
+            metrics.inc("monitor_errors_total")
+            print(f"Monitor Loop Error: {e}")
+            pm = None
+            mod = None
+            base = None
+            layout = None
+            stop_event.wait(1)
+
+    # 退出前结束当前收听会话，保证日志里有 song_end、统计不丢最后一首
+    finished_session = session_tracker.finish()
+    if finished_session and stats:
+        stats.record_session(finished_session)
+    print("后台监控线程已停止")
 
 # ===========================
 # 4. Flask Web Server
 # ===========================
+class StaticAssets:
+    """
+    页面与静态资源的内存层 (首次请求时读入内存并预压缩，之后不再访问磁盘)
+    - ETag 取自文件内容哈希，If-None-Match 命中时返回 304
+    - HTML 每次重新验证，其余资源允许缓存 MAX_AGE 秒
+    - watch=True (开发模式) 时每次请求比对 mtime，文件修改后自动重新加载
+    只对外提供 DIRECTORIES 下、扩展名在 EXTENSIONS 内且不超过 MAX_FILE_BYTES 的文件，其余一律 404
+    (main.py、数据库、配置等仓库文件不会经由静态路由泄露)。
+    """
+    DIRECTORIES = ('player', 'wallpaper')
+    EXTENSIONS = {'.html', '.htm', '.js', '.mjs', '.css', '.json', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.woff', '.woff2', '.ttf', '.txt', '.md'}
+    COMPRESSIBLE = {'.html', '.htm', '.js', '.mjs', '.css', '.json', '.svg', '.txt', '.md', '.ttf'}
+    MAX_FILE_BYTES = 4 * 1024 * 1024
+    MAX_BYTES = 64 * 1024 * 1024
+    MAX_AGE = 86400
+    MIN_COMPRESS_BYTES = 1024
+
+    def __init__(self, root=None, watch=True):
+        self.root = root or os.path.dirname(os.path.abspath(__file__))
+        self.watch = watch
+        self._items = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "loads": 0, "reloads": 0, "not_modified": 0, "rejected": 0}
+
+    def _load(self, path, ext, stat):
+        with open(path, 'rb') as f:
+            body = f.read()
+        variants = {}
+        if ext in self.COMPRESSIBLE and len(body) >= self.MIN_COMPRESS_BYTES:
+            variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(body, quality=11)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype in ('application/javascript', 'application/json', 'image/svg+xml'):
+            mimetype += '; charset=utf-8'
+        return {
+            "signature": (stat.st_mtime, stat.st_size),
+            "body": body,
+            "variants": variants,
+            "mimetype": mimetype,
+            "etag": '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"',
+            "cache_control": "no-cache" if self.watch or ext in ('.html', '.htm') else f"public, max-age={self.MAX_AGE}",
+            "size": len(body) + sum(len(v) for v in variants.values())
+        }
+
+    def _entry(self, path):
+        """返回缓存条目；不适合放进内存时返回 None"""
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self.EXTENSIONS: return None
+        with self._lock:
+            entry = self._items.get(path)
+        if entry is not None and not self.watch:
+            self.metrics["hits"] += 1
+            return entry
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_size > self.MAX_FILE_BYTES: return None
+        if entry is not None and entry["signature"] == (stat.st_mtime, stat.st_size):
+            self.metrics["hits"] += 1
+            return entry
+        try:
+            fresh = self._load(path, ext, stat)
+        except OSError:
+            return None
+        self.metrics["reloads" if entry is not None else "loads"] += 1
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old: self._total -= old["size"]
+            self._items[path] = fresh
+            self._total += fresh["size"]
+            while self._total > self.MAX_BYTES and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._total -= evicted["size"]
+        return fresh
+
+    def resolve(self, relative_path):
+        """把请求路径解析为磁盘路径；越界、不在 DIRECTORIES 内或扩展名不在白名单时返回 None"""
+        path = safe_join(self.root, relative_path)
+        if path is None: return None
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        if len(parts) < 2 or parts[0] not in self.DIRECTORIES: return None
+        if os.path.splitext(path)[1].lower() not in self.EXTENSIONS: return None
+        return path
+
+    def serve(self, relative_path):
+        """按相对路径返回资源 (路径越界、不在白名单内或文件不存在时返回 None)"""
+        path = self.resolve(relative_path)
+        if path is None:
+            self.metrics["rejected"] += 1
+            return None
+        # 非开发模式下已缓存的文件不再检查磁盘
+        if (self.watch or path not in self._items) and not os.path.isfile(path):
+            return None
+        entry = self._entry(path)
+        if entry is None:
+            self.metrics["rejected"] += 1
+            return None
+        headers = {"ETag": entry["etag"], "Cache-Control": entry["cache_control"]}
+        if entry["variants"]: headers["Vary"] = "Accept-Encoding"
+        if ResponseCache.etag_matches(request.headers.get('If-None-Match'), entry["etag"]):
+            self.metrics["not_modified"] += 1
+            return Response(status=304, headers=headers)
+        accepted = ResponseCache.accepted_encodings(request.headers.get('Accept-Encoding'))
+        for encoding in ("br", "gzip"):
+            if encoding in entry["variants"] and encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                return Response(entry["variants"][encoding], content_type=entry["mimetype"], headers=headers)
+        return Response(entry["body"], content_type=entry["mimetype"], headers=headers)
+
+    def stats(self):
+        with self._lock:
+            result = dict(self.metrics)
+            result.update({"files": len(self._items), "bytes": self._total, "watch": self.watch})
+        return result
+
+class InfoEncoder:
+    """
+    /info 的字段投影 (?fields=) 与编码 (JSON / MessagePack / CBOR)
+    每个 (投影, 编码) 只保留最新状态版本的字节：同一 tick 内的并发轮询与暂停期间的轮询直接复用。
+    """
+    FORMATS = {"json": "application/json", "msgpack": "application/msgpack", "cbor": "application/cbor"}
+    MAX_ENTRIES = 64
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self._items = OrderedDict()   # (fields, fmt) -> (版本, 字节)
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def parse_fields(raw):
+        return tuple(dict.fromkeys(f.strip() for f in (raw or "").split(',') if f.strip()))
+
+    @staticmethod
+    def negotiate(fmt, accept):
+        """?format= 优先，其次按 Accept 头选择二进制编码，默认 JSON"""
+        if fmt: return fmt.lower()
+        accept = (accept or "").lower()
+        if "application/msgpack" in accept or "application/x-msgpack" in accept: return "msgpack"
+        if "application/cbor" in accept: return "cbor"
+        return "json"
+
+    @staticmethod
+    def available(fmt):
+        return fmt == "json" or (fmt == "msgpack" and msgpack is not None) or (fmt == "cbor" and cbor2 is not None)
+
+    @staticmethod
+    def encode(payload, fmt):
+        if fmt == "msgpack": return msgpack.packb(payload, use_bin_type=True)
+        if fmt == "cbor": return cbor2.dumps(payload)
+        return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+    def render(self, fields, fmt, version, build):
+        """返回编码后的字节；版本未变时直接复用，否则调用 build() 取完整状态后投影"""
+        key = (fields, fmt)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0] == version:
+                self._items.move_to_end(key)
+                self.metrics["hits"] += 1
+                return entry[1]
+        payload = build()
+        if fields:
+            # 与 /history 的 fields 一致：按 a.b.c 取值，键为原始路径
+            payload = {f: NeteaseV3Service._extract_path(payload, f) for f in fields}
+        body = self.encode(payload, fmt)
+        with self._lock:
+            self.metrics["misses"] += 1
+            self._items[key] = (version, body)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return body
+
+    def stats(self):
+        with self._lock:
+            result = dict(self.metrics)
+            result["projections"] = len(self._items)
+        result["formats"] = [f for f in self.FORMATS if self.available(f)]
+        return result
+
+class ResponseCache:
+    """
+    按资源版本缓存编码后的 JSON 响应 (原始字节 + gzip / brotli 预压缩版本)
+    - 版本不变时直接返回缓存的字节，不再重新序列化和压缩
+    - ETag 取自内容哈希，客户端带 If-None-Match 时返回 304
+    - 版本为 None (数据源不可用) 时照常编码但不缓存
+    """
+    MAX_ENTRIES = 128
+    MIN_COMPRESS_BYTES = 1024   # 太小的响应压缩后收益有限，不生成压缩版本
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "uncached": 0, "not_modified": 0, "encode_ms": 0.0}
+
+    def _encode(self, payload):
+        started = time.time()
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        variants = {}
+        if len(body) >= self.MIN_COMPRESS_BYTES:
+            variants["gzip"] = gzip.compress(body, compresslevel=self.GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(body, quality=self.BROTLI_QUALITY)
+        self.metrics["encode_ms"] += (time.time() - started) * 1000
+        return {
+            "body": body,
+            "variants": variants,
+            "etag": '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        }
+
+    def get(self, key, version, builder):
+        """返回缓存条目；版本变化时调用 builder() 重新生成 (先读版本再取数据，最坏只是多编码一次)"""
+        if version is None:
+            self.metrics["uncached"] += 1
+            return self._encode(builder())
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry["version"] == version:
+                self._items.move_to_end(key)
+                self.metrics["hits"] += 1
+                return entry
+        entry = self._encode(builder())
+        entry["version"] = version
+        with self._lock:
+            self.metrics["misses"] += 1
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def accepted_encodings(header):
+        """解析 Accept-Encoding，返回可接受的编码集合 (忽略 q=0)"""
+        result = set()
+        for part in (header or "").split(','):
+            name, _, params = part.strip().partition(';')
+            params = params.replace(' ', '')
+            if params.startswith('q=') and params[2:] in ('0', '0.0', '0.00', '0.000'):
+                continue
+            if name: result.add(name.strip().lower())
+        return result
+
+    @staticmethod
+    def etag_matches(header, etag):
+        if not header: return False
+        if header.strip() == '*': return True
+        return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+    def respond(self, key, version, builder):
+        """按 Accept-Encoding 选择预压缩版本，If-None-Match 命中时返回 304"""
+        entry = self.get(key, version, builder)
+        headers = {
+            "ETag": entry["etag"],
+            "Vary": "Accept-Encoding",
+            # 允许客户端保存，但每次使用前都要带 ETag 重新验证
+            "Cache-Control": "no-cache"
+        }
+        if self.etag_matches(request.headers.get('If-None-Match'), entry["etag"]):
+            self.metrics["not_modified"] += 1
+            return Response(status=304, headers=headers)
+        accepted = self.accepted_encodings(request.headers.get('Accept-Encoding'))
+        for encoding in ("br", "gzip"):
+            if encoding in entry["variants"] and encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                return Response(entry["variants"][encoding], mimetype='application/json', headers=headers)
+        return Response(entry["body"], mimetype='application/json', headers=headers)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._items)
+            total = sum(len(e["body"]) + sum(len(v) for v in e["variants"].values()) for e in self._items.values())
+        result = dict(self.metrics)
+        result["encode_ms"] = round(result["encode_ms"], 1)
+        result.update({"entries": entries, "bytes": total, "brotli": brotli is not None})
+        return result
+
 app = Flask(__name__)
 CORS(app)
 
 # 初始化服务实例
 v3 = NeteaseV3Service()
-lrc_svc = LyricService() # 注意：这里需要改为全局单例，或者在 monitor_loop 里引用同一个实例
+lyric_cache = LyricCacheStore()
+lrc_svc = LyricService(cache=lyric_cache) # 注意：这里需要改为全局单例，或者在 monitor_loop 里引用同一个实例
 offset_resolver = CloudMusicOffsetResolver()
+mode_svc = PlayModeService()
+cover_cache = CoverCache()
+cover_store = CoverStore(cover_cache)
+search_index = LibrarySearchIndex(v3)
+listening_stats = ListeningStats(v3)
+session_journal = SessionJournal()
+prefetch_svc = PrefetchService(v3, lrc_svc, cover_cache)
+response_cache = ResponseCache()
+static_assets = StaticAssets()
+info_encoder = InfoEncoder()
+
+def _collect_service_metrics():
+    """把各组件已有的 stats() 转成指标 (导出时才调用，不增加请求路径上的开销)"""
+    upstream = UpstreamClient.default().counters
+    jobs = JobExecutor.default().stats()
+    responses, info, assets = response_cache.metrics, info_encoder.metrics, static_assets.metrics
+    result = [
+        ("upstream_requests_total", "counter", {}, upstream["requests"]),
+        ("upstream_failures_total", "counter", {}, upstream["failures"]),
+        ("upstream_short_circuited_total", "counter", {}, upstream["short_circuited"]),
+        ("upstream_coalesced_total", "counter", {}, upstream["coalesced"]),
+        ("cache_requests_total", "counter", {"cache": "upstream", "result": "hit"}, upstream["cache_hits"] + upstream["negative_hits"]),
+        ("cache_requests_total", "counter", {"cache": "responses", "result": "hit"}, responses["hits"]),
+        ("cache_requests_total", "counter", {"cache": "responses", "result": "miss"}, responses["misses"] + responses["uncached"]),
+        ("cache_requests_total", "counter", {"cache": "info", "result": "hit"}, info["hits"]),
+        ("cache_requests_total", "counter", {"cache": "info", "result": "miss"}, info["misses"]),
+        ("cache_requests_total", "counter", {"cache": "static", "result": "hit"}, assets["hits"]),
+        ("cache_requests_total", "counter", {"cache": "static", "result": "miss"}, assets["loads"] + assets["reloads"]),
+        ("jobs_total", "counter", {"outcome": "completed"}, jobs["completed"]),
+        ("jobs_total", "counter", {"outcome": "failed"}, jobs["failed"]),
+        ("jobs_total", "counter", {"outcome": "cancelled"}, jobs["cancelled"]),
+        ("jobs_queue_depth", "gauge", {}, jobs["queue_depth"]),
+        ("jobs_running", "gauge", {}, jobs["running"]),
+        ("playing_queue_tracks", "gauge", {}, len(v3.playing_list_cache)),
+        ("title_resolver_entries", "gauge", {}, len(v3.title_resolver.entries)),
+        ("locator_candidates", "gauge", {}, offset_resolver.candidate_count()),
+        ("lyric_lines", "gauge", {}, len(lrc_svc.timeline.lines)),
+        ("journal_buffered_events", "gauge", {}, len(session_journal._ring)),
+        ("state_version", "gauge", {}, state_version)
+    ]
+    for name, component in (("detail_batcher", v3.detail_batcher), ("title_resolver", v3.title_resolver), ("db_pool", v3.db_pool)):
+        for key, value in component.metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                result.append(("component_events_total", "counter", {"component": name, "event": key}, value))
+    return result
+
+Metrics.default().register_collector(_collect_service_metrics)
 
 # 【关键修改】为了让 Flask 和 monitor_loop 共享同一个 LyricService 实例
 # 我们需要把 monitor_loop 里的 lrc_svc 提出来变成全局变量，或者像下面这样：
 # 建议直接在文件最上方定义全局 lrc_service，然后在 monitor_loop 里使用 global lrc_service
 
+def _build_lite_state():
+    """/info 的完整视图 (调用方需持有 state_lock)"""
+    # 这里不需要返回 all_lyrics 了，前端去调 /lyrics 接口拿
+    return {
+        "playing": API_STATE["playing"],
+        "process_active": API_STATE["process_active"],
+        "basic_info": API_STATE["basic_info"],
+        "playback": API_STATE["playback"],
+        "memory_locator": API_STATE["memory_locator"],
+        "lyrics": {
+            "current_line": API_STATE["lyrics"]["current_line"],
+            "current_trans": API_STATE["lyrics"]["current_trans"],
+            "line_index": API_STATE["lyrics"]["line_index"],
+            "word_index": API_STATE["lyrics"]["word_index"]
+        }
+    }
+
 @app.route('/info', methods=['GET'])
 def get_info():
+    """
+    当前状态；?fields=playing,basic_info.id 只返回指定字段，
+    ?format=msgpack|cbor (或 Accept: application/msgpack / application/cbor) 返回二进制编码
+    """
+    fields = InfoEncoder.parse_fields(request.args.get('fields'))
+    fmt = InfoEncoder.negotiate(request.args.get('format'), request.headers.get('Accept'))
+    if fmt not in InfoEncoder.FORMATS or not InfoEncoder.available(fmt):
+        return Response(
+            json.dumps({"code": 406, "msg": f"不支持的编码: {fmt}", "formats": info_encoder.stats()["formats"]}, ensure_ascii=False),
+            status=406,
+            mimetype='application/json'
+        )
+    lock_started = time.perf_counter()
     with state_lock:
-        # 这里不需要返回 all_lyrics 了，前端去调 /lyrics 接口拿
-        # 我们只返回 playback, basic_info 和 lyrics.current_line
-        
-        # 构造一个轻量级的响应副本
-        lite_state = {
-            "playing": API_STATE["playing"],
-            "process_active": API_STATE["process_active"],
-            "basic_info": API_STATE["basic_info"],
-            "playback": API_STATE["playback"],
-            "memory_locator": API_STATE["memory_locator"],
-            "lyrics": {
-                "current_line": API_STATE["lyrics"]["current_line"],
-                "current_trans": API_STATE["lyrics"]["current_trans"]
-            }
-        }
-        return Response(json.dumps(lite_state, ensure_ascii=False), mimetype='application/json')
+        Metrics.default().lap("state_lock_wait_seconds", lock_started, holder="info")
+        body = info_encoder.render(fields, fmt, state_version, _build_lite_state)
+    return Response(body, mimetype=InfoEncoder.FORMATS[fmt])
 
 @app.route('/debug/locator', methods=['GET'])
 def get_locator_debug():
@@ -2083,6 +5995,77 @@ def get_locator_debug():
         mimetype='application/json'
     )
 
+@app.route('/debug/prefetch', methods=['GET'])
+def get_prefetch_debug():
+    """邻居预取命中率与缓存状态"""
+    return Response(
+        json.dumps({"code": 200, "data": prefetch_svc.get_metrics()}, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+@app.route('/debug/upstream', methods=['GET'])
+def get_upstream_debug():
+    """上游客户端统计：请求数、缓存命中、合并次数、熔断状态"""
+    return Response(
+        json.dumps({"code": 200, "data": UpstreamClient.default().stats()}, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+@app.route('/debug/jobs', methods=['GET'])
+def get_jobs_debug():
+    """后台任务执行器：队列深度、运行中任务数、各分组排队/执行耗时"""
+    return Response(
+        json.dumps({"code": 200, "data": JobExecutor.default().stats()}, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+@app.route('/debug/metrics', methods=['GET'])
+def get_metrics():
+    """监控循环各阶段与 HTTP 接口的耗时直方图、计数器、仪表 (?format=prometheus 返回 Prometheus 文本格式)"""
+    metrics = Metrics.default()
+    accept = request.headers.get('Accept', '')
+    if request.args.get('format') == 'prometheus' or ('text/plain' in accept and 'application/json' not in accept):
+        return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+    return Response(
+        json.dumps({"code": 200, "data": metrics.snapshot()}, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+@app.route('/debug/trace', methods=['GET'])
+def get_trace():
+    """切歌链路追踪：默认返回 Chrome trace-event JSON，?summary=1 返回各阶段 p50 / p95 (毫秒)"""
+    tracer = SongChangeTracer.default()
+    if request.args.get('summary') in ('1', 'true'):
+        payload = {"code": 200, "stats": tracer.stats(), "data": tracer.summary()}
+    else:
+        payload = tracer.chrome_trace()
+    return Response(json.dumps(payload, ensure_ascii=False), mimetype='application/json')
+
+@app.route('/debug', methods=['GET'])
+def get_debug_overview():
+    """调试信息汇总"""
+    return Response(
+        json.dumps({
+            "code": 200,
+            "data": {
+                "jobs": JobExecutor.default().stats(),
+                "upstream": UpstreamClient.default().stats(),
+                "detail_batcher": v3.detail_batcher.stats(),
+                "title_resolver": v3.title_resolver.stats(),
+                "prefetch": prefetch_svc.get_metrics(),
+                "covers": cover_store.stats(),
+                "search_index": search_index.stats(),
+                "journal": session_journal.stats(),
+                "responses": response_cache.stats(),
+                "static": static_assets.stats(),
+                "info": info_encoder.stats(),
+                "trace": SongChangeTracer.default().stats(),
+                "locator": offset_resolver.get_status()
+            }
+        }, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
 @app.route('/debug/locator/manual', methods=['POST'])
 def set_locator_manual():
     try:
@@ -2098,7 +6081,7 @@ def set_locator_manual():
             )
 
         layout = offset_resolver.apply_manual_layout(off_curr, off_total, ptr_static_offset)
-        with state_lock:
+        with state_write():
             API_STATE["memory_locator"] = offset_resolver.get_status()
 
         return Response(
@@ -2113,39 +6096,178 @@ def set_locator_manual():
 
 @app.route('/lyrics', methods=['GET'])
 def get_lyrics():
-    """【新增】专门获取歌词的接口"""
-    # 直接从 lrc_service 获取最新的包
-    data = lrc_svc.get_full_packet()
-    return Response(json.dumps(data, ensure_ascii=False), mimetype='application/json')
+    """【新增】专门获取歌词的接口 (?format=timeline 返回服务端预解析、已对齐的时间轴)"""
+    # 直接从 lrc_service 获取最新的包 (按歌词版本缓存编码结果)
+    if request.args.get('format') == 'timeline':
+        return response_cache.respond(("lyrics", "timeline"), lrc_svc.version, lrc_svc.get_timeline_packet)
+    return response_cache.respond(("lyrics", "raw"), lrc_svc.version, lrc_svc.get_full_packet)
     
+@app.route('/search', methods=['GET'])
+def search_library():
+    """本地曲库全文检索 (不访问网络)：?q=关键词&limit=20&type=track|playlist"""
+    started = time.perf_counter()
+    results = search_index.search(
+        request.args.get('q', ''),
+        limit=request.args.get('limit', default=20, type=int),
+        kind=request.args.get('type') or None
+    )
+    if results is None:
+        return Response(json.dumps({"code": 503, "msg": "本地索引不可用 (SQLite 缺少 FTS5)"}, ensure_ascii=False), mimetype='application/json')
+    return Response(
+        json.dumps({
+            "code": 200,
+            "count": len(results),
+            "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            "data": results
+        }, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+@app.route('/journal', methods=['GET'])
+def get_journal():
+    """播放事件日志：?since=&until= (Unix 秒) &type=seek&song_id=&limit=1000"""
+    events = session_journal.query(
+        since=request.args.get('since', type=float),
+        until=request.args.get('until', type=float),
+        event_type=request.args.get('type') or None,
+        song_id=request.args.get('song_id', type=int),
+        limit=request.args.get('limit', default=1000, type=int)
+    )
+    return Response(
+        json.dumps({"code": 200, "count": len(events), "data": events}, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """听歌统计：?top=10&days=30"""
+    data = listening_stats.query(
+        top=request.args.get('top', default=10, type=int),
+        days=request.args.get('days', default=30, type=int)
+    )
+    if data is None:
+        return Response(json.dumps({"code": 503, "msg": "统计库不可用"}, ensure_ascii=False), mimetype='application/json')
+    return Response(json.dumps({"code": 200, "data": data}, ensure_ascii=False), mimetype='application/json')
+
+@app.route('/stats/backfill', methods=['POST'])
+def start_stats_backfill():
+    """后台回填历史统计；?reset=1 清空后重新计算"""
+    reset = request.args.get('reset') in ('1', 'true')
+    job = JobExecutor.default().submit(
+        listening_stats.backfill, reset=reset,
+        key=("stats", "backfill"), group="stats", priority=JobExecutor.PRIORITY_LOW
+    )
+    return Response(
+        json.dumps({"code": 200, "msg": "回填已在后台执行", "running": not job.future.done()}, ensure_ascii=False),
+        mimetype='application/json'
+    )
+
+def _page_response(table_name, default_limit):
+    """?fields=a,b.c 字段投影；?limit=N&cursor=... 键集分页"""
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    limit = request.args.get('limit', default=default_limit, type=int)
+    cursor = request.args.get('cursor')
+
+    def build():
+        page = v3.query_page(table_name, fields=fields, limit=limit, cursor=cursor)
+        return {
+            "code": 200,
+            "count": len(page["data"]),
+            "next_cursor": page["next_cursor"],
+            "data": page["data"]
+        }
+    # 数据库没有新提交 (data_version 不变) 时复用编码好的字节
+    try:
+        return response_cache.respond((table_name, tuple(fields), limit, cursor), v3._db_signature(), build)
+    except ValueError as e:
+        return Response(
+            json.dumps({"code": 400, "msg": str(e)}, ensure_ascii=False),
+            status=400,
+            mimetype='application/json'
+        )
+
 @app.route('/history', methods=['GET'])
 def get_history():
-    data = v3.get_history_list(limit=20) 
-    return Response(json.dumps({"code": 200, "data": data}, ensure_ascii=False), mimetype='application/json')
+    return _page_response("historyTracks", 20)
 
 @app.route('/playlist', methods=['GET'])
 def get_playlist():
-    data = v3.get_playlist_list()
-    return Response(json.dumps({"code": 200, "data": data}, ensure_ascii=False), mimetype='application/json')
+    return _page_response("web_user_playlist", None)
 
 @app.route('/queue', methods=['GET'])
 def get_queue():
-    """获取当前播放列表（原始数据）"""
-    v3 = NeteaseV3Service()
-    
-    # 获取原始列表
-    raw_data = v3.get_raw_playing_list()
+    """获取当前播放列表（默认原始数据，?compact=1 返回精简记录）"""
+    enrich = request.args.get('enrich') in ('1', 'true')
+    if request.args.get('compact') not in ('1', 'true'):
+        # 这里包含所有的 id, track, privilege, referInfo 等字段
+        if not enrich:
+            # 文件签名不变时直接复用编码结果 (不再读盘解析)，客户端可凭 ETag 得到 304；文件缺失时不缓存
+            def build_raw():
+                data = v3.get_full_playing_list()
+                return {"code": 200, "count": len(data), "data": data}
+            return response_cache.respond(("queue", "raw"), v3.playing_list_signature(), build_raw)
+        # 补全结果依赖详情缓存，每次重新读取后补全
+        raw_data = v3.enrich_tracks(v3.get_full_playing_list())
+    else:
+        # 共享全局实例的缓存，只含 id / track / displayOrder / randomOrder
+        raw_data = v3.get_raw_playing_list()
+        if enrich:
+            # 复制后补全，不修改缓存中的记录
+            raw_data = v3.enrich_tracks(json.loads(json.dumps(raw_data)))
+        else:
+            # 精简记录按 playingList 内容哈希缓存编码结果 (文件缺失时返回的不是缓存列表，不参与缓存)
+            version = v3.playing_list_digest if raw_data is v3.playing_list_cache else None
+            return response_cache.respond(
+                ("queue",), version,
+                lambda: {"code": 200, "count": len(raw_data), "data": raw_data}
+            )
     
     # 直接包装返回
     return Response(
         json.dumps({
             "code": 200, 
             "count": len(raw_data), 
-            "data": raw_data  # 这里包含所有的 id, track, privilege, referInfo 等字段
+            "data": raw_data
         }, ensure_ascii=False), 
         mimetype='application/json'
     )
 
+@app.route('/cover/<int:song_id>', methods=['GET'])
+def get_cover(song_id):
+    """本地缓存的封面 (?size=N 按档位缩放)，带 ETag 与长缓存"""
+    url = v3.get_cover_url(song_id)
+    if not url:
+        return Response(json.dumps({"code": 404, "msg": "未找到封面"}, ensure_ascii=False), status=404, mimetype='application/json')
+    size = CoverStore.normalize_size(request.args.get('size', type=int))
+    headers = {
+        "ETag": cover_store.etag(url, size),
+        "Cache-Control": f"public, max-age={CoverStore.MAX_AGE}"
+    }
+    if ResponseCache.etag_matches(request.headers.get('If-None-Match'), headers["ETag"]):
+        return Response(status=304, headers=headers)
+    data = cover_store.get_image(url, size)
+    if data is None:
+        return Response(json.dumps({"code": 502, "msg": "封面下载失败"}, ensure_ascii=False), status=502, mimetype='application/json')
+    return Response(data, mimetype=CoverStore.mimetype(data), headers=headers)
+
+@app.route('/cover/<int:song_id>/palette', methods=['GET'])
+def get_cover_palette(song_id):
+    """封面主色与强调色"""
+    url = v3.get_cover_url(song_id)
+    if not url:
+        return Response(json.dumps({"code": 404, "msg": "未找到封面"}, ensure_ascii=False), status=404, mimetype='application/json')
+    if Image is None:
+        return Response(json.dumps({"code": 503, "msg": "未安装 Pillow，无法计算配色"}, ensure_ascii=False), status=503, mimetype='application/json')
+    palette = cover_store.get_palette(url)
+    if palette is None:
+        # 与 /cover 一致：上游下载失败是 502
+        return Response(json.dumps({"code": 502, "msg": "封面下载失败"}, ensure_ascii=False), status=502, mimetype='application/json')
+    return Response(
+        json.dumps({"code": 200, "id": song_id, "data": palette}, ensure_ascii=False),
+        mimetype='application/json',
+        headers={"Cache-Control": f"public, max-age={CoverStore.MAX_AGE}"}
+    )
+
 @app.route('/control/<action>', methods=['POST'])
 def control_player(action):
     """播放控制接口"""
@@ -2168,41 +6290,182 @@ def control_player(action):
 def serve_player():
     """托管前端 HTML 页面"""
     # 假设 player.html 和 main.py 在同一个文件夹下
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    html_path = os.path.join(current_dir, 'player/player.html')
-    
-    if os.path.exists(html_path):
-        return send_file(html_path)
-    else:
+    response = static_assets.serve('player/player.html')
+    if response is None:
         return Response("找不到 player.html，请确保它和 main.py 在同一目录", status=404)
+    return response
 
 @app.route('/wallpaper', methods=['GET'])
 def serve_wallpaper():
     """托管 Wallpaper Engine 预览页面。"""
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    html_path = os.path.join(current_dir, 'wallpaper', 'index.html')
-
-    if os.path.exists(html_path):
-        return send_file(html_path)
-    return Response("找不到 wallpaper/index.html", status=404)
+    response = static_assets.serve('wallpaper/index.html')
+    if response is None:
+        return Response("找不到 wallpaper/index.html", status=404)
+    return response
 
 @app.route('/<path:filename>')
 def serve_static_files(filename):
-    """托管仓库内的静态文件，便于浏览器预览和本地调试。"""
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    return send_from_directory(current_dir, filename)
+    """托管 player/ 与 wallpaper/ 下的前端资源 (其余路径一律 404)"""
+    response = static_assets.serve(filename)
+    if response is None:
+        return Response("Not Found", status=404)
+    return response
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        # 按路由函数名聚合，避免带参数的路径撑大标签集合
+        endpoint = request.endpoint or "unmatched"
+        metrics = Metrics.default()
+        metrics.lap("http_request_seconds", started, endpoint=endpoint)
+        metrics.inc("http_requests_total", endpoint=endpoint, status=response.status_code)
+    return response
 
 @app.after_request
 def add_header(response):
-    response.cache_control.no_store = True
+    # 实时接口禁止缓存；自带缓存策略的响应 (如封面) 保持原样
+    if 'Cache-Control' not in response.headers:
+        response.cache_control.no_store = True
     return response
 
+# ===========================
+# 5. 启动与关闭
+# ===========================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="网易云音乐本地 API")
+    parser.add_argument("--locator-gui", action="store_true", help="打开偏移定位器 GUI")
+    parser.add_argument("--serve", action="store_true", help="使用 waitress 多线程服务器 (生产模式)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=18726)
+    parser.add_argument("--threads", type=int, default=16, help="--serve: 处理请求的工作线程数")
+    parser.add_argument("--connection-limit", type=int, default=256, help="--serve: 同时保持的最大连接数")
+    parser.add_argument("--keepalive-timeout", type=int, default=120, help="--serve: 空闲 keep-alive 连接的超时秒数")
+    parser.add_argument("--shutdown-timeout", type=float, default=10, help="--serve: 退出时等待处理中请求的最长秒数")
+    parser.add_argument("--dev", action="store_true", help="页面与静态资源修改后自动重新加载 (不加 --serve 时默认开启)")
+    parser.add_argument("--data-dir", default=None, help="缓存、索引、统计与事件日志的存放目录 (默认取 NETEASE_API_DATA_DIR 或用户数据目录)")
+    return parser.parse_args(argv)
+
+def open_storage(data_dir=None):
+    """在数据目录下打开各持久化组件 (导入模块时不创建任何文件)"""
+    global DATA_DIR
+    if data_dir:
+        DATA_DIR = data_dir
+    for store in (lyric_cache, cover_store, search_index, listening_stats, session_journal):
+        store.open()
+    print(f"[Storage] 数据目录: {DATA_DIR}")
+
+def start_background_services(data_dir=None):
+    """打开持久化组件，启动监控线程与各后台服务，返回 (监控线程, 停止事件)"""
+    open_storage(data_dir)
+    mode_svc.start()
+    v3.title_watcher.start()
+    # 首次构建本地检索索引放到后台，不阻塞启动
+    search_index.schedule_refresh()
+    # 启动时在后台批量补齐水位线之后的全部历史，之后由 /stats 按需增量更新
+    JobExecutor.default().submit(listening_stats.backfill, key=("stats", "backfill"), group="stats", priority=JobExecutor.PRIORITY_LOW)
+    session_journal.start()
+    stop_event = threading.Event()
+    t = threading.Thread(
+        target=monitor_loop,
+        args=(v3, lrc_svc, offset_resolver, mode_svc, prefetch_svc, listening_stats, session_journal, stop_event),
+        name="monitor-loop",
+        daemon=True
+    )
+    t.start()
+    return t, stop_event
+
+def stop_background_services(monitor_thread, stop_event, timeout=5):
+    """按依赖顺序关闭：先停监控线程 (写出最后的 song_end)，再停各观察线程，最后落盘事件日志"""
+    stop_event.set()
+    monitor_thread.join(timeout=timeout)
+    if monitor_thread.is_alive():
+        print("[Shutdown] 监控线程未能在超时内退出")
+    mode_svc.stop()
+    v3.title_watcher.stop()
+    session_journal.stop()
+    print("[Shutdown] 后台服务已停止")
+
+def install_shutdown_signals():
+    """SIGTERM 与 Ctrl+C 一样走正常退出流程 (两种服务器模式都会执行 stop_background_services)"""
+    def _exit(signum, frame):
+        raise SystemExit(0)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, _exit)
+
+def drain_server(server, timeout):
+    """
+    waitress 优雅退出：停止接收新连接，工作线程处理完手上的请求后退出，期间继续驱动主循环把响应写完
+    (大响应有一部分要靠主循环发送)。超过 timeout 秒仍未完成的请求与尚未开始处理的排队请求直接放弃。
+    返回是否在超时内排空。
+    """
+    deadline = time.time() + timeout
+    server.accepting = False
+    dispatcher = server.task_dispatcher
+    dispatcher.set_thread_count(0)
+
+    def busy():
+        return bool(dispatcher.threads) or any(getattr(ch, "total_outbufs_len", 0) for ch in list(server._map.values()))
+
+    while busy() and time.time() < deadline:
+        server.asyncore.loop(timeout=0.05, map=server._map, use_poll=server.adj.asyncore_use_poll, count=1)
+    drained = not busy()
+    dispatcher.shutdown(timeout=0)
+    if not drained:
+        print(f"[Shutdown] 仍有请求未能在 {timeout} 秒内完成，直接关闭")
+    return drained
+
+def serve_production(options):
+    """
+    waitress 多线程服务器：固定数量的工作线程处理请求，连接由异步主循环管理，
+    keep-alive 连接空闲时不占用工作线程；SIGINT / SIGTERM 时停止接收新连接，
+    等待处理中的请求结束并发送完响应后再关闭 (最多 --shutdown-timeout 秒)。
+    """
+    server = waitress.create_server(
+        app,
+        host=options.host,
+        port=options.port,
+        threads=options.threads,
+        connection_limit=options.connection_limit,
+        channel_timeout=options.keepalive_timeout,
+        ident="netease-local-api"
+    )
+    print(f"[Serve] waitress 已启动: threads={options.threads}, connection_limit={options.connection_limit}")
+    try:
+        # 即 server.run() 的主循环；run() 收到信号后只等待工作线程 (固定 5 秒)，不再发送缓冲中的响应
+        server.asyncore.loop(
+            timeout=server.adj.asyncore_loop_timeout, map=server._map, use_poll=server.adj.asyncore_use_poll
+        )
+    except (SystemExit, KeyboardInterrupt):
+        print("[Shutdown] 停止接收新请求，等待处理中的请求结束...")
+    finally:
+        drain_server(server, options.shutdown_timeout)
+        server.close()
+
 if __name__ == "__main__":
-    if "--locator-gui" in sys.argv:
+    options = parse_args()
+    if options.locator_gui:
         launch_locator_gui(offset_resolver)
+    elif options.serve and waitress is None:
+        print("未安装 waitress，无法使用 --serve 模式: pip install waitress")
+        sys.exit(1)
     else:
+        # 生产模式下静态资源只读一次磁盘；开发模式下文件修改后自动重新加载
+        static_assets.watch = options.dev or not options.serve
         # 在这里把全局的 service 传给 monitor
-        t = threading.Thread(target=monitor_loop, args=(v3, lrc_svc, offset_resolver), daemon=True)
-        t.start()
-        print(f"API 服务已启动: http://127.0.0.1:18726/info")
-        app.run(host='0.0.0.0', port=18726, debug=False)
+        monitor_thread, monitor_stop = start_background_services(options.data_dir)
+        install_shutdown_signals()
+        print(f"API 服务已启动: http://127.0.0.1:{options.port}/info")
+        try:
+            if options.serve:
+                serve_production(options)
+            else:
+                app.run(host=options.host, port=options.port, debug=False)
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            stop_background_services(monitor_thread, monitor_stop)
@@ -0,0 +1,95 @@
+import importlib.util
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlparse
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    # pymem / uiautomation 仅在 Windows 上可用；main.py 缺少它们时会自动降级
+    module = sys.modules.get("main")
+    if module is None:
+        os.environ["NETEASE_API_DATA_DIR"] = str(tmp_path_factory.mktemp("data"))
+        spec = importlib.util.spec_from_file_location("main", os.path.join(ROOT, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["main"] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+class FakeUpstream:
+    """
+    本地替身上游 (歌词 / 详情 / 搜索接口与封面 CDN)
+    routes[path] = fn(request) -> (状态码, body[, headers])；body 为 dict/list 时按 JSON 返回
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler_class(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8") if length else ""
+                req = SimpleNamespace(
+                    method=self.command, path=url.path, query=dict(parse_qsl(url.query)),
+                    form=dict(parse_qsl(body)), headers=dict(self.headers), client=self.client_address
+                )
+                with upstream._lock:
+                    upstream.requests.append(req)
+                route = upstream.routes.get(url.path)
+                status, payload, headers = 404, {"code": 404}, {}
+                if route is not None:
+                    result = route(req)
+                    status, payload = result[0], result[1]
+                    headers = result[2] if len(result) > 2 else {}
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload).encode("utf-8")
+                    headers.setdefault("Content-Type", "application/json")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
+
+    def count(self, path):
+        with self._lock:
+            return sum(1 for r in self.requests if r.path == path)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_upstream():
+    upstream = FakeUpstream()
+    yield upstream
+    upstream.close()
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_cover(size=300):
+    """大面积红色 + 一条蓝色竖条 (主色 / 强调色明确)"""
+    img = Image.new("RGB", (size, size), (220, 30, 30))
+    for x in range(size * 3 // 4, size):
+        for y in range(size):
+            img.putpixel((x, y), (30, 60, 220))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def cover_env(main, fake_upstream, tmp_path):
+    image = make_cover()
+    fake_upstream.routes["/img/1.png"] = lambda req: (200, image, {"Content-Type": "image/png"})
+    url = f"{fake_upstream.base_url}/img/1.png"
+
+    def make_store():
+        client = main.UpstreamClient(base_url=fake_upstream.base_url)
+        store = main.CoverStore(main.CoverCache(client=client), directory=str(tmp_path / "covers"))
+        store.open()
+        return store
+    return make_store, url, image
+
+
+def test_original_is_cached_on_disk(cover_env, fake_upstream):
+    make_store, url, image = cover_env
+    store = make_store()
+    assert store.get_image(url) == image
+    assert store.get_image(url) == image
+    assert store.metrics["memory_hits"] == 1
+    assert fake_upstream.count("/img/1.png") == 1
+
+    # 新实例 (空内存层) 从磁盘命中，不再下载
+    restarted = make_store()
+    assert restarted.get_image(url) == image
+    assert restarted.metrics["disk_hits"] == 1
+    assert fake_upstream.count("/img/1.png") == 1
+
+
+def test_resized_variants_are_generated_from_one_download(main, cover_env, fake_upstream):
+    make_store, url, _ = cover_env
+    store = make_store()
+    for requested in (50, 100, 200):
+        size = main.CoverStore.normalize_size(requested)
+        data = store.get_image(url, size)
+        img = Image.open(io.BytesIO(data))
+        assert max(img.size) == size
+        assert main.CoverStore.mimetype(data) == "image/jpeg"
+    assert fake_upstream.count("/img/1.png") == 1
+    assert store.metrics["generated"] == 4   # 原图 + 三个档位
+
+    restarted = make_store()
+    assert Image.open(io.BytesIO(restarted.get_image(url, 128))).size == (128, 128)
+    assert restarted.metrics["disk_hits"] == 1
+    assert fake_upstream.count("/img/1.png") == 1
+
+
+def test_palette_picks_dominant_and_accent(cover_env, fake_upstream):
+    make_store, url, _ = cover_env
+    palette = make_store().get_palette(url)
+    red, blue = palette["dominant_rgb"], palette["accent_rgb"]
+    assert red[0] > 180 and red[2] < 80
+    assert blue[2] > 180 and blue[0] < 80
+    assert palette["colors"][0]["ratio"] > 0.6
+
+    # 配色落盘，重启后不再解码图片
+    restarted = make_store()
+    assert restarted.get_palette(url) == palette
+    assert restarted.metrics["palettes"] == 0
+    assert fake_upstream.count("/img/1.png") == 1
+
+
+def test_cover_route_revalidates_with_etag(main, cover_env, monkeypatch):
+    make_store, url, image = cover_env
+    monkeypatch.setattr(main, "cover_store", make_store())
+    monkeypatch.setattr(main.v3, "get_cover_url", lambda song_id: url if song_id == 1 else None)
+    client = main.app.test_client()
+
+    first = client.get("/cover/1")
+    assert first.status_code == 200
+    assert first.data == image
+    etag = first.headers["ETag"]
+    assert "max-age" in first.headers["Cache-Control"]
+
+    for header in (etag, f'W/{etag}', f'"other", {etag}', "*"):
+        revalidated = client.get("/cover/1", headers={"If-None-Match": header})
+        assert revalidated.status_code == 304
+        assert revalidated.data == b""
+    assert client.get("/cover/1", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    # 不同尺寸的 ETag 不同
+    assert client.get("/cover/1?size=64").headers["ETag"] != etag
+    assert client.get("/cover/2").status_code == 404
+
+
+def test_palette_route_reports_download_failure_as_502(main, cover_env, fake_upstream, monkeypatch):
+    make_store, url, _ = cover_env
+    monkeypatch.setattr(main, "cover_store", make_store())
+    monkeypatch.setattr(main.v3, "get_cover_url", lambda song_id: f"{fake_upstream.base_url}/img/missing.png")
+    response = main.app.test_client().get("/cover/3/palette")
+    assert response.status_code == 502
+    assert response.get_json()["code"] == 502
@@ -0,0 +1,44 @@
+import pytest
+
+SEARCH_PATH = "/api/cloudsearch/pc"
+
+
+@pytest.fixture
+def executor(main, monkeypatch):
+    """单 worker 的默认执行器：降级解析本身就占满唯一的 worker"""
+    executor = main.JobExecutor(workers=1, name="test-degraded")
+    monkeypatch.setattr(main.JobExecutor, "_default", executor)
+    return executor
+
+
+@pytest.fixture
+def degraded_service(main, executor, fake_upstream, tmp_path):
+    backend = main.FakeWindowBackend()
+    backend.add_window(1, "晴天 - 周杰伦")
+    service = main.NeteaseV3Service(
+        title_watcher=main.WindowTitleWatcher(backend),
+        client=main.UpstreamClient(base_url=fake_upstream.base_url)
+    )
+    service.db_path = str(tmp_path / "missing.dat")   # 数据库不可用，只能搜标题
+    return service
+
+
+def test_search_fallback_does_not_deadlock_a_saturated_executor(executor, degraded_service, fake_upstream):
+    fake_upstream.routes[SEARCH_PATH] = lambda req: (200, {"result": {"songs": [
+        {"id": 186001, "name": "晴天", "dt": 269000, "ar": [{"name": "周杰伦"}], "al": {"name": "叶惠美"}}
+    ]}})
+    # 搜索若再提交到同一个池并阻塞等待，就只能等到超时
+    track = executor.submit(degraded_service.get_track_hybrid, 269).result(3)
+    assert track["id"] == 186001
+    assert fake_upstream.count(SEARCH_PATH) == 1
+
+
+def test_search_failure_is_not_memoized(degraded_service, fake_upstream):
+    fake_upstream.routes[SEARCH_PATH] = lambda req: (502, {"code": 502})
+    assert degraded_service.get_track_hybrid(269) is None
+    assert degraded_service.title_resolver.metrics["network_errors"] == 1
+
+    fake_upstream.routes[SEARCH_PATH] = lambda req: (200, {"result": {"songs": [
+        {"id": 186001, "name": "晴天", "dt": 269000, "ar": [{"name": "周杰伦"}], "al": {"name": "叶惠美"}}
+    ]}})
+    assert degraded_service.get_track_hybrid(269)["id"] == 186001
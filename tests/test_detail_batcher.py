@@ -0,0 +1,84 @@
+import json
+import threading
+
+import pytest
+
+DETAIL_PATH = "/api/song/detail/"
+
+
+def detail_route(known):
+    """只返回 known 中的 id (模拟上游查不到部分歌曲)"""
+    def route(req):
+        ids = json.loads(req.query["ids"])
+        return 200, {"code": 200, "songs": [
+            {"id": i, "name": f"歌曲{i}", "dt": 200000, "ar": [{"name": "歌手"}], "al": {"name": "专辑", "picUrl": ""}}
+            for i in ids if i in known
+        ]}
+    return route
+
+
+@pytest.fixture
+def batcher(main, fake_upstream):
+    service = main.NeteaseV3Service(
+        title_watcher=main.WindowTitleWatcher(main.FakeWindowBackend()),
+        client=main.UpstreamClient(base_url=fake_upstream.base_url)
+    )
+    return main.SongDetailBatcher(service)
+
+
+def test_concurrent_requests_in_one_window_share_one_upstream_call(batcher, fake_upstream):
+    fake_upstream.routes[DETAIL_PATH] = detail_route(set(range(1, 21)))
+    barrier = threading.Barrier(20)
+    futures = {}
+
+    def worker(song_id):
+        barrier.wait()
+        futures[song_id] = batcher.request(song_id)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(1, 21)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results = {song_id: f.result(5) for song_id, f in futures.items()}
+    assert fake_upstream.count(DETAIL_PATH) == 1
+    assert sorted(json.loads(fake_upstream.requests[0].query["ids"])) == list(range(1, 21))
+    assert all(results[i]["name"] == f"歌曲{i}" for i in range(1, 21))
+
+    # 结果已进入详情缓存，再次请求不访问上游
+    assert batcher.request(5).result(1)["name"] == "歌曲5"
+    assert fake_upstream.count(DETAIL_PATH) == 1
+
+
+def test_duplicate_ids_share_one_future(batcher, fake_upstream):
+    fake_upstream.routes[DETAIL_PATH] = detail_route({9})
+    first, second = batcher.request(9), batcher.request(9)
+    assert first is second
+    assert first.result(5)["id"] == 9
+    assert json.loads(fake_upstream.requests[0].query["ids"]) == [9]
+
+
+def test_partial_response_resolves_missing_ids_to_none(batcher, fake_upstream):
+    fake_upstream.routes[DETAIL_PATH] = detail_route({1, 2})
+    result = batcher.resolve_many([1, 2, 404], timeout=5)
+    assert result[1]["name"] == "歌曲1"
+    assert result[2]["name"] == "歌曲2"
+    assert result[404] is None
+    assert batcher.metrics["missing"] == 1
+
+    # 上游明确没有的 id 在 NEGATIVE_TTL 内不再查询
+    assert batcher.request(404).result(1) is None
+    assert fake_upstream.count(DETAIL_PATH) == 1
+
+
+def test_failed_upstream_completes_futures_without_negative_caching(batcher, fake_upstream):
+    fake_upstream.routes[DETAIL_PATH] = lambda req: (502, {"code": 502})
+    futures = [batcher.request(i) for i in (1, 2, 3)]
+    assert [f.result(5) for f in futures] == [None, None, None]
+    assert batcher.metrics["errors"] == 1
+    assert batcher.metrics["missing"] == 0
+
+    # 失败不是“没有这首歌”：上游恢复后同一个 id 会重新查询
+    fake_upstream.routes[DETAIL_PATH] = detail_route({1})
+    assert batcher.request(1).result(5)["name"] == "歌曲1"
+    assert fake_upstream.count(DETAIL_PATH) == 2
@@ -0,0 +1,49 @@
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def history_client(main, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "webdb.dat")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE historyTracks (id TEXT PRIMARY KEY, jsonStr TEXT, playtime INTEGER)")
+    conn.execute("CREATE TABLE web_user_playlist (pid INTEGER PRIMARY KEY, playlist TEXT)")
+    for i in range(5):
+        track = {"id": i, "name": f"歌曲{i}", "artists": [{"id": 1, "name": "歌手"}], "album": {"name": "专辑"}}
+        if i == 0:
+            track["alias"] = ["别名"]   # 只有部分行才有的字段
+        conn.execute("INSERT INTO historyTracks VALUES (?, ?, ?)", (str(i), json.dumps(track), 1_700_000_000_000 + i))
+    conn.execute("INSERT INTO web_user_playlist VALUES (1, ?)", (json.dumps({"id": 1, "name": "我喜欢的音乐"}),))
+    conn.commit()
+    conn.close()
+
+    service = main.NeteaseV3Service(title_watcher=main.WindowTitleWatcher(main.FakeWindowBackend()))
+    service.db_path = db_path
+    monkeypatch.setattr(main, "v3", service)
+    monkeypatch.setattr(main, "response_cache", main.ResponseCache())
+    return main.app.test_client()
+
+
+def test_known_fields_are_projected(history_client):
+    data = history_client.get("/history?fields=id,name,artists.name,alias,playtime&limit=2").get_json()
+    assert data["code"] == 200
+    assert data["data"][0] == {"id": "4", "playtime": 1_700_000_000_004, "name": "歌曲4", "artists.name": ["歌手"], "alias": None}
+
+    # 下一页同样按字段投影
+    page = history_client.get(f"/history?fields=name,alias&limit=5&cursor={data['next_cursor']}").get_json()
+    assert [item["name"] for item in page["data"]] == ["歌曲2", "歌曲1", "歌曲0"]
+    assert page["data"][-1]["alias"] == ["别名"]
+
+
+@pytest.mark.parametrize("url, unknown", [
+    ("/history?fields=id,nmae", "nmae"),
+    ("/history?fields=artists.nmae", "artists.nmae"),
+    ("/history?fields=name,album.nmae&cursor=1700000000002:3", "album.nmae"),
+    ("/playlist?fields=name,creator", "creator"),
+])
+def test_unknown_json_paths_are_rejected_on_every_page(history_client, url, unknown):
+    response = history_client.get(url)
+    assert response.status_code == 400
+    assert unknown in response.get_json()["msg"]
@@ -0,0 +1,80 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+
+def build_history(path, playtimes):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE historyTracks (id TEXT PRIMARY KEY, jsonStr TEXT, playtime INTEGER)")
+    for i, playtime in enumerate(playtimes):
+        track = {"id": 1000 + i % 7, "name": f"歌曲{i % 7}", "duration": 200000,
+                 "artists": [{"name": f"歌手{i % 3}"}], "album": {"name": "专辑"}}
+        conn.execute("INSERT INTO historyTracks VALUES (?, ?, ?)", (str(i), json.dumps(track), playtime))
+    conn.commit()
+    return conn
+
+
+@pytest.fixture
+def stats_env(main, tmp_path):
+    def make(playtimes):
+        db_path = str(tmp_path / "webdb.dat")
+        writer = build_history(db_path, playtimes)
+        service = main.NeteaseV3Service(title_watcher=main.WindowTitleWatcher(main.FakeWindowBackend()))
+        service.db_path = db_path
+        stats = main.ListeningStats(service, db_path=str(tmp_path / "stats.db"))
+        stats.open()
+        return service, stats, writer
+    return make
+
+
+def test_rows_sharing_a_playtime_across_batches_are_all_folded(stats_env):
+    # 每 4 行同一个 playtime，批大小 3：批边界一定落在同一 playtime 的中间
+    playtimes = [1_700_000_000_000 + (i // 4) * 1000 for i in range(20)]
+    service, stats, writer = stats_env(playtimes)
+    assert stats.update(batch_size=3, force=True) == 20
+    assert stats.query()["totals"]["plays"] == 20
+
+    # 新写入的行与水位线 playtime 相同也不会被跳过
+    writer.execute("INSERT INTO historyTracks VALUES ('new', ?, ?)", (json.dumps({"id": 1, "name": "新歌"}), playtimes[-1]))
+    writer.commit()
+    assert stats.update(batch_size=3) == 1
+    assert stats.query()["totals"]["plays"] == 21
+
+
+def test_stats_responds_while_backfill_is_running(main, stats_env, monkeypatch):
+    service, stats, _ = stats_env([1_700_000_000_000 + i * 1000 for i in range(30)])
+    monkeypatch.setattr(main.ListeningStats, "BACKFILL_BATCH_SIZE", 10)
+    monkeypatch.setattr(main, "listening_stats", stats)
+
+    # 第二批读取时挂起回填，模拟一次很长的历史折叠
+    original_query = service._read_db_query
+    calls = []
+    paused, resume = threading.Event(), threading.Event()
+
+    def slow_query(sql, params=()):
+        if "historyTracks" in sql:
+            calls.append(sql)
+            if len(calls) == 2:
+                paused.set()
+                resume.wait(5)
+        return original_query(sql, params)
+    monkeypatch.setattr(service, "_read_db_query", slow_query)
+
+    backfill = threading.Thread(target=stats.backfill)
+    backfill.start()
+    try:
+        assert paused.wait(5)
+        responses = []
+        request = threading.Thread(target=lambda: responses.append(main.app.test_client().get("/stats")))
+        request.start()
+        request.join(2)
+        assert not request.is_alive(), "/stats 被回填阻塞"
+        data = responses[0].get_json()["data"]
+        assert data["backfill"]["running"] is True
+        assert data["totals"]["plays"] == 10
+    finally:
+        resume.set()
+        backfill.join(5)
+    assert stats.query()["totals"]["plays"] == 30
@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+LYRIC_PATH = "/api/song/lyric"
+
+
+def lyric_route(responses):
+    """按歌曲 id 返回 (状态码, body)；未配置的 id 返回正常歌词"""
+    def route(req):
+        song_id = int(req.query["id"])
+        return responses.get(song_id) or (200, {
+            "code": 200,
+            "lrc": {"lyric": f"[00:01.00]第一行 {song_id}\n[00:03.50]第二行"},
+            "tlyric": {"lyric": "[00:01.00]first line"}
+        })
+    return route
+
+
+@pytest.fixture
+def lyric_env(main, fake_upstream, tmp_path):
+    def make(responses=None, max_bytes=None):
+        fake_upstream.routes[LYRIC_PATH] = lyric_route(responses or {})
+        cache = main.LyricCacheStore(db_path=str(tmp_path / "lyric_cache.db"), max_bytes=max_bytes)
+        cache.open()
+        service = main.LyricService(
+            cache=cache, client=main.UpstreamClient(base_url=fake_upstream.base_url),
+            executor=main.JobExecutor(workers=1, name="test-lyrics")
+        )
+        return service, cache
+    return make
+
+
+def test_downloaded_lyrics_are_persisted(main, lyric_env, fake_upstream, tmp_path):
+    service, cache = lyric_env()
+    assert service.prefetch(42) is True
+    assert fake_upstream.count(LYRIC_PATH) == 1
+
+    # 重新打开同一个缓存文件 (模拟重启)：直接命中，不再请求上游
+    reopened = main.LyricCacheStore(db_path=str(tmp_path / "lyric_cache.db"))
+    reopened.open()
+    entry = reopened.get(42)
+    assert entry["stale"] is False
+    assert entry["packet"]["hasTrans"] is True
+    assert [line["text"] for line in entry["lines"]][:2] == ["第一行 42", "第二行"]
+
+    restarted = main.LyricService(cache=reopened, client=main.UpstreamClient(base_url=fake_upstream.base_url))
+    restarted.load_lyrics(42)
+    assert restarted.timeline_packet["lines"][0]["trans"] == "first line"
+    assert fake_upstream.count(LYRIC_PATH) == 1
+    assert restarted.prefetch(42) is False
+
+
+def test_eviction_keeps_cache_under_size_bound(lyric_env):
+    service, cache = lyric_env()
+    service.prefetch(1)
+    entry_size = cache.stats()["bytes"]
+    cache.max_bytes = entry_size * 3
+
+    for song_id in range(2, 6):
+        time.sleep(0.01)
+        service.prefetch(song_id)
+        if song_id == 3:
+            # 最近访问过的条目不会被优先淘汰
+            time.sleep(0.01)
+            assert cache.get(1) is not None
+        assert cache.stats()["bytes"] <= cache.max_bytes
+
+    assert cache.contains(1)
+    assert cache.contains(5)
+    assert not cache.contains(2)
+    assert cache.stats()["entries"] <= 3
+
+
+@pytest.mark.parametrize("status, body", [
+    (200, {"code": -460, "message": "Cheating"}),
+    (503, {"code": 503}),
+])
+def test_error_responses_are_never_persisted(main, lyric_env, fake_upstream, status, body):
+    service, cache = lyric_env({460: (status, body)})
+    with pytest.raises(main.UpstreamError):
+        service.prefetch(460)
+    assert not cache.contains(460)
+    assert cache.stats()["entries"] == 0
+
+    # 当前歌曲的后台加载同样不会把错误结果写进缓存或发布出去
+    service.load_lyrics(460)
+    deadline = time.time() + 2
+    while service.is_loading and time.time() < deadline:
+        time.sleep(0.01)
+    assert not cache.contains(460)
+    assert service.lyric_packet["hasLyric"] is False
+    assert fake_upstream.count(LYRIC_PATH) == 2
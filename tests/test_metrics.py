@@ -0,0 +1,26 @@
+import json
+
+
+def test_locator_candidates_counts_distinct_layouts(main, tmp_path):
+    cache_path = tmp_path / "offset_cache.json"
+    resolver = main.CloudMusicOffsetResolver(cache_path=str(cache_path))
+    assert resolver.candidate_count() == len(main.CloudMusicOffsetResolver.KNOWN_LAYOUTS)
+
+    # 手工录入的新布局算一个候选；与已知布局重复的不重复计数
+    cache_path.write_text(json.dumps({"entries": {}, "manual_override": {"off_curr": 0x100, "off_total": 0x200}}))
+    assert main.CloudMusicOffsetResolver(cache_path=str(cache_path)).candidate_count() == len(resolver.KNOWN_LAYOUTS) + 1
+    known = dict(main.CloudMusicOffsetResolver.KNOWN_LAYOUTS[0])
+    cache_path.write_text(json.dumps({"entries": {}, "manual_override": known}))
+    assert main.CloudMusicOffsetResolver(cache_path=str(cache_path)).candidate_count() == len(resolver.KNOWN_LAYOUTS)
+
+
+def test_gauges_report_locator_candidates_and_resolver_entries(main, monkeypatch, tmp_path):
+    resolver = main.CloudMusicOffsetResolver(cache_path=str(tmp_path / "offset_cache.json"))
+    monkeypatch.setattr(main, "offset_resolver", resolver)
+    monkeypatch.setattr(main.v3.title_resolver, "entries", {"晴天": [], "稻香": []})
+
+    text = main.app.test_client().get("/debug/metrics?format=prometheus").get_data(as_text=True)
+    lines = text.splitlines()
+    assert f"netease_locator_candidates {len(resolver.KNOWN_LAYOUTS)}" in lines
+    assert "netease_title_resolver_entries 2" in lines
+    assert not any("title_resolver_candidates" in line for line in lines)
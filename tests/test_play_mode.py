@@ -0,0 +1,111 @@
+import time
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_poll_publishes_mapped_mode(main):
+    service = main.PlayModeService(backend=main.FakePlayModeBackend("singleloop"))
+    changes = []
+    service.add_listener(lambda new, old: changes.append((new, old)))
+
+    assert service.poll() is True
+    assert service.get_mode() == "single"
+    assert service.last_update > 0
+
+    # 模式未变化时不重复通知
+    assert service.poll() is True
+    service.backend.set_mode_key("shuffle")
+    assert service.poll() is True
+    assert service.get_mode() == "random"
+    assert changes == [("single", "list"), ("random", "single")]
+
+
+def test_listener_error_does_not_block_publication(main):
+    service = main.PlayModeService(backend=main.FakePlayModeBackend("order"))
+    service.add_listener(lambda new, old: 1 / 0)
+    assert service.poll() is True
+    assert service.get_mode() == "order"
+
+
+def test_missing_window_keeps_last_mode(main):
+    backend = main.FakePlayModeBackend("shuffle")
+    service = main.PlayModeService(backend=backend)
+    assert service.poll() is True
+    published_at = service.last_update
+
+    # 句柄失效 / 窗口关闭：读不到按钮时保留上次发布的结果
+    backend.set_mode_key(None)
+    assert service.poll() is False
+    backend.set_mode_key("not-a-mode")
+    assert service.poll() is False
+    assert service.get_mode() == "random"
+    assert service.last_update == published_at
+
+    backend.set_mode_key("loop")
+    assert service.poll() is True
+    assert service.get_mode() == "list"
+
+
+class FlakyBackend:
+    """前几次读取抛出异常 (模拟 UI 重绘导致句柄失效)，之后恢复"""
+    def __init__(self, main, failures):
+        self.inner = main.FakePlayModeBackend("singleloop")
+        self.failures = failures
+
+    def thread_context(self):
+        return self.inner.thread_context()
+
+    def available(self):
+        return True
+
+    def read_mode_key(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("stale handle")
+        return self.inner.read_mode_key()
+
+
+def test_watcher_recovers_from_stale_handle(main, monkeypatch):
+    monkeypatch.setattr(main.PlayModeService, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(main.PlayModeService, "MISSING_INTERVAL", 0.02)
+    backend = FlakyBackend(main, failures=2)
+    service = main.PlayModeService(backend=backend)
+    service.start()
+    try:
+        assert wait_until(lambda: service.get_mode() == "single")
+        assert backend.failures == 0
+    finally:
+        service.stop()
+    assert wait_until(lambda: not service._thread.is_alive())
+
+
+def test_watcher_backs_off_while_window_missing(main, monkeypatch):
+    monkeypatch.setattr(main.PlayModeService, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(main.PlayModeService, "MISSING_INTERVAL", 10)
+    backend = main.FakePlayModeBackend(None)
+    service = main.PlayModeService(backend=backend)
+    service.start()
+    try:
+        assert wait_until(lambda: backend.read_count >= 1)
+        time.sleep(0.1)
+        # 找不到窗口时按 MISSING_INTERVAL 退避，不会持续轮询
+        assert backend.read_count == 1
+        assert service.get_mode() == "list"
+    finally:
+        service.stop()
+    assert wait_until(lambda: not service._thread.is_alive())
+
+
+def test_start_skips_unavailable_backend(main):
+    backend = main.FakePlayModeBackend("loop")
+    backend.available = lambda: False
+    service = main.PlayModeService(backend=backend)
+    service.start()
+    assert service._thread is None
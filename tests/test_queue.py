@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+
+def write_playing_list(path, ids):
+    items = [{"id": i, "track": {"id": i, "name": f"歌曲{i}"}, "privilege": {"fee": 8}, "referInfo": {}} for i in ids]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"list": items}, f, ensure_ascii=False)
+
+
+@pytest.fixture
+def queue_env(main, tmp_path, monkeypatch):
+    path = str(tmp_path / "playingList")
+    monkeypatch.setattr(main.v3, "_playing_list_path", lambda: path)
+    monkeypatch.setattr(main, "response_cache", main.ResponseCache())
+
+    reads = []
+    original = main.v3.get_full_playing_list
+
+    def counting():
+        reads.append(1)
+        return original()
+    monkeypatch.setattr(main.v3, "get_full_playing_list", counting)
+    return path, reads, main.app.test_client()
+
+
+def test_raw_queue_is_cached_by_file_signature(queue_env):
+    path, reads, client = queue_env
+    write_playing_list(path, [1, 2, 3])
+
+    first = client.get("/queue")
+    assert first.get_json()["count"] == 3
+    assert first.get_json()["data"][0]["privilege"] == {"fee": 8}
+    etag = first.headers["ETag"]
+
+    # 文件未变：不再读盘解析，带 ETag 重新验证返回 304
+    assert client.get("/queue").data == first.data
+    revalidated = client.get("/queue", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert len(reads) == 1
+
+    # 文件变化后重新读取，ETag 随内容变化
+    write_playing_list(path, [1, 2, 3, 4])
+    os.utime(path, ns=(1, 1))
+    changed = client.get("/queue", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["count"] == 4
+    assert changed.headers["ETag"] != etag
+    assert len(reads) == 2
+
+
+def test_missing_queue_file_is_not_cached(main, queue_env):
+    path, reads, client = queue_env
+    for _ in range(2):
+        assert client.get("/queue").get_json() == {"code": 200, "count": 0, "data": []}
+    assert len(reads) == 2
+    assert main.response_cache.stats()["entries"] == 0
@@ -0,0 +1,87 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("waitress")
+pytestmark = pytest.mark.skipif(not hasattr(signal, "SIGTERM") or os.name == "nt", reason="需要向本进程发送 SIGTERM")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_sigterm_waits_for_in_flight_request(main, monkeypatch):
+    # 数 MB 的响应：超出 socket 缓冲区，剩余部分要靠主循环在退出阶段发送
+    payload = [{"id": i, "name": "歌曲" * 50} for i in range(20000)]
+    started, release = threading.Event(), threading.Event()
+
+    def slow_playing_list():
+        started.set()
+        release.wait(5)
+        return payload
+    monkeypatch.setattr(main.v3, "playing_list_signature", lambda: None)
+    monkeypatch.setattr(main.v3, "get_full_playing_list", slow_playing_list)
+
+    port = free_port()
+    options = SimpleNamespace(host="127.0.0.1", port=port, threads=2, connection_limit=16,
+                              keepalive_timeout=5, shutdown_timeout=5)
+    result = {}
+
+    def client():
+        deadline = time.time() + 5
+        while True:
+            sock = socket.socket()
+            # 小接收窗口 + 延后读取：服务端写不完，剩余部分只能在退出阶段由主循环发送
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+            try:
+                sock.connect(("127.0.0.1", port))
+                break
+            except ConnectionRefusedError:
+                sock.close()
+                if time.time() > deadline: raise
+                time.sleep(0.05)
+        sock.settimeout(10)
+        sock.sendall(b"GET /queue HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+        release.wait(5)
+        time.sleep(0.3)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk: break
+            chunks.append(chunk)
+        sock.close()
+        head, _, body = b"".join(chunks).partition(b"\r\n\r\n")
+        result["status"], result["body"] = int(head.split()[1]), body
+
+    def stop_mid_request():
+        assert started.wait(5)
+        os.kill(os.getpid(), signal.SIGTERM)
+        time.sleep(0.3)
+        release.set()
+
+    previous = signal.getsignal(signal.SIGTERM)
+    main.install_shutdown_signals()
+    threads = [threading.Thread(target=client), threading.Thread(target=stop_mid_request)]
+    try:
+        for t in threads:
+            t.start()
+        # 信号只投递给主线程：服务器就运行在这里，收到 SIGTERM 后 serve_production 收尾并返回
+        main.serve_production(options)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        release.set()
+        for t in threads:
+            t.join(10)
+
+    assert result["status"] == 200
+    assert json.loads(result["body"])["count"] == len(payload)
+    with pytest.raises(ConnectionRefusedError):
+        socket.create_connection(("127.0.0.1", port), timeout=1)
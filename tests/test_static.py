@@ -0,0 +1,42 @@
+import pytest
+
+
+@pytest.fixture
+def client(main):
+    return main.app.test_client()
+
+
+@pytest.mark.parametrize("path", ["/player/player.html", "/player/images.jpg", "/wallpaper/index.html", "/wallpaper/README.md"])
+def test_frontend_assets_are_served(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert "ETag" in response.headers
+
+
+@pytest.mark.parametrize("path", [
+    "/main.py",
+    "/README.md",
+    "/requirements.txt",
+    "/tests/conftest.py",
+    "/player/../main.py",
+    "/player/%2e%2e/main.py",
+    "/wallpaper/../README.md",
+    "/player/missing.html",
+])
+def test_other_paths_are_not_found(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_files_outside_extension_allowlist_are_rejected(main, tmp_path):
+    (tmp_path / "player").mkdir()
+    (tmp_path / "player" / "page.html").write_text("<p>ok</p>", encoding="utf-8")
+    (tmp_path / "player" / "notes.db").write_bytes(b"SQLite format 3\0")
+    (tmp_path / "secret.html").write_text("secret", encoding="utf-8")
+    assets = main.StaticAssets(root=str(tmp_path))
+
+    with main.app.test_request_context():
+        assert assets.serve("player/page.html").status_code == 200
+        assert assets.serve("player/notes.db") is None
+        assert assets.serve("secret.html") is None
+        assert assets.serve("player/../secret.html") is None
+    assert assets.stats()["rejected"] == 3
@@ -0,0 +1,125 @@
+import time
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def make_watcher(main):
+    backend = main.FakeWindowBackend()
+    return backend, main.WindowTitleWatcher(backend)
+
+
+def test_pick_best_title_skips_ignored_windows(main):
+    assert main.WindowUtils.pick_best_title(["网易云音乐", "桌面歌词", "晴天 - 周杰伦"]) == "晴天 - 周杰伦"
+    assert main.WindowUtils.pick_best_title(["网易云音乐", "", "某个标题"]) == "某个标题"
+    assert main.WindowUtils.pick_best_title(["网易云音乐", "精简模式"]) is None
+
+
+def test_cached_handles_are_not_re_enumerated(main):
+    backend, watcher = make_watcher(main)
+    backend.add_window(1, "晴天 - 周杰伦")
+    backend.add_window(2, "桌面歌词")
+    backend.add_window(3, "其他窗口", class_name="Chrome_WidgetWin_1")
+
+    assert watcher.refresh() == "晴天 - 周杰伦"
+    assert sorted(watcher.hwnds) == [1, 2]
+    for _ in range(5):
+        watcher.refresh()
+    assert backend.enum_count == 1
+
+
+def test_dead_handle_triggers_re_enumeration(main):
+    backend, watcher = make_watcher(main)
+    backend.add_window(1, "晴天 - 周杰伦")
+    assert watcher.refresh() == "晴天 - 周杰伦"
+
+    # 主窗口被重建：旧句柄失效，新句柄需要重新枚举才能发现
+    backend.close_window(1)
+    backend.add_window(7, "稻香 - 周杰伦")
+    assert watcher.refresh() == "稻香 - 周杰伦"
+    assert watcher.hwnds == [7]
+    assert backend.enum_count == 2
+
+
+def test_missing_window_re_enumerates_on_short_interval(main):
+    backend, watcher = make_watcher(main)
+    assert watcher.refresh() is None
+    assert backend.enum_count == 1
+
+    # 退避间隔内不重复枚举
+    assert watcher.refresh() is None
+    assert backend.enum_count == 1
+
+    backend.add_window(1, "晴天 - 周杰伦")
+    watcher.last_enum -= main.WindowTitleWatcher.MISSING_REENUM_INTERVAL + 1
+    assert watcher.refresh() == "晴天 - 周杰伦"
+    assert backend.enum_count == 2
+
+
+def test_periodic_re_enumeration_finds_new_windows(main):
+    backend, watcher = make_watcher(main)
+    backend.add_window(1, "网易云音乐")
+    assert watcher.refresh() is None
+
+    backend.add_window(2, "晴天 - 周杰伦")
+    assert watcher.refresh() is None
+    watcher.last_enum -= main.WindowTitleWatcher.REENUM_INTERVAL + 1
+    assert watcher.refresh() == "晴天 - 周杰伦"
+
+
+def test_title_change_notifies_listeners_once(main):
+    backend, watcher = make_watcher(main)
+    backend.add_window(1, "晴天 - 周杰伦")
+    changes = []
+    watcher.add_listener(lambda new, old: changes.append((new, old)))
+    watcher.add_listener(lambda new, old: 1 / 0)
+
+    watcher.refresh()
+    watcher.refresh()
+    backend.set_title(1, "稻香 - 周杰伦")
+    watcher.refresh()
+    assert changes == [("晴天 - 周杰伦", None), ("稻香 - 周杰伦", "晴天 - 周杰伦")]
+
+
+def test_hooked_watcher_pushes_title_events(main):
+    backend, watcher = make_watcher(main)
+    backend.add_window(1, "晴天 - 周杰伦")
+    changes = []
+    watcher.add_listener(lambda new, old: changes.append(new))
+    watcher.start()
+    try:
+        assert wait_until(lambda: watcher.get_title() == "晴天 - 周杰伦")
+        # 标题变化由钩子回调推送，不等待下一轮轮询
+        backend.set_title(1, "稻香 - 周杰伦")
+        assert watcher.get_title() == "稻香 - 周杰伦"
+        # 不属于已缓存句柄的事件被忽略
+        backend.add_window(9, "七里香 - 周杰伦", class_name="Other")
+        backend.set_title(9, "七里香 - 周杰伦")
+        assert watcher.get_title() == "稻香 - 周杰伦"
+        assert changes == ["晴天 - 周杰伦", "稻香 - 周杰伦"]
+    finally:
+        watcher.stop()
+        backend._pump_event.set()
+    assert wait_until(lambda: not watcher._thread.is_alive())
+    assert backend._callback is None
+
+
+def test_watcher_falls_back_to_polling_without_hook(main, monkeypatch):
+    monkeypatch.setattr(main.WindowTitleWatcher, "POLL_INTERVAL", 0.01)
+    backend, watcher = make_watcher(main)
+    backend.install_hook = lambda callback: False
+    backend.add_window(1, "晴天 - 周杰伦")
+    watcher.start()
+    try:
+        assert wait_until(lambda: watcher.get_title() == "晴天 - 周杰伦")
+        backend.windows[1]["title"] = "稻香 - 周杰伦"
+        assert wait_until(lambda: watcher.get_title() == "稻香 - 周杰伦")
+    finally:
+        watcher.stop()
+    assert wait_until(lambda: not watcher._thread.is_alive())
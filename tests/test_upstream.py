@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def client(main, fake_upstream):
+    return main.UpstreamClient(base_url=fake_upstream.base_url)
+
+
+def open_breaker(main, client, fake_upstream, threshold=2, reset_timeout=0.2):
+    """给替身上游的主机装一个阈值小、冷却短的熔断器"""
+    breaker = main.CircuitBreaker(failure_threshold=threshold, reset_timeout=reset_timeout)
+    client._breakers[fake_upstream.base_url.split("://", 1)[1]] = breaker
+    return breaker
+
+
+def test_keep_alive_connections_are_reused(client, fake_upstream):
+    fake_upstream.routes["/ping"] = lambda req: (200, {"ok": True})
+    for _ in range(5):
+        assert client.request_json("detail", "/ping") == {"ok": True}
+    assert len({req.client for req in fake_upstream.requests}) == 1
+
+
+def test_concurrent_identical_requests_are_coalesced(client, fake_upstream):
+    release = threading.Event()
+
+    def slow(req):
+        release.wait(5)
+        return 200, {"id": req.query["id"]}
+    fake_upstream.routes["/slow"] = slow
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.request_json("detail", "/slow", params={"id": 7})))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 2
+    while client.counters["coalesced"] < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == [{"id": "7"}] * 5
+    assert fake_upstream.count("/slow") == 1
+    assert client.counters["coalesced"] == 4
+
+
+def test_successful_responses_are_cached_for_ttl(client, fake_upstream):
+    fake_upstream.routes["/detail"] = lambda req: (200, {"songs": [1]})
+    for _ in range(3):
+        assert client.request_json("detail", "/detail", cache_ttl=0.3) == {"songs": [1]}
+    assert fake_upstream.count("/detail") == 1
+    assert client.counters["cache_hits"] == 2
+
+    time.sleep(0.35)
+    client.request_json("detail", "/detail", cache_ttl=0.3)
+    assert fake_upstream.count("/detail") == 2
+
+
+def test_empty_results_are_negatively_cached(client, fake_upstream):
+    fake_upstream.routes["/search"] = lambda req: (200, {"result": {}})
+    validate = lambda data: bool(data.get("result", {}).get("songs"))
+    for _ in range(3):
+        assert client.request_json("search", "/search", cache_ttl=60, negative_ttl=60, validate=validate) is None
+    assert fake_upstream.count("/search") == 1
+    assert client.counters["negative_hits"] == 2
+
+    # 不给 negative_ttl 时不缓存
+    client.request_json("search", "/search", params={"s": "x"}, validate=validate)
+    client.request_json("search", "/search", params={"s": "x"}, validate=validate)
+    assert fake_upstream.count("/search") == 3
+
+
+def test_breaker_opens_half_opens_and_closes(main, client, fake_upstream):
+    breaker = open_breaker(main, client, fake_upstream)
+    healthy = {"value": False}
+    fake_upstream.routes["/flaky"] = lambda req: (200, {"ok": True}) if healthy["value"] else (502, {"code": 502})
+
+    for _ in range(2):
+        with pytest.raises(main.UpstreamError):
+            client.request_json("detail", "/flaky")
+    assert breaker.snapshot()["state"] == "open"
+
+    # 打开期间快速失败，不再请求上游
+    with pytest.raises(main.CircuitOpenError):
+        client.request_json("detail", "/flaky")
+    assert fake_upstream.count("/flaky") == 2
+    assert client.counters["short_circuited"] == 1
+
+    # 冷却后放行一个试探请求；试探失败立即重新打开
+    time.sleep(0.25)
+    with pytest.raises(main.UpstreamError) as failed_probe:
+        client.request_json("detail", "/flaky")
+    assert not isinstance(failed_probe.value, main.CircuitOpenError)
+    assert breaker.snapshot()["state"] == "open"
+    assert fake_upstream.count("/flaky") == 3
+
+    # 再次冷却后试探成功，熔断器关闭
+    healthy["value"] = True
+    time.sleep(0.25)
+    assert client.request_json("detail", "/flaky") == {"ok": True}
+    assert breaker.snapshot() == {"state": "closed", "failures": 0}
+
+
+def test_probe_blocked_by_endpoint_limit_does_not_wedge_half_open(main, client, fake_upstream):
+    breaker = open_breaker(main, client, fake_upstream, threshold=1, reset_timeout=0.1)
+    fake_upstream.routes["/lyric"] = lambda req: (502, {"code": 502})
+    with pytest.raises(main.UpstreamError):
+        client.request_json("lyric", "/lyric")
+    assert breaker.snapshot()["state"] == "open"
+
+    # 冷却结束时端点并发已被占满：等不到名额的请求不能把熔断器留在 half_open
+    time.sleep(0.15)
+    sem = client._semaphore("lyric")
+    held = 0
+    while sem.acquire(blocking=False):
+        held += 1
+    try:
+        with pytest.raises(main.UpstreamError, match="并发已满"):
+            client.request_json("lyric", "/lyric", timeout=0.1)
+        assert breaker.snapshot()["state"] == "open"
+    finally:
+        for _ in range(held):
+            sem.release()
+
+    fake_upstream.routes["/lyric"] = lambda req: (200, {"code": 200})
+    assert client.request_json("lyric", "/lyric") == {"code": 200}
+    assert breaker.snapshot()["state"] == "closed"